@@ -1,45 +1,99 @@
 # app.py
-from flask import Flask, jsonify, request # 1. Agregamos jsonify
+from flask import Flask, jsonify, request, g, Response # 1. Agregamos jsonify
 from flask_cors import CORS
 import openai
 import os
+import time
 from dotenv import load_dotenv
-from src import config # 2. IMPORTACIÓN CRUCIAL: Traemos el interruptor
+from src import cache, catalogo, claves, concurrencia, config, metricas, llm_gateway, trabajos
 
 # 1. CARGAR VARIABLES DE ENTORNO PRIMERO
 load_dotenv()
 
 # 2. CONFIGURAR OPENAI PARA GROQ
-api_key = os.getenv("KEY03")
-if not api_key:
-    print("❌ ERROR: KEY03 no encontrada en .env")
+# (KEY03 o el pool LLM_CLAVES; cada llamada elige su clave en llm_gateway)
+if not config.LLM_CLAVES:
+    print("❌ ERROR: KEY03 (o LLM_CLAVES) no encontrada en .env")
     exit(1)
 
-openai.api_key = api_key
-openai.api_base = "https://api.groq.com/openai/v1"
-print(f"✅ OpenAI configurado. Base URL: {openai.api_base}")
+openai.api_key = config.LLM_CLAVES[0]
+openai.api_base = config.LLM_API_BASE
+print(f"✅ OpenAI configurado. Base URL: {openai.api_base} ({len(claves.POOL)} clave(s) en el pool)")
+
+# Precargamos perfiles y modelos pedagógicos antes de atender peticiones
+catalogo.obtener()
+# Trabajos que quedaron a medias en un worker que ya no existe
+trabajos.recuperar_huerfanos()
 
 # 3. INICIAR FLASK
 app = Flask(__name__)
 CORS(app)
 
+@app.before_request
+def iniciar_cronometro():
+    g.inicio_peticion = time.perf_counter()
+
+@app.after_request
+def registrar_peticion(respuesta):
+    # Métrica por plantilla de ruta (no por URL) para no disparar la cardinalidad
+    ruta = request.url_rule.rule if request.url_rule else "desconocida"
+    if ruta != "/metrics":
+        metricas.incrementar("http_peticiones_total", ruta=ruta, metodo=request.method, codigo=respuesta.status_code)
+        metricas.observar("http_peticion_segundos", time.perf_counter() - g.get("inicio_peticion", time.perf_counter()), ruta=ruta)
+    return respuesta
+
 # 4. IMPORTAR RUTAS
-from src.routes import evaluar_apartado_route, analizar_taller_completo_route
+from src.routes import evaluar_apartado_route, evaluar_apartado_stream_route, analizar_taller_completo_route, trabajo_route, cancelar_route
+from src.routes import evaluacion_route, reanudar_route
+from src.routes import evaluar_apartado_async_route, analizar_taller_completo_async_route, evaluar_taller_route
+from src.routes import analizar_taller_completo_stream_route, evaluar_taller_stream_route
 
 # Registrar rutas
-@app.route('/evaluar_apartado', methods=['POST'])
-def evaluar_wrapper():
-    config.evaluacion_activa = True # 3. Encendemos el interruptor al iniciar cada evaluación
-    return evaluar_apartado_route()
+app.route('/evaluar_apartado', methods=['POST'])(evaluar_apartado_route)
+app.route('/evaluar_apartado/stream', methods=['POST'])(evaluar_apartado_stream_route)
 
 app.route('/analizar_taller_completo', methods=['POST'])(analizar_taller_completo_route)
+app.route('/analizar_taller_completo/stream', methods=['POST'])(analizar_taller_completo_stream_route)
+app.route('/jobs/<id_trabajo>', methods=['GET'])(trabajo_route)
+app.route('/evaluaciones/<id_evaluacion>', methods=['GET'])(evaluacion_route)
+app.route('/evaluaciones/<id_evaluacion>/reanudar', methods=['POST'])(reanudar_route)
+
+# Misma evaluación, pero con llamadas LLM async sobre un pool de conexiones keep-alive
+app.route('/async/evaluar_apartado', methods=['POST'])(evaluar_apartado_async_route)
+app.route('/async/analizar_taller_completo', methods=['POST'])(analizar_taller_completo_async_route)
+
+# Taller completo en una sola petición: todos los apartados en paralelo + análisis integrado
+app.route('/evaluar_taller', methods=['POST'])(evaluar_taller_route)
+app.route('/evaluar_taller/stream', methods=['POST'])(evaluar_taller_stream_route)
+
+# Cancelación por evaluación: ya no hay un interruptor global por worker
+app.route('/cancelar', methods=['POST'])(cancelar_route)
+
+@app.route('/cache/estadisticas', methods=['GET'])
+def cache_estadisticas():
+    return jsonify(cache.estadisticas()), 200
+
+@app.route('/concurrencia', methods=['GET'])
+def concurrencia_estado():
+    """Límite AIMD de llamadas LLM en vuelo de este worker y sus últimas decisiones"""
+    return jsonify(concurrencia.estado())
 
-@app.route('/cancelar', methods=['POST'])
-def cancelar():
-    # Ahora 'config' sí está definido gracias al import de arriba
-    config.evaluacion_activa = False 
-    print("\n🛑 FRENO DE MANO: Deteniendo evaluación en el próximo indicador...")
-    return jsonify({"status": "success", "message": "Señal de detención enviada"}), 200
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    circuito = llm_gateway.estado_circuito()
+    extras = [
+        ("llm_circuito_abierto", "1 si el circuit breaker del proveedor está abierto", int(circuito["abierto"])),
+        ("llm_circuito_fallos_consecutivos", "Fallos transitorios seguidos del proveedor", circuito["fallos_consecutivos"]),
+    ]
+    for clave in claves.estado():
+        extras.append(("llm_clave_en_pausa", "1 si la clave está fuera de rotación tras un 429",
+                       int(clave["en_pausa"]), {"clave": clave["nombre"]}))
+        extras.append(("llm_clave_cupo_restante", "Fracción del cupo RPM/TPM libre de la clave",
+                       clave["cupo_restante"], {"clave": clave["nombre"]}))
+    control = concurrencia.estado()
+    extras.append(("llm_concurrencia_limite", "Llamadas LLM en vuelo permitidas ahora en este worker (AIMD)", control["limite"]))
+    extras.append(("llm_concurrencia_en_vuelo", "Llamadas LLM en vuelo en este worker", control["en_vuelo"]))
+    return Response(metricas.exponer(extras), mimetype="text/plain; version=0.0.4")
 
 # ... (Tus rutas de index y health check igual)
 
@@ -0,0 +1,276 @@
+"""
+Benchmark de extremo a extremo de /evaluar_apartado, /analizar_taller_completo y /evaluar_taller
+contra el mock local de Groq (herramientas/mock_groq.py), sin gastar cupo real.
+
+Uso:
+    python -m herramientas.benchmark                       # corre y compara con la línea base
+    python -m herramientas.benchmark --guardar-baseline    # actualiza la línea base
+    python -m herramientas.benchmark --concurrencias 1,8 --repeticiones 16 --salida bench.json
+
+Por escenario y nivel de concurrencia reporta latencia p50/p95/p99,
+llamadas al LLM y tokens por petición y throughput. Sale con código 1 si
+las llamadas o la latencia superan la línea base guardada.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import make_server
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(DIRECTORIO, "benchmark_fixtures.json")
+BASELINE = os.path.join(DIRECTORIO, "benchmark_baseline.json")
+
+
+# --- ENTORNO ---
+
+def arrancar_mock(latencia_ms):
+    """Levanta el mock en un puerto libre, en un hilo del propio proceso"""
+    from herramientas.mock_groq import EstadoMock, CONFIG_POR_DEFECTO, crear_app
+    config = dict(CONFIG_POR_DEFECTO, latencia_distribucion="fija", latencia_media_ms=latencia_ms, semilla=1)
+    estado = EstadoMock(config)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    servidor = make_server("127.0.0.1", 0, crear_app(estado), threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, estado
+
+
+def preparar_entorno(puerto, args):
+    """Debe llamarse antes de importar app: src.config lee el entorno al importarse"""
+    os.environ["LLM_API_BASE"] = f"http://127.0.0.1:{puerto}/openai/v1"
+    os.environ.setdefault("KEY03", "benchmark")
+    os.environ["ESTADO_DIR"] = tempfile.mkdtemp(prefix="benchmark_estado_")
+    os.environ["CACHE_ACTIVA"] = "1" if args.con_cache else "0"
+    os.environ["GROQ_LIMITE_RPM"] = str(args.limite_rpm)
+    os.environ["GROQ_LIMITE_TPM"] = str(args.limite_tpm)
+    os.environ["EVALUACION_EN_LOTE"] = "1" if args.modo_lote else "0"
+
+
+# --- ESCENARIOS ---
+
+def _apartado(nombre, contenido, poblacion, rango):
+    return {"apartado": {"Apartado": nombre, "Contenido": contenido}, "poblacion": poblacion, "rango_edad": rango}
+
+
+def escenarios(fixtures):
+    """
+    Cada escenario es una función (cliente, prefijo, variante) -> bool que
+    ejecuta una petición completa. 'variante' cambia el texto para que ningún
+    resultado se reutilice entre repeticiones.
+    """
+    lista = {}
+    for poblacion, taller in fixtures["talleres"].items():
+        rango = taller["rango_edad"]
+
+        def objetivo(cliente, prefijo, variante, taller=taller, poblacion=poblacion, rango=rango):
+            r = cliente.post(f"{prefijo}/evaluar_apartado", json=_apartado(
+                "Objetivo General", f"{taller['objetivo']} Versión {variante}.", poblacion, rango))
+            return r.status_code == 200 and bool(r.get_json().get("evaluaciones"))
+
+        def actividad(cliente, prefijo, variante, taller=taller, poblacion=poblacion, rango=rango):
+            r = cliente.post(f"{prefijo}/evaluar_apartado", json=_apartado(
+                "Actividad 1", f"{taller['actividades'][0]} Versión {variante}.", poblacion, rango))
+            return r.status_code == 200 and bool(r.get_json().get("evaluaciones"))
+
+        def introduccion(cliente, prefijo, variante, taller=taller, poblacion=poblacion, rango=rango):
+            r = cliente.post(f"{prefijo}/evaluar_apartado", json=_apartado(
+                "Introducción", f"{taller['introduccion']} Versión {variante}.", poblacion, rango))
+            return r.status_code == 200 and r.get_json().get("es_valido") is True
+
+        def taller_completo(cliente, prefijo, variante, taller=taller, poblacion=poblacion, rango=rango):
+            evaluaciones = {}
+            r = cliente.post(f"{prefijo}/evaluar_apartado", json=_apartado(
+                "Introducción", f"{taller['introduccion']} Versión {variante}.", poblacion, rango))
+            evaluaciones["introduccion"] = r.get_json()
+            r = cliente.post(f"{prefijo}/evaluar_apartado", json=_apartado(
+                "Objetivo General", f"{taller['objetivo']} Versión {variante}.", poblacion, rango))
+            evaluaciones["objetivo"] = r.get_json()
+            evaluaciones["actividades"] = []
+            for i, texto in enumerate(taller["actividades"], 1):
+                r = cliente.post(f"{prefijo}/evaluar_apartado", json=_apartado(
+                    f"Actividad {i}", f"{texto} Versión {variante}.", poblacion, rango))
+                evaluaciones["actividades"].append(r.get_json())
+            r = cliente.post(f"{prefijo}/analizar_taller_completo",
+                             json={"evaluaciones": evaluaciones, "rango_edad": rango})
+            return r.status_code == 200 and "error" not in r.get_json()
+
+        def taller_unico(cliente, prefijo, variante, taller=taller, poblacion=poblacion, rango=rango):
+            r = cliente.post("/evaluar_taller", json={
+                "taller": {
+                    "introduccion": f"{taller['introduccion']} Versión {variante}.",
+                    "objetivo": f"{taller['objetivo']} Versión {variante}.",
+                    "actividades": [f"{texto} Versión {variante}." for texto in taller["actividades"]],
+                },
+                "poblacion": poblacion, "rango_edad": rango})
+            return r.status_code == 200 and "error" not in r.get_json().get("analisis_integrado", {"error": 1})
+
+        lista[f"objetivo_{poblacion}"] = objetivo
+        lista[f"actividad_{poblacion}"] = actividad
+        lista[f"introduccion_{poblacion}"] = introduccion
+        lista[f"taller_{poblacion}"] = taller_completo
+        lista[f"taller_unico_{poblacion}"] = taller_unico
+    return lista
+
+
+# --- MEDICIÓN ---
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = (len(ordenados) - 1) * p / 100.0
+    inferior = int(k)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (k - inferior)
+
+
+def medir(app, estado_mock, escenario, prefijo, concurrencia, repeticiones, desplazamiento):
+    estado_mock.reiniciar_contadores()
+    latencias = []
+    fallos = 0
+    lock = threading.Lock()
+
+    def una(i):
+        nonlocal fallos
+        cliente = app.test_client()
+        inicio = time.perf_counter()
+        try:
+            ok = escenario(cliente, prefijo, desplazamiento + i)
+        except Exception:
+            ok = False
+        duracion = time.perf_counter() - inicio
+        with lock:
+            latencias.append(duracion * 1000)
+            if not ok:
+                fallos += 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(una, range(repeticiones)))
+    total = time.perf_counter() - inicio
+
+    c = estado_mock.contadores
+    return {
+        "peticiones": repeticiones,
+        "fallos": fallos,
+        "p50_ms": round(percentil(latencias, 50), 1),
+        "p95_ms": round(percentil(latencias, 95), 1),
+        "p99_ms": round(percentil(latencias, 99), 1),
+        "throughput_rps": round(repeticiones / total, 2) if total else 0.0,
+        "llamadas_por_peticion": round(c["llamadas"] / repeticiones, 2),
+        "prompt_tokens_por_peticion": round(c["prompt_tokens"] / repeticiones, 1),
+        "completion_tokens_por_peticion": round(c["completion_tokens"] / repeticiones, 1),
+        "llamadas_por_tipo": dict(c["por_tipo"]),
+    }
+
+
+# --- LÍNEA BASE ---
+
+def comparar(resultados, baseline, tolerancia_llamadas, tolerancia_latencia):
+    """Devuelve la lista de regresiones respecto a la línea base"""
+    regresiones = []
+    for nombre, niveles in baseline.get("escenarios", {}).items():
+        for nivel, base in niveles.items():
+            actual = resultados["escenarios"].get(nombre, {}).get(nivel)
+            if not actual:
+                continue
+            limite_llamadas = base["llamadas_por_peticion"] * (1 + tolerancia_llamadas)
+            if actual["llamadas_por_peticion"] > limite_llamadas + 1e-9:
+                regresiones.append(f"{nombre} (c={nivel}): llamadas/petición {actual['llamadas_por_peticion']} > {base['llamadas_por_peticion']}")
+            limite_p95 = base["p95_ms"] * (1 + tolerancia_latencia)
+            if actual["p95_ms"] > limite_p95:
+                regresiones.append(f"{nombre} (c={nivel}): p95 {actual['p95_ms']} ms > {base['p95_ms']} ms (+{tolerancia_latencia:.0%})")
+            if actual["fallos"] > base.get("fallos", 0):
+                regresiones.append(f"{nombre} (c={nivel}): {actual['fallos']} peticiones fallidas")
+    return regresiones
+
+
+def imprimir_tabla(resultados):
+    print(f"{'escenario':<22}{'c':>4}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>8}{'llam/p':>8}{'tok_in/p':>10}{'tok_out/p':>10}{'fallos':>7}")
+    for nombre, niveles in resultados["escenarios"].items():
+        for nivel, r in niveles.items():
+            print(f"{nombre:<22}{nivel:>4}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['throughput_rps']:>8}"
+                  f"{r['llamadas_por_peticion']:>8}{r['prompt_tokens_por_peticion']:>10}{r['completion_tokens_por_peticion']:>10}{r['fallos']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de evaluación contra el mock de Groq")
+    parser.add_argument("--concurrencias", default="1,4,16")
+    parser.add_argument("--repeticiones", type=int, default=8)
+    parser.add_argument("--escenarios", default="", help="Lista separada por comas (por defecto todos)")
+    parser.add_argument("--latencia-ms", type=float, default=50.0, help="Latencia fija del mock por llamada")
+    parser.add_argument("--async", dest="ruta_async", action="store_true", help="Usa las rutas /async/...")
+    parser.add_argument("--modo-lote", action="store_true")
+    parser.add_argument("--con-cache", action="store_true")
+    parser.add_argument("--limite-rpm", type=int, default=100000)
+    parser.add_argument("--limite-tpm", type=int, default=100000000)
+    parser.add_argument("--salida", default="", help="Ruta del JSON de resultados")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--guardar-baseline", action="store_true")
+    parser.add_argument("--tolerancia-llamadas", type=float, default=0.0)
+    parser.add_argument("--tolerancia-latencia", type=float, default=0.5)
+    parser.add_argument("--verboso", action="store_true", help="Muestra los logs del backend")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(DIRECTORIO))
+    servidor, estado_mock = arrancar_mock(args.latencia_ms)
+    preparar_entorno(servidor.server_port, args)
+
+    silencio = contextlib.nullcontext() if args.verboso else contextlib.redirect_stdout(io.StringIO())
+    with open(FIXTURES, encoding="utf-8") as f:
+        todos = escenarios(json.load(f))
+    elegidos = [e for e in args.escenarios.split(",") if e] or list(todos)
+    concurrencias = [int(c) for c in args.concurrencias.split(",") if c]
+    prefijo = "/async" if args.ruta_async else ""
+
+    resultados = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("salida", "baseline", "guardar_baseline", "verboso")},
+        "escenarios": {},
+    }
+    with silencio:
+        from app import app
+        desplazamiento = 0
+        for nombre in elegidos:
+            resultados["escenarios"][nombre] = {}
+            for concurrencia in concurrencias:
+                resultados["escenarios"][nombre][str(concurrencia)] = medir(
+                    app, estado_mock, todos[nombre], prefijo, concurrencia, args.repeticiones, desplazamiento)
+                desplazamiento += args.repeticiones
+    servidor.shutdown()
+
+    imprimir_tabla(resultados)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Resultados guardados en {args.salida}")
+
+    if args.guardar_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+        print(f"💾 Línea base actualizada: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("⚠️ No hay línea base guardada; usa --guardar-baseline para crearla.")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        regresiones = comparar(resultados, json.load(f), args.tolerancia_llamadas, args.tolerancia_latencia)
+    if regresiones:
+        print("\n❌ Regresiones respecto a la línea base:")
+        for r in regresiones:
+            print(f"   - {r}")
+        return 1
+    print("\n✅ Sin regresiones respecto a la línea base.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+"""
+Servidor local que imita el endpoint chat/completions de Groq (API
+compatible con OpenAI) para medir el pipeline sin gastar cupo real.
+
+Uso:
+    python -m herramientas.mock_groq --puerto 8001 --latencia-media-ms 400
+    LLM_API_BASE=http://127.0.0.1:8001/openai/v1 gunicorn app:app
+
+Responde JSON válido para cada tipo de prompt del backend (indicador,
+lote de indicadores, introducción, feedback global e informe final), con o
+sin streaming (stream=true), y permite inyectar latencia, errores 429/500
+y respuestas malformadas.
+La configuración se puede cambiar en caliente con POST /mock/config.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from flask import Flask, Response, jsonify, request
+
+CONFIG_POR_DEFECTO = {
+    "latencia_distribucion": "lognormal",  # fija | normal | lognormal | exponencial
+    "latencia_media_ms": 400.0,
+    "latencia_desviacion_ms": 150.0,
+    "ms_por_token": 0.0,                   # tiempo extra por token generado
+    "prob_429": 0.0,
+    "prob_500": 0.0,
+    "prob_malformado": 0.0,
+    "retry_after": 1.0,
+    "rpm_por_clave": 0.0,                  # 429 si una API key supera estas peticiones/minuto (0 = sin límite)
+    "semilla": None,
+}
+
+CAMPOS_ANALISIS = {
+    "objetivo": ["evidencia_pedagogica", "justificacion_edad", "razonamiento_nivel"],
+    "actividad": ["ejecucion_indicador", "adecuacion_cognitiva"],
+}
+
+
+def _config_desde_entorno():
+    config = dict(CONFIG_POR_DEFECTO)
+    for clave, valor in CONFIG_POR_DEFECTO.items():
+        crudo = os.getenv(f"MOCK_{clave.upper()}")
+        if crudo is None:
+            continue
+        config[clave] = crudo if isinstance(valor, str) else float(crudo)
+    return config
+
+
+class EstadoMock:
+    def __init__(self, config=None):
+        self.lock = threading.Lock()
+        self.config = config or _config_desde_entorno()
+        self.azar = random.Random(self.config.get("semilla"))
+        self.reiniciar_contadores()
+
+    def reiniciar_contadores(self):
+        with self.lock:
+            self.contadores = {"llamadas": 0, "por_tipo": {}, "por_clave": {}, "errores_429": 0, "errores_500": 0,
+                               "malformadas": 0, "prompt_tokens": 0, "completion_tokens": 0}
+            self.ventanas = {}
+
+    def actualizar(self, cambios):
+        with self.lock:
+            for clave, valor in cambios.items():
+                if clave in CONFIG_POR_DEFECTO:
+                    self.config[clave] = valor
+            if "semilla" in cambios:
+                self.azar = random.Random(cambios["semilla"])
+            return dict(self.config)
+
+    def sortear(self, probabilidad):
+        with self.lock:
+            return self.azar.random() < float(probabilidad or 0)
+
+    def excede_rpm(self, clave):
+        """Ventana deslizante de 60 s por API key, como el límite real del proveedor"""
+        limite = float(self.config.get("rpm_por_clave") or 0)
+        ahora = time.monotonic()
+        with self.lock:
+            self.contadores["por_clave"][clave] = self.contadores["por_clave"].get(clave, 0) + 1
+            if not limite:
+                return False
+            ventana = [t for t in self.ventanas.get(clave, []) if ahora - t < 60]
+            excede = len(ventana) >= limite
+            if not excede:
+                ventana.append(ahora)
+            self.ventanas[clave] = ventana
+            return excede
+
+    def latencia(self):
+        c = self.config
+        media = float(c["latencia_media_ms"]) / 1000.0
+        desviacion = float(c["latencia_desviacion_ms"]) / 1000.0
+        with self.lock:
+            distribucion = c["latencia_distribucion"]
+            if distribucion == "fija" or media <= 0:
+                return max(0.0, media)
+            if distribucion == "normal":
+                return max(0.0, self.azar.gauss(media, desviacion))
+            if distribucion == "exponencial":
+                return self.azar.expovariate(1.0 / media)
+            # lognormal con la media y desviación pedidas
+            sigma = math.sqrt(math.log1p((desviacion / media) ** 2))
+            mu = math.log(media) - sigma ** 2 / 2
+            return self.azar.lognormvariate(mu, sigma)
+
+
+# --- CLASIFICACIÓN DE PROMPTS Y RESPUESTAS ---
+
+MARCA_REPARACION = "Responde ÚNICAMENTE con un JSON que contenga solo esos campos"
+
+
+def tipo_de_prompt(texto):
+    if MARCA_REPARACION in texto:
+        return "reparacion"
+    if "analisis_final" in texto:
+        return "informe"
+    if "comentario_general" in texto:
+        return "feedback"
+    if '"evaluaciones": [' in texto:
+        return "lote"
+    if "frases_discurso" in texto:
+        return "introduccion"
+    return "indicador"
+
+
+def _calificacion(texto, semilla):
+    """Nota estable para el mismo prompt: las ejecuciones son comparables"""
+    digest = hashlib.sha256(f"{semilla}:{texto}".encode("utf-8")).digest()
+    return digest[0] % 5 + 1
+
+
+def _analisis(texto):
+    campos = CAMPOS_ANALISIS["actividad" if "ejecucion_indicador" in texto else "objetivo"]
+    return {campo: f"Respuesta simulada para {campo}." for campo in campos}
+
+
+def _rellenar(plantilla):
+    """Respuesta a una reparación: la plantilla pedida con valores simulados"""
+    if isinstance(plantilla, dict):
+        return {k: (3 if k == "calificacion" else _rellenar(v)) for k, v in plantilla.items()}
+    if isinstance(plantilla, list):
+        return [_rellenar(v) for v in plantilla]
+    return "Campo reparado (simulado)."
+
+
+def contenido_respuesta(tipo, texto, semilla=None):
+    if tipo == "reparacion":
+        formato = texto[texto.rfind(MARCA_REPARACION):].split("formato: ", 1)[-1]
+        try:
+            return _rellenar(json.loads(formato))
+        except ValueError:
+            return {}
+    if tipo == "informe":
+        return {
+            "analisis_final": {
+                "sintesis_ejecutiva": "Síntesis simulada del taller.",
+                "diagnostico_coherencia": "Diagnóstico simulado de coherencia objetivo-actividad.",
+                "ruta_de_accion": [{"estrategia": "Estrategia simulada", "fundamentacion": "Fundamentación simulada"}],
+            },
+            "metricas_consolidadas": {"promedio": 3.0, "estado": "Simulado"},
+        }
+    if tipo == "feedback":
+        return {"comentario_general": "Comentario simulado.\n\nSegundo párrafo simulado."}
+    if tipo == "introduccion":
+        return {"es_valido": True, "analisis_disciplinar": "Valoración simulada.",
+                "frases_discurso": ["Frase simulada 1", "Frase simulada 2", "Frase simulada 3"]}
+    if tipo == "lote":
+        nombres = re.findall(r'INDICADOR "([^"]+)"', texto)
+        return {"evaluaciones": [
+            {"indicador": n, "calificacion": _calificacion(texto + n, semilla), "analisis": _analisis(texto)}
+            for n in nombres
+        ]}
+    return {"calificacion": _calificacion(texto, semilla), "analisis": _analisis(texto)}
+
+
+def _contar_tokens(texto):
+    return max(1, len(texto) // 4)
+
+
+CARACTERES_POR_FRAGMENTO = 16
+
+
+def _fragmento(id_respuesta, modelo, delta, fin=None, **extra):
+    return "data: " + json.dumps(dict({
+        "id": id_respuesta,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": modelo,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": fin}],
+    }, **extra), ensure_ascii=False) + "\n\n"
+
+
+def respuesta_en_stream(contenido, modelo, usage, espera_inicial, segundos_por_token):
+    """SSE como el de Groq: primer fragmento tras la latencia, el resto al ritmo de ms_por_token"""
+    id_respuesta = f"chatcmpl-mock-{time.time_ns()}"
+
+    def generar():
+        time.sleep(espera_inicial)
+        yield _fragmento(id_respuesta, modelo, {"role": "assistant", "content": ""})
+        for i in range(0, len(contenido), CARACTERES_POR_FRAGMENTO):
+            trozo = contenido[i:i + CARACTERES_POR_FRAGMENTO]
+            if segundos_por_token:
+                time.sleep(_contar_tokens(trozo) * segundos_por_token)
+            yield _fragmento(id_respuesta, modelo, {"content": trozo})
+        yield _fragmento(id_respuesta, modelo, {}, "stop", x_groq={"id": id_respuesta, "usage": usage})
+        yield "data: [DONE]\n\n"
+
+    return Response(generar(), mimetype="text/event-stream")
+
+
+# --- APLICACIÓN ---
+
+def crear_app(estado=None):
+    estado = estado or EstadoMock()
+    app = Flask(__name__)
+
+    def error(estado_http, mensaje, tipo, cabeceras=None):
+        respuesta = jsonify({"error": {"message": mensaje, "type": tipo, "code": estado_http}})
+        respuesta.status_code = estado_http
+        for k, v in (cabeceras or {}).items():
+            respuesta.headers[k] = v
+        return respuesta
+
+    @app.route("/openai/v1/chat/completions", methods=["POST"])
+    @app.route("/v1/chat/completions", methods=["POST"])
+    def chat_completions():
+        cuerpo = request.get_json(force=True, silent=True) or {}
+        if cuerpo.get("stream") and (cuerpo.get("response_format") or {}).get("type") == "json_object":
+            # Igual que Groq: el modo JSON no se puede combinar con streaming
+            return error(400, "response_format json_object is not supported with stream", "invalid_request_error")
+        mensajes = cuerpo.get("messages", [])
+        texto = "\n".join(m.get("content") or "" for m in mensajes)
+        tipo = tipo_de_prompt(texto)
+        c = estado.config
+
+        with estado.lock:
+            estado.contadores["llamadas"] += 1
+            estado.contadores["por_tipo"][tipo] = estado.contadores["por_tipo"].get(tipo, 0) + 1
+
+        clave = request.headers.get("Authorization", "").replace("Bearer ", "")[-6:] or "sin_clave"
+        if estado.excede_rpm(clave) or estado.sortear(c["prob_429"]):
+            with estado.lock:
+                estado.contadores["errores_429"] += 1
+            return error(429, "Rate limit reached (simulado)", "rate_limit_exceeded",
+                         {"Retry-After": str(c["retry_after"])})
+        if estado.sortear(c["prob_500"]):
+            with estado.lock:
+                estado.contadores["errores_500"] += 1
+            return error(500, "Internal server error (simulado)", "server_error")
+
+        contenido = json.dumps(contenido_respuesta(tipo, texto, c.get("semilla")), ensure_ascii=False)
+        if estado.sortear(c["prob_malformado"]):
+            with estado.lock:
+                estado.contadores["malformadas"] += 1
+            contenido = contenido[: len(contenido) // 2]
+
+        prompt_tokens = _contar_tokens(texto)
+        completion_tokens = _contar_tokens(contenido)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        with estado.lock:
+            estado.contadores["prompt_tokens"] += prompt_tokens
+            estado.contadores["completion_tokens"] += completion_tokens
+
+        if cuerpo.get("stream"):
+            return respuesta_en_stream(contenido, cuerpo.get("model", "mock"), usage,
+                                       estado.latencia(), float(c["ms_por_token"]) / 1000.0)
+
+        time.sleep(estado.latencia() + completion_tokens * float(c["ms_por_token"]) / 1000.0)
+
+        return jsonify({
+            "id": f"chatcmpl-mock-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": cuerpo.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": contenido}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    @app.route("/mock/config", methods=["GET", "POST"])
+    def mock_config():
+        if request.method == "POST":
+            return jsonify(estado.actualizar(request.get_json(force=True, silent=True) or {}))
+        return jsonify(estado.config)
+
+    @app.route("/mock/estadisticas", methods=["GET"])
+    def mock_estadisticas():
+        with estado.lock:
+            return jsonify(estado.contadores)
+
+    @app.route("/mock/reset", methods=["POST"])
+    def mock_reset():
+        estado.reiniciar_contadores()
+        return jsonify({"status": "success"})
+
+    app.estado_mock = estado
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock local de Groq/OpenAI chat completions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=int(os.getenv("MOCK_PUERTO", "8001")))
+    for clave, valor in CONFIG_POR_DEFECTO.items():
+        tipo = str if isinstance(valor, str) else float
+        parser.add_argument(f"--{clave.replace('_', '-')}", type=tipo, default=None)
+    args = parser.parse_args()
+
+    config = _config_desde_entorno()
+    for clave in CONFIG_POR_DEFECTO:
+        valor = getattr(args, clave)
+        if valor is not None:
+            config[clave] = valor
+
+    print(f"✅ Mock de Groq escuchando en http://{args.host}:{args.puerto}/openai/v1")
+    crear_app(EstadoMock(config)).run(host=args.host, port=args.puerto, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sqlite3
+import threading
+from src import config
+
+# Una conexión por hilo y por proceso (gunicorn hace fork de los workers)
+_local = threading.local()
+
+
+def conectar(nombre):
+    """
+    Devuelve una conexión SQLite al archivo <ESTADO_DIR>/<nombre>.db,
+    compartido por todos los workers. Usa WAL para que lecturas y escrituras
+    de distintos procesos no se bloqueen entre sí.
+    """
+    conexiones = getattr(_local, "conexiones", None)
+    if conexiones is None or getattr(_local, "pid", None) != os.getpid():
+        conexiones = _local.conexiones = {}
+        _local.pid = os.getpid()
+
+    conn = conexiones.get(nombre)
+    if conn is None:
+        os.makedirs(config.ESTADO_DIR, exist_ok=True)
+        path = os.path.join(config.ESTADO_DIR, f"{nombre}.db")
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conexiones[nombre] = conn
+    return conn
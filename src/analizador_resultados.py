@@ -1,18 +1,35 @@
 import json
-import openai
-import time  # <--- CRUCIAL para las esperas
+from src import consolidado, esquemas, json_parcial, llm_gateway, metricas
 
 
 
-def analizar_resultados_taller(resultados, perfil_edad="No especificado"):
+def analizar_resultados_taller(resultados, perfil_edad="No especificado", cancelacion=None, al_texto=None,
+                               solo_metricas=False):
     """
-    Ahora recibe 'perfil_edad' desde la ruta.
+    Ahora recibe 'perfil_edad' desde la ruta. Con al_texto, las secciones
+    narrativas del informe llegan en streaming mientras se generan. Con
+    solo_metricas devuelve las métricas consolidadas sin llamar a la IA.
     """
     datos_extraidos = extraer_datos_resultados(resultados)
     
+    if datos_extraidos['tiene_datos_suficientes'] and solo_metricas:
+        return informe_numerico(datos_extraidos)
     if datos_extraidos['tiene_datos_suficientes']:
         # PASAMOS el perfil_edad a la siguiente función
-        return generar_sintesis_final(datos_extraidos, perfil_edad)
+        return generar_sintesis_final(datos_extraidos, perfil_edad, cancelacion=cancelacion, al_texto=al_texto)
+    else:
+        return {"error": "Datos insuficientes para análisis integrado"}
+
+async def analizar_resultados_taller_async(resultados, perfil_edad="No especificado", cancelacion=None, al_texto=None,
+                                           solo_metricas=False):
+    """Versión async de analizar_resultados_taller"""
+    datos_extraidos = extraer_datos_resultados(resultados)
+
+    if datos_extraidos['tiene_datos_suficientes'] and solo_metricas:
+        return informe_numerico(datos_extraidos)
+    if datos_extraidos['tiene_datos_suficientes']:
+        return await generar_sintesis_final_async(datos_extraidos, perfil_edad, cancelacion=cancelacion,
+                                                  al_texto=al_texto)
     else:
         return {"error": "Datos insuficientes para análisis integrado"}
 
@@ -54,7 +71,7 @@ def extraer_datos_resultados(resultados):
             datos['objetivo'] = {
                 "texto": obj.get('apartado', 'Objetivo'),
                 "promedio": obj.get('estadisticas', {}).get('promedio', 0),
-                "evaluaciones": obj.get('evaluaciones', [])[:3]
+                "evaluaciones": obj.get('evaluaciones', [])
             }
             print(f"✅ Objetivo procesado. Nota: {datos['objetivo']['promedio']}")
     
@@ -68,11 +85,19 @@ def extraer_datos_resultados(resultados):
                 datos['actividades'].append({
                     "nombre": act.get('apartado', 'Actividad'),
                     "promedio": act.get('estadisticas', {}).get('promedio', 0),
-                    "feedback": act.get('feedback_global', {}).get('comentario_general', '')[:150]
+                    "feedback": act.get('feedback_global', {}).get('comentario_general', ''),
+                    "evaluaciones": act.get('evaluaciones', [])
                 })
     
     print(f"✅ Actividades procesadas: {len(datos['actividades'])}")
 
+    # 4. MÉTRICAS CONSOLIDADAS (en local, con todas las calificaciones recibidas)
+    datos['metricas_totales'] = consolidado.consolidar(datos['objetivo'], datos['actividades'])
+    for apartado in [datos['objetivo']] + datos['actividades']:
+        promedio = consolidado.promedio(apartado.get('evaluaciones'))
+        if promedio is not None:
+            apartado['promedio'] = promedio
+
     # --- VALIDACIÓN DE SALIDA ---
     # Si hay objetivo o actividades con nota, hay datos suficientes
     if datos['objetivo'].get('promedio', 0) > 0 or len(datos['actividades']) > 0:
@@ -83,38 +108,7 @@ def extraer_datos_resultados(resultados):
         
     return datos
 
-# --- HELPER: LLAMADA SEGURA PARA EL INFORME FINAL ---
-def llamada_segura_informe(messages, model="llama-3.1-8b-instant", temperature=0.1, max_tokens=2000, retries=5):
-    """
-    Intenta generar el informe manejando Rate Limits con esperas largas.
-    """
-    for i in range(retries):
-        try:
-            comp = openai.ChatCompletion.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                response_format={"type": "json_object"} # Forzamos JSON siempre
-            )
-            return comp
-        except openai.error.RateLimitError:
-            # Esperas progresivas: 10s, 20s, 30s, 40s, 50s
-            wait_time = (i + 1) * 10 
-            print(f"⚠️ Rate Limit en Informe Final (Intento {i+1}/{retries}). Pausando {wait_time}s...")
-            time.sleep(wait_time)
-        except Exception as e:
-            print(f"❌ Error desconocido en Informe Final: {str(e)}")
-            return None
-    
-    print("❌ Se agotaron los reintentos para el informe final.")
-    return None
-
-def generar_sintesis_final(datos_extraidos, perfil_edad="No especificado"):
-    """
-    Genera el informe final usando la llamada segura.
-    """
-    
+def mensajes_sintesis_final(datos_extraidos, perfil_edad="No especificado"):
     prompt = f'''
     ERES UN EXPERTO EN PEDAGOGÍA. Tu misión es redactar un INFORME TÉCNICO EXHAUSTIVO.
     Busco un análisis de ALTA VERBOSIDAD y PROFUNDIDAD.
@@ -125,6 +119,8 @@ def generar_sintesis_final(datos_extraidos, perfil_edad="No especificado"):
     OBJETIVO: "{datos_extraidos['objetivo'].get('texto', 'N/A')}" (Nota: {datos_extraidos['objetivo'].get('promedio', 'N/A')})
     INTRODUCCIÓN (Sustento bibliográfico para el Guía): {datos_extraidos['introduccion'].get('valoracion', 'N/A')}
     ACTIVIDADES: {formatear_actividades(datos_extraidos['actividades'])}
+    MÉTRICAS CONSOLIDADAS (ya calculadas; interprétalas, no las recalcules):
+    {consolidado.formatear(datos_extraidos['metricas_totales'])}
     
     --- REGLAS DE OBLIGATORIO CUMPLIMIENTO---
     1. No repitas ideas ya expresadas en otros apartados.NO SEAS REDUNDANTE.
@@ -141,9 +137,10 @@ def generar_sintesis_final(datos_extraidos, perfil_edad="No especificado"):
             "diagnostico_coherencia": "Análisis minucioso sobre si la ación propuesta cumple con la promesa del objetivo...",
            
             "ruta_de_accion": [
-                {{ 
-                   "estrategia": "Técnica pedagógica concreta, aporta ideas TENIENDO EN CUENTA el perfil {perfil_edad}...", 
-                   "fundamentacion": "Vínculo con {perfil_edad}...",
+                {{
+                   "estrategia": "Técnica pedagógica concreta, aporta ideas TENIENDO EN CUENTA el perfil {perfil_edad}...",
+                   "fundamentacion": "Vínculo con {perfil_edad}..."
+                }}
             ]
         }},
         "metricas_consolidadas": {{
@@ -152,26 +149,76 @@ def generar_sintesis_final(datos_extraidos, perfil_edad="No especificado"):
         }}
     }}
     '''
-    print("⏳ Generando Informe Final con IA (puede tardar por congestión)...")
-    
-    # Usamos la nueva llamada segura
-    response = llamada_segura_informe(
-        messages=[
-            {"role": "system", "content": "Eres un analista pedagógico conciso y práctico que responde en JSON."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-        
+    return [
+        {"role": "system", "content": "Eres un analista pedagógico conciso y práctico que responde en JSON."},
+        {"role": "user", "content": prompt}
+    ]
+
+def validar_informe(informe):
+    """El informe sólo vale si trae las secciones narrativas con el tipo esperado"""
+    analisis = informe.get("analisis_final")
+    if not isinstance(analisis, dict):
+        raise ValueError("falta 'analisis_final'")
+    for campo in ("sintesis_ejecutiva", "diagnostico_coherencia"):
+        if not isinstance(analisis.get(campo), str):
+            raise ValueError(f"falta 'analisis_final.{campo}'")
+    if not isinstance(analisis.get("ruta_de_accion", []), list):
+        raise ValueError("'ruta_de_accion' no es una lista")
+    return informe
+
+def escucha_informe(al_texto):
+    """Streaming del informe: al_texto recibe el texto de cada sección de analisis_final según se genera"""
+    return json_parcial.escucha(al_texto, [("analisis_final",)]) if al_texto else None
+
+def procesar_respuesta_sintesis(response, datos_extraidos):
     if response:
         try:
-            return json.loads(response.choices[0].message.content)
+            informe = validar_informe(json.loads(response.choices[0].message.content))
+            # Los números son los calculados en local; del modelo sólo se toma su valoración
+            estado = (informe.get("metricas_consolidadas") or {}).get("estado")
+            informe["metricas_consolidadas"] = dict(datos_extraidos['metricas_totales'], estado=estado)
+            return informe
         except Exception as e:
             print(f"Error parseando JSON final: {e}")
+            metricas.incrementar("llm_parseo_fallos_total", tipo="informe")
             return generar_analisis_simple(datos_extraidos)
     else:
-        # Si fallan todos los reintentos, ahí sí usamos el fallback
+        # Si fallan todos los reintentos (o se agotó el plazo), ahí sí usamos el fallback
         return generar_analisis_simple(datos_extraidos)
 
+def generar_sintesis_final(datos_extraidos, perfil_edad="No especificado", cancelacion=None, al_texto=None):
+    """
+    Genera el informe final usando la llamada segura.
+    """
+    print("⏳ Generando Informe Final con IA (puede tardar por congestión)...")
+    
+    # Usamos la nueva llamada segura
+    mensajes = mensajes_sintesis_final(datos_extraidos, perfil_edad)
+    response = llm_gateway.llamar(
+        mensajes,
+        max_tokens=2000,
+        cancelacion=cancelacion,
+        etiqueta="Informe Final",
+        etiquetas={"tipo": "informe"},
+        al_fragmento=escucha_informe(al_texto)
+    )
+    response = esquemas.reparar("informe", response, mensajes, cancelacion, {"tipo": "informe"})
+    return procesar_respuesta_sintesis(response, datos_extraidos)
+
+async def generar_sintesis_final_async(datos_extraidos, perfil_edad="No especificado", cancelacion=None, al_texto=None):
+    print("⏳ Generando Informe Final con IA (async)...")
+    mensajes = mensajes_sintesis_final(datos_extraidos, perfil_edad)
+    response = await llm_gateway.llamar_async(
+        mensajes,
+        max_tokens=2000,
+        cancelacion=cancelacion,
+        etiqueta="Informe Final",
+        etiquetas={"tipo": "informe"},
+        al_fragmento=escucha_informe(al_texto)
+    )
+    response = await esquemas.reparar_async("informe", response, mensajes, cancelacion, {"tipo": "informe"})
+    return procesar_respuesta_sintesis(response, datos_extraidos)
+
 def formatear_actividades(actividades):
     """Formatea información de actividades para el prompt"""
     texto = ""
@@ -181,14 +228,26 @@ def formatear_actividades(actividades):
         texto += f"   - Feedback previo: {act.get('feedback', 'Sin feedback')}\n"
     return texto
 
+def informe_numerico(datos):
+    """Modo solo_metricas: las métricas consolidadas, sin llamada a la IA"""
+    return {
+        "metricas_consolidadas": datos['metricas_totales'],
+        "solo_metricas": True
+    }
+
 def generar_analisis_simple(datos):
     """Análisis simple (FALLBACK) si falla la llamada a Groq"""
+    metricas.incrementar("evaluacion_degradada_total", tipo="informe", parte="informe")
+    totales = datos['metricas_totales']
     return {
         "analisis_final": {
-            "sintesis_general": f"El sistema no pudo conectar con la IA para el reporte final. El taller obtuvo un promedio de {datos['metricas_totales'].get('promedio_general', 0)}/5.",
-            "fortalezas_principales": ["Datos cuantificados disponibles", "Evaluación completada"],
-            "areas_oportunidad": ["Reintentar para obtener análisis cualitativo", "Revisar conexión a IA"],
+            "sintesis_general": f"El sistema no pudo conectar con la IA para el reporte final. El taller obtuvo un promedio de {totales.get('promedio_general', 0)}/5.",
+            "fortalezas_principales": [f"{i['indicador']} ({i['promedio']}/5)" for i in totales.get('indicadores_mas_fuertes', [])]
+                                      or ["Datos cuantificados disponibles", "Evaluación completada"],
+            "areas_oportunidad": [f"{i['indicador']} ({i['promedio']}/5)" for i in totales.get('indicadores_mas_debiles', [])]
+                                 or ["Reintentar para obtener análisis cualitativo", "Revisar conexión a IA"],
             "recomendaciones_practicas": ["Verifique los detalles de cada apartado individualmente"]
         },
-        "metricas_consolidadas": datos['metricas_totales']
+        "metricas_consolidadas": datos['metricas_totales'],
+        "degradado": True
     }
\ No newline at end of file
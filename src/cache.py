@@ -0,0 +1,127 @@
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from types import MappingProxyType
+from src import config
+from src.almacen import conectar
+
+# Súbela cada vez que cambie un prompt: invalida todo lo guardado antes
+VERSION_PROMPTS = "v2"
+
+# --- NIVEL 1: LRU EN MEMORIA (por worker) ---
+_memoria = OrderedDict()
+_lock = threading.Lock()
+_contadores = {"hits_memoria": 0, "hits_disco": 0, "misses": 0, "guardados": 0}
+
+
+def _db():
+    conn = conectar("cache")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cache (
+            clave TEXT PRIMARY KEY,
+            valor TEXT NOT NULL,
+            creado REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS cache_creado ON cache (creado)")
+    return conn
+
+
+def _vigente(creado):
+    return not config.CACHE_TTL_SEGUNDOS or time.time() - creado < config.CACHE_TTL_SEGUNDOS
+
+
+def _purgar(conn):
+    if config.CACHE_TTL_SEGUNDOS:
+        conn.execute("DELETE FROM cache WHERE creado < ?", (time.time() - config.CACHE_TTL_SEGUNDOS,))
+
+
+def normalizar(texto):
+    """Mismo contenido con distinto espaciado o forma Unicode produce la misma clave"""
+    texto = unicodedata.normalize("NFC", texto or "")
+    return " ".join(texto.split())
+
+
+def _serializable(valor):
+    if isinstance(valor, MappingProxyType):
+        return dict(valor)
+    return str(valor)
+
+
+def clave(*partes):
+    """Hash estable de las partes que determinan la respuesta de la IA"""
+    crudo = json.dumps([VERSION_PROMPTS] + list(partes), ensure_ascii=False, sort_keys=True, default=_serializable)
+    return hashlib.sha256(crudo.encode("utf-8")).hexdigest()
+
+
+def _contar(nombre):
+    with _lock:
+        _contadores[nombre] += 1
+
+
+def _recordar(k, valor, creado):
+    with _lock:
+        _memoria[k] = (valor, creado)
+        _memoria.move_to_end(k)
+        while len(_memoria) > config.CACHE_LRU_TAMANO:
+            _memoria.popitem(last=False)
+
+
+def obtener(k):
+    """Busca primero en memoria y luego en SQLite. Devuelve None si no existe"""
+    if not config.CACHE_ACTIVA:
+        return None
+
+    with _lock:
+        if k in _memoria:
+            valor, creado = _memoria[k]
+            if _vigente(creado):
+                _memoria.move_to_end(k)
+                _contadores["hits_memoria"] += 1
+                return json.loads(valor)
+            del _memoria[k]
+
+    try:
+        fila = _db().execute("SELECT valor, creado FROM cache WHERE clave = ?", (k,)).fetchone()
+    except Exception as e:
+        print(f"⚠️ Cache en disco no disponible: {e}")
+        fila = None
+
+    if fila and _vigente(fila[1]):
+        _recordar(k, fila[0], fila[1])
+        _contar("hits_disco")
+        return json.loads(fila[0])
+
+    _contar("misses")
+    return None
+
+
+def guardar(k, valor):
+    """Guarda el valor (serializable a JSON) en ambos niveles"""
+    if not config.CACHE_ACTIVA or valor is None:
+        return
+    crudo = json.dumps(valor, ensure_ascii=False)
+    ahora = time.time()
+    _recordar(k, crudo, ahora)
+    try:
+        conn = _db()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (clave, valor, creado) VALUES (?, ?, ?)",
+            (k, crudo, ahora)
+        )
+        _purgar(conn)
+        _contar("guardados")
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar en cache de disco: {e}")
+
+
+def estadisticas():
+    with _lock:
+        datos = dict(_contadores)
+        datos["entradas_memoria"] = len(_memoria)
+    consultas = datos["hits_memoria"] + datos["hits_disco"] + datos["misses"]
+    datos["tasa_aciertos"] = round((datos["hits_memoria"] + datos["hits_disco"]) / consultas, 3) if consultas else 0.0
+    return datos
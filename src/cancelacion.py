@@ -0,0 +1,202 @@
+import asyncio
+import copy
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as EsperaAgotada
+from src import config
+from src.almacen import conectar
+
+# Tokens de cancelación por evaluación (o por trabajo). La señal se guarda
+# en SQLite para que /cancelar funcione aunque llegue a otro worker, y cada
+# token la revisa con frecuencia para cortar esperas en menos de un segundo.
+# El token lleva además el plazo de la petición: al vencer, las esperas y las
+# llamadas en curso se cortan igual, pero la evaluación sigue y devuelve lo
+# que ya tenga (PlazoAgotado no marca la evaluación como cancelada).
+# Varias peticiones pueden compartir id (un reintento con el mismo
+# id_evaluacion): el token lleva la cuenta y sólo se olvida con la última.
+# Cada una se cancela a la vez que las demás pero conserva su propio plazo.
+
+INTERVALO_REVISION = 0.25
+
+_activos = {}
+_lock = threading.Lock()
+# Hilos donde corren las llamadas HTTP para poder abandonarlas al cancelar.
+# Tantos como el techo del control AIMD: el pool nunca limita por debajo de
+# lo que concurrencia cree tener en vuelo (los hilos se crean a demanda)
+_llamadas = ThreadPoolExecutor(max_workers=config.CONCURRENCIA_MAXIMA, thread_name_prefix="llamada_llm")
+
+
+class EvaluacionCancelada(Exception):
+    pass
+
+
+class PlazoAgotado(EvaluacionCancelada):
+    pass
+
+
+def _db():
+    conn = conectar("cancelacion")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS evaluaciones_activas (
+            id TEXT PRIMARY KEY,
+            cancelada INTEGER NOT NULL DEFAULT 0,
+            usos INTEGER NOT NULL DEFAULT 1,
+            creado REAL NOT NULL
+        )
+    """)
+    return conn
+
+
+class TokenCancelacion:
+    def __init__(self, id_evaluacion, plazo=None):
+        self.id = id_evaluacion
+        self.limite = time.monotonic() + plazo if plazo else None  # instante (monotonic) del plazo
+        self._evento = threading.Event()
+        self._ultima_revision = 0.0
+        self.usos = 1  # peticiones de este worker que comparten el token
+
+    def restante(self):
+        """Segundos que quedan del plazo (None si la petición no tiene plazo)"""
+        return None if self.limite is None else max(0.0, self.limite - time.monotonic())
+
+    def vencido(self):
+        return self.limite is not None and time.monotonic() >= self.limite
+
+    def con_plazo(self, plazo):
+        """El mismo token (se cancela a la vez) con el plazo de otra petición que comparte el id"""
+        vista = copy.copy(self)
+        vista.limite = time.monotonic() + plazo if plazo else None
+        return vista
+
+    def reservando(self, segundos):
+        """
+        El mismo token (se cancela a la vez) con el plazo adelantado
+        'segundos', para dejar tiempo a las etapas que vienen después. Con
+        un plazo corto la reserva nunca se lleva más de la mitad de lo que queda.
+        """
+        if self.limite is None or segundos <= 0:
+            return self
+        tramo = copy.copy(self)
+        tramo.limite = self.limite - min(segundos, self.restante() / 2)
+        return tramo
+
+    def is_set(self):
+        """True si esta evaluación fue cancelada (en este o en otro worker)"""
+        if self._evento.is_set():
+            return True
+        ahora = time.monotonic()
+        if ahora - self._ultima_revision >= INTERVALO_REVISION:
+            self._ultima_revision = ahora
+            try:
+                fila = _db().execute("SELECT cancelada FROM evaluaciones_activas WHERE id = ?", (self.id,)).fetchone()
+            except Exception as e:
+                print(f"⚠️ No se pudo revisar la cancelación: {e}")
+                fila = None
+            if fila and fila[0]:
+                self._evento.set()
+        return self._evento.is_set()
+
+    async def is_set_async(self):
+        """is_set() para corrutinas: si toca consultar SQLite, la consulta va a un hilo y no frena el loop"""
+        if self._evento.is_set():
+            return True
+        if time.monotonic() - self._ultima_revision >= INTERVALO_REVISION:
+            return await asyncio.to_thread(self.is_set)
+        return False
+
+    def set(self):
+        self._evento.set()
+
+    def esperar(self, segundos):
+        """Duerme hasta 'segundos' (o hasta el plazo); devuelve True si se canceló mientras tanto"""
+        limite = time.monotonic() + segundos
+        if self.limite is not None:
+            limite = min(limite, self.limite)
+        while not self.is_set():
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return False
+            self._evento.wait(min(restante, INTERVALO_REVISION))
+        return True
+
+    def verificar(self):
+        if self.is_set():
+            raise EvaluacionCancelada(f"Evaluación {self.id} cancelada")
+        if self.vencido():
+            raise PlazoAgotado(f"Evaluación {self.id}: plazo agotado")
+
+    async def verificar_async(self):
+        await self.is_set_async()
+        self.verificar()
+
+
+def nuevo_id():
+    return uuid.uuid4().hex
+
+
+def registrar(id_evaluacion=None, plazo=None):
+    """
+    Crea (o reutiliza) el token de la evaluación y lo anota en el almacén
+    compartido. 'plazo' son los segundos que tiene la petición para responder.
+    """
+    id_evaluacion = id_evaluacion or nuevo_id()
+    with _lock:
+        token = _activos.get(id_evaluacion)
+        if token is None:
+            token = _activos[id_evaluacion] = TokenCancelacion(id_evaluacion, plazo)
+        else:
+            token.usos += 1
+            token = token.con_plazo(plazo)
+    _db().execute(
+        "INSERT INTO evaluaciones_activas (id, cancelada, usos, creado) VALUES (?, 0, 1, ?) "
+        "ON CONFLICT(id) DO UPDATE SET usos = usos + 1",
+        (id_evaluacion, time.time())
+    )
+    return token
+
+
+def liberar(token):
+    """La petición terminó: el token se olvida cuando ya no lo usa ninguna otra con el mismo id"""
+    if token is None:
+        return
+    with _lock:
+        activo = _activos.get(token.id)
+        if activo is not None:
+            activo.usos -= 1
+            if activo.usos <= 0:
+                _activos.pop(token.id, None)
+    try:
+        conn = _db()
+        conn.execute("UPDATE evaluaciones_activas SET usos = usos - 1 WHERE id = ?", (token.id,))
+        conn.execute("DELETE FROM evaluaciones_activas WHERE id = ? AND usos <= 0", (token.id,))
+    except Exception as e:
+        print(f"⚠️ No se pudo liberar el token {token.id}: {e}")
+
+
+def cancelar(id_evaluacion):
+    """Cancela la evaluación (o el trabajo) con ese id en todos los workers; devuelve 1 si estaba activa"""
+    if not id_evaluacion:
+        return 0
+    cursor = _db().execute("UPDATE evaluaciones_activas SET cancelada = 1 WHERE id = ?", (id_evaluacion,))
+    with _lock:
+        if id_evaluacion in _activos:
+            _activos[id_evaluacion].set()
+    return 1 if cursor.rowcount else 0
+
+
+def ejecutar_cancelable(funcion, cancelacion=None):
+    """
+    Ejecuta funcion() (una llamada HTTP bloqueante) en un hilo aparte y
+    espera su resultado; si el token se cancela, abandona la espera de
+    inmediato y lanza EvaluacionCancelada (PlazoAgotado si venció el plazo).
+    """
+    if cancelacion is None:
+        return funcion()
+    cancelacion.verificar()
+    futuro = _llamadas.submit(funcion)
+    while True:
+        try:
+            return futuro.result(timeout=INTERVALO_REVISION)
+        except EsperaAgotada:
+            cancelacion.verificar()
@@ -0,0 +1,187 @@
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+from src import config, prefiltro
+
+# Catálogo en memoria de perfiles de edad y modelos pedagógicos.
+# Se construye una vez al arrancar y es inmutable; si los JSON de data/
+# cambian en disco se construye uno nuevo y se reemplaza de un solo golpe.
+# Si alguno no se puede leer (a medio escribir, mal formado) se sigue con el
+# anterior hasta que vuelva a cambiar.
+
+MODELOS_POR_POBLACION = {
+    "joven": ('ensenanza_para_la_comprension', 'indagacion_cientifica'),
+    "adulta": ('didactica_del_patrimonio', 'pedagogia_critica'),
+}
+
+_actual = None
+_lock = threading.Lock()
+_ultima_revision = 0.0
+
+
+def normalizar_rango(rango):
+    """'7 - 11 años', '7–11' y '7-11' -> '7-11'; '61 en adelante' -> '61_en_adelante'"""
+    r = str(rango or "").strip().lower()
+    r = r.replace("–", "-").replace("—", "-").replace("años", "").replace("anos", "")
+    r = "-".join(p.strip() for p in r.split("-"))
+    return "_".join(r.replace("_", " ").split())
+
+
+def limites_rango(rango):
+    """
+    (desde, hasta) de un rango ya normalizado: '7-11' -> (7, 11), '39' ->
+    (39, 39), '61_en_adelante' -> (61, inf). None si no es un rango de edades.
+    """
+    partes = rango.split("_", 1)
+    abierto = len(partes) == 2 and partes[1] == "en_adelante"
+    if len(partes) == 2 and not abierto:
+        return None
+    try:
+        edades = [int(e) for e in partes[0].split("-")]
+    except ValueError:
+        return None
+    if not 1 <= len(edades) <= 2 or edades[0] > edades[-1]:
+        return None
+    return edades[0], float("inf") if abierto else edades[-1]
+
+
+def construir_def_tec(ind_info):
+    """Preparación de la definición técnica del indicador"""
+    def_tec = str(ind_info)
+    if isinstance(ind_info, (dict, MappingProxyType)):
+        parts = []
+        if 'Definicion' in ind_info:
+            parts.append(f"DEFINICIÓN: {ind_info['Definicion']}")
+        if 'Indicadores' in ind_info:
+            inds = ind_info['Indicadores']
+            txt = ", ".join(inds) if isinstance(inds, (list, tuple)) else str(inds)
+            parts.append(f"ELEMENTOS ESPERADOS: {txt}")
+        def_tec = "\n".join(parts)
+    return def_tec
+
+
+def congelar(valor):
+    if isinstance(valor, dict):
+        return MappingProxyType({k: congelar(v) for k, v in valor.items()})
+    if isinstance(valor, list):
+        return tuple(congelar(v) for v in valor)
+    return valor
+
+
+def _archivos():
+    rutas = [os.path.join(config.BASE_DIR, "data", "edades", f"poblacion_{p}.json") for p in MODELOS_POR_POBLACION]
+    for archivos in MODELOS_POR_POBLACION.values():
+        rutas += [os.path.join(config.BASE_DIR, "data", "models", f"{a}.json") for a in archivos]
+    return rutas
+
+
+def _firma():
+    firma = []
+    for ruta in _archivos():
+        try:
+            firma.append((ruta, os.stat(ruta).st_mtime_ns))
+        except OSError:
+            firma.append((ruta, None))
+    return tuple(firma)
+
+
+class Catalogo:
+    def __init__(self, perfiles, modelos, firma):
+        self.perfiles = perfiles
+        self.modelos = modelos
+        self.firma = firma
+        # Índice BM25 de todos los indicadores para el prefiltro léxico
+        self.indice = prefiltro.construir_indice(modelos)
+
+    def perfil(self, poblacion, rango):
+        """
+        Clave exacta tras normalizar; si no existe, el perfil cuyo rango de
+        edades contiene el pedido ('11-12' -> '11-12_en_adelante', '45' ->
+        '39-61'). Si varios lo contienen (los rangos del JSON se solapan en
+        los extremos) gana el que empieza más tarde: '61' -> '61_en_adelante'.
+        Un rango vacío o que no encaja en ninguno devuelve {}.
+        """
+        perfiles = self.perfiles.get(poblacion, {})
+        normalizado = normalizar_rango(rango)
+        if normalizado in perfiles:
+            return perfiles[normalizado]
+        pedido = limites_rango(normalizado)
+        if pedido is None:
+            return {}
+        candidatos = [(limites[0], clave) for clave, limites in ((k, limites_rango(k)) for k in perfiles)
+                      if limites and limites[0] <= pedido[0] and pedido[1] <= limites[1]]
+        return perfiles[max(candidatos)[1]] if candidatos else {}
+
+    def modelos_de(self, poblacion):
+        return self.modelos.get(poblacion, {})
+
+
+def construir(estricto=False):
+    """
+    Lee y parsea todos los JSON de data/ y devuelve un Catalogo inmutable.
+    Con estricto (recargas) un archivo que no se puede leer lanza la
+    excepción en lugar de dejar fuera su perfil o su modelo.
+    """
+    firma = _firma()
+    perfiles = {}
+    modelos = {}
+
+    for poblacion, archivos in MODELOS_POR_POBLACION.items():
+        try:
+            path = os.path.join(config.BASE_DIR, "data", "edades", f"poblacion_{poblacion}.json")
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f).get(poblacion, {})
+            perfiles[poblacion] = MappingProxyType({normalizar_rango(k): congelar(v) for k, v in data.items()})
+        except Exception as e:
+            if estricto:
+                raise
+            print(f"Error cargando perfil ({poblacion}): {e}")
+            perfiles[poblacion] = MappingProxyType({})
+
+        por_modelo = {}
+        for a in archivos:
+            try:
+                path = os.path.join(config.BASE_DIR, 'data', 'models', f'{a}.json')
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                root = list(data.keys())[0]
+                indicadores = congelar(data[root])
+                por_modelo[a] = MappingProxyType({
+                    "nombre": root,
+                    "indicadores": indicadores,
+                    "def_tec": MappingProxyType({k: construir_def_tec(v) for k, v in indicadores.items()}),
+                })
+            except Exception as e:
+                if estricto:
+                    raise
+                print(f"Error cargando modelo ({a}): {e}")
+        modelos[poblacion] = MappingProxyType(por_modelo)
+
+    return Catalogo(MappingProxyType(perfiles), MappingProxyType(modelos), firma)
+
+
+def obtener():
+    """
+    Devuelve el catálogo vigente. Como mucho cada CATALOGO_REVISION_SEGUNDOS
+    revisa las fechas de los archivos y, si cambiaron, lo reconstruye; si
+    la reconstrucción falla se mantiene el catálogo vigente.
+    """
+    global _actual, _ultima_revision
+    ahora = time.monotonic()
+    if _actual is not None and ahora - _ultima_revision < config.CATALOGO_REVISION_SEGUNDOS:
+        return _actual
+
+    with _lock:
+        if _actual is None or ahora - _ultima_revision >= config.CATALOGO_REVISION_SEGUNDOS:
+            if _actual is None:
+                _actual = construir()
+            elif _firma() != _actual.firma:
+                try:
+                    _actual = construir(estricto=True)
+                    print("♻️  Catálogo recargado: cambiaron los archivos de data/")
+                except Exception as e:
+                    print(f"⚠️ Catálogo sin recargar, se mantiene el anterior: {e}")
+            _ultima_revision = ahora
+    return _actual
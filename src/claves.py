@@ -0,0 +1,129 @@
+import asyncio
+import collections
+import time
+from src import config, limitador
+from src.almacen import conectar
+
+# Pool de claves (y endpoints) del proveedor. Cada clave tiene su propio
+# token bucket en el limitador y cada llamada sale por la que tenga más cupo
+# libre. Una clave que recibe 429 queda fuera de rotación un rato; la pausa
+# se guarda en SQLite para que la respeten todos los workers.
+
+Credencial = collections.namedtuple("Credencial", "nombre api_key api_base")
+
+
+def _cargar():
+    claves = config.LLM_CLAVES
+    if len(claves) <= 1:
+        # Con una sola clave se conserva el bucket "groq" de siempre
+        return [Credencial("groq", claves[0] if claves else None,
+                           config.LLM_ENDPOINTS[0] if config.LLM_ENDPOINTS else config.LLM_API_BASE)]
+    return [
+        Credencial(f"groq-{i}", clave,
+                   config.LLM_ENDPOINTS[i - 1] if i <= len(config.LLM_ENDPOINTS) else config.LLM_API_BASE)
+        for i, clave in enumerate(claves, 1)
+    ]
+
+
+POOL = _cargar()
+
+
+def _db():
+    conn = conectar("claves")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pausas (
+            nombre TEXT PRIMARY KEY,
+            hasta REAL NOT NULL
+        )
+    """)
+    return conn
+
+
+def _pausadas():
+    """nombre -> instante (time.time) en que la clave vuelve a la rotación"""
+    filas = _db().execute("SELECT nombre, hasta FROM pausas WHERE hasta > ?", (time.time(),)).fetchall()
+    return dict(filas)
+
+
+def pausar(credencial, segundos=None):
+    segundos = segundos if segundos is not None else config.LLM_CLAVE_PAUSA_429
+    _db().execute("INSERT OR REPLACE INTO pausas (nombre, hasta) VALUES (?, ?)",
+                  (credencial.nombre, time.time() + segundos))
+    if len(POOL) > 1:
+        print(f"🔑 Clave {credencial.nombre} fuera de rotación durante {segundos:.0f}s (429).")
+
+
+def hay_otra_activa(credencial):
+    pausadas = _pausadas()
+    return any(c.nombre != credencial.nombre and c.nombre not in pausadas for c in POOL)
+
+
+def _turno(tokens):
+    """
+    Un intento sobre todas las claves activas, empezando por la de más cupo.
+    Devuelve (credencial, 0) si alguna lo descontó, o (None, segundos a esperar).
+    """
+    pausadas = _pausadas()
+    activas = [c for c in POOL if c.nombre not in pausadas]
+    if not activas:
+        espera = min(pausadas.values()) - time.time()
+        return None, min(max(espera, 0.05), limitador.ESPERA_MAXIMA_POR_CICLO)
+    if len(activas) > 1:
+        activas.sort(key=lambda c: limitador.margen(c.nombre), reverse=True)
+
+    esperas = []
+    for credencial in activas:
+        espera = limitador.intentar(tokens, credencial.nombre)
+        if not espera:
+            return credencial, 0
+        esperas.append(espera)
+    return None, min(esperas)
+
+
+def adquirir(tokens, cancelacion=None):
+    """
+    Bloquea hasta que alguna clave del pool tenga cupo para 1 petición y
+    'tokens' tokens y los descuenta de su bucket. Devuelve la credencial
+    por la que debe salir la llamada y los segundos esperados. Si el token
+    de cancelación se activa durante la espera, lanza EvaluacionCancelada
+    sin haber consumido cupo.
+    """
+    inicio = time.time()
+    while True:
+        if cancelacion is not None:
+            cancelacion.verificar()
+        credencial, espera = _turno(tokens)
+        if credencial:
+            return credencial, time.time() - inicio
+        if cancelacion is not None:
+            cancelacion.esperar(espera)
+        else:
+            time.sleep(espera)
+
+
+async def adquirir_async(tokens, cancelacion=None):
+    """Igual que adquirir(), pero cede el event loop mientras espera (y mientras consulta SQLite)"""
+    inicio = time.time()
+    while True:
+        if cancelacion is not None:
+            await cancelacion.verificar_async()
+        credencial, espera = await asyncio.to_thread(_turno, tokens)
+        if credencial:
+            return credencial, time.time() - inicio
+        await asyncio.sleep(min(espera, 0.25) if cancelacion is not None else espera)
+
+
+def estado():
+    """Situación de cada clave para /metrics (nunca expone la clave en sí)"""
+    pausadas = _pausadas()
+    ahora = time.time()
+    return [
+        {
+            "nombre": c.nombre,
+            "api_base": c.api_base,
+            "en_pausa": c.nombre in pausadas,
+            "segundos_pausa": max(0.0, pausadas.get(c.nombre, ahora) - ahora),
+            "cupo_restante": limitador.margen(c.nombre),
+        }
+        for c in POOL
+    ]
@@ -3,6 +3,7 @@
 import os
 from dotenv import load_dotenv
 import openai
+from src import config
 
 load_dotenv()
 
@@ -13,7 +14,7 @@ def configurar_openai():
         raise ValueError("KEY03 no encontrada en .env")
     
     openai.api_key = api_key
-    openai.api_base = "https://api.groq.com/openai/v1"
+    openai.api_base = config.LLM_API_BASE
     return openai
 
 # Llamar esta función al inicio
@@ -0,0 +1,247 @@
+import asyncio
+import collections
+import os
+import threading
+import time
+from src import config
+from src.cancelacion import INTERVALO_REVISION
+
+# Control adaptativo (AIMD) de cuántas llamadas al LLM puede haber en vuelo
+# en este worker. Arranca bajo y dobla el límite mientras todo va bien
+# (arranque lento, como TCP); tras el primer aviso sólo suma ~1 por ronda de
+# llamadas. Un 429 o un pico de latencia respecto a lo habitual para ese
+# tipo de llamada lo multiplica por CONCURRENCIA_FACTOR_REDUCCION. Así la
+# concurrencia sigue a la capacidad real del proveedor sin constantes fijas.
+
+MUESTRAS_MINIMAS = 10  # llamadas de un tipo antes de juzgar sus picos de latencia
+ALFA_LATENCIA = 0.1
+
+_lock = threading.Lock()
+_cond = threading.Condition(_lock)
+_esperas_async = []
+_estado = None
+
+
+def _nuevo_estado():
+    return {
+        "pid": os.getpid(),
+        "limite": float(config.CONCURRENCIA_INICIAL),
+        "en_vuelo": 0,
+        "esperando": 0,
+        "fase": "arranque",
+        "ultima_reduccion": 0.0,
+        "latencias": {},
+        "decisiones": collections.deque(maxlen=50),
+    }
+
+
+def _actual():
+    """El estado es por proceso: un worker nuevo (fork de gunicorn) empieza de cero"""
+    global _estado
+    if _estado is None or _estado["pid"] != os.getpid():
+        _estado = _nuevo_estado()
+    return _estado
+
+
+def _hay_sitio(estado):
+    return not config.CONCURRENCIA_ADAPTATIVA or estado["en_vuelo"] < int(estado["limite"])
+
+
+def _anotar(estado, accion, anterior, motivo):
+    estado["decisiones"].appendleft({
+        "instante": time.time(),
+        "accion": accion,
+        "motivo": motivo,
+        "limite_anterior": round(anterior, 2),
+        "limite": round(estado["limite"], 2),
+        "en_vuelo": estado["en_vuelo"],
+    })
+
+
+def _subir(estado):
+    anterior = estado["limite"]
+    paso = 1.0 if estado["fase"] == "arranque" else 1.0 / max(anterior, 1.0)
+    estado["limite"] = min(float(config.CONCURRENCIA_MAXIMA), anterior + paso)
+    if int(estado["limite"]) != int(anterior):
+        _anotar(estado, "subir", anterior, estado["fase"])
+
+
+def _bajar(estado, motivo):
+    """Una sola reducción por episodio: las llamadas que ya estaban en vuelo no vuelven a recortar"""
+    ahora = time.monotonic()
+    if ahora - estado["ultima_reduccion"] < _ventana(estado):
+        return
+    anterior = estado["limite"]
+    estado["limite"] = max(float(config.CONCURRENCIA_MINIMA), anterior * config.CONCURRENCIA_FACTOR_REDUCCION)
+    estado["fase"] = "evitacion"
+    estado["ultima_reduccion"] = ahora
+    _anotar(estado, "bajar", anterior, motivo)
+    print(f"🐢 Concurrencia LLM {anterior:.1f} -> {estado['limite']:.1f} ({motivo}).")
+
+
+def _ventana(estado):
+    """Duración de una 'ronda': la latencia habitual más lenta observada (1 s si aún no hay datos)"""
+    medias = [l["media"] for l in estado["latencias"].values() if l["muestras"] >= MUESTRAS_MINIMAS]
+    return max(medias, default=1.0)
+
+
+def _es_pico(estado, tipo, duracion):
+    latencia = estado["latencias"].get(tipo)
+    return (latencia is not None and latencia["muestras"] >= MUESTRAS_MINIMAS
+            and duracion > config.CONCURRENCIA_PICO_LATENCIA * latencia["media"])
+
+
+def _observar_latencia(estado, tipo, duracion):
+    latencia = estado["latencias"].setdefault(tipo, {"media": duracion, "muestras": 0})
+    latencia["media"] += ALFA_LATENCIA * (duracion - latencia["media"])
+    latencia["muestras"] += 1
+
+
+def latencia_habitual(tipo):
+    """Segundos que suele tardar una llamada de este tipo (0 si aún no hay muestras suficientes)"""
+    with _lock:
+        latencia = _actual()["latencias"].get(tipo)
+        return latencia["media"] if latencia and latencia["muestras"] >= MUESTRAS_MINIMAS else 0.0
+
+
+def _despertar():
+    _cond.notify_all()
+    for loop, futuro in _esperas_async:
+        loop.call_soon_threadsafe(lambda f=futuro: f.done() or f.set_result(None))
+    _esperas_async.clear()
+
+
+def adquirir(cancelacion=None):
+    """Espera un hueco para una llamada; devuelve los segundos esperados"""
+    inicio = time.perf_counter()
+    with _cond:
+        estado = _actual()
+        estado["esperando"] += 1
+        try:
+            while not _hay_sitio(estado):
+                if cancelacion is not None:
+                    cancelacion.verificar()
+                _cond.wait(INTERVALO_REVISION)
+            estado["en_vuelo"] += 1
+        finally:
+            estado["esperando"] -= 1
+    return time.perf_counter() - inicio
+
+
+async def adquirir_async(cancelacion=None):
+    """Igual que adquirir(), pero cede el event loop mientras espera"""
+    inicio = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    while True:
+        with _lock:
+            estado = _actual()
+            if _hay_sitio(estado):
+                estado["en_vuelo"] += 1
+                return time.perf_counter() - inicio
+            futuro = loop.create_future()
+            _esperas_async.append((loop, futuro))
+            estado["esperando"] += 1
+        try:
+            await asyncio.wait_for(futuro, INTERVALO_REVISION)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with _lock:
+                _actual()["esperando"] -= 1
+        if cancelacion is not None:
+            await cancelacion.verificar_async()
+
+
+def liberar(tipo, duracion=None, resultado="ok"):
+    """
+    Devuelve el hueco y ajusta el límite. resultado: "ok", "rate_limit" o
+    "timeout" (recortan), "error" (no cuenta: un 500 no dice nada de la
+    concurrencia) o "cancelado" (duracion None, sin ajuste).
+    """
+    with _cond:
+        estado = _actual()
+        estado["en_vuelo"] = max(0, estado["en_vuelo"] - 1)
+        if config.CONCURRENCIA_ADAPTATIVA:
+            if resultado in ("rate_limit", "timeout"):
+                _bajar(estado, "429" if resultado == "rate_limit" else "timeout")
+            elif resultado == "ok" and duracion is not None:
+                if _es_pico(estado, tipo, duracion):
+                    _bajar(estado, f"latencia {tipo} {duracion:.1f}s")
+                else:
+                    _observar_latencia(estado, tipo, duracion)
+                    if estado["en_vuelo"] + 1 >= int(estado["limite"]):
+                        # Sólo se sube si el límite de verdad se estaba usando
+                        _subir(estado)
+        _despertar()
+
+
+class Turno:
+    """
+    'with' / 'async with' alrededor de un intento de llamada. clasificar(error)
+    traduce la excepción (si la hubo) a "rate_limit", "error" o "cancelado".
+    """
+
+    def __init__(self, tipo, cancelacion=None, clasificar=None):
+        self.tipo = tipo
+        self.cancelacion = cancelacion
+        self.clasificar = clasificar
+        self.esperado = 0.0
+        self._inicio = None
+
+    def _cerrar(self, error):
+        duracion = time.perf_counter() - self._inicio
+        if error is None:
+            liberar(self.tipo, duracion)
+        else:
+            resultado = self.clasificar(error) if self.clasificar else "error"
+            liberar(self.tipo, None if resultado == "cancelado" else duracion, resultado)
+
+    def empezar(self):
+        """
+        La llamada sale de verdad ahora: si esperó hilo libre tras entrar al
+        turno, esa cola no cuenta como latencia del proveedor.
+        """
+        self._inicio = time.perf_counter()
+
+    def __enter__(self):
+        self.esperado = adquirir(self.cancelacion)
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo_error, error, traza):
+        self._cerrar(error)
+        return False
+
+    async def __aenter__(self):
+        self.esperado = await adquirir_async(self.cancelacion)
+        self._inicio = time.perf_counter()
+        return self
+
+    async def __aexit__(self, tipo_error, error, traza):
+        self._cerrar(error)
+        return False
+
+
+def turno(tipo, cancelacion=None, clasificar=None):
+    return Turno(tipo, cancelacion, clasificar)
+
+
+def estado():
+    """Límite actual, ocupación y últimas decisiones de este worker (para /concurrencia y /metrics)"""
+    with _lock:
+        actual = _actual()
+        return {
+            "activo": config.CONCURRENCIA_ADAPTATIVA,
+            "pid": actual["pid"],
+            "limite": round(actual["limite"], 2),
+            "en_vuelo": actual["en_vuelo"],
+            "esperando": actual["esperando"],
+            "fase": actual["fase"],
+            "minimo": config.CONCURRENCIA_MINIMA,
+            "maximo": config.CONCURRENCIA_MAXIMA,
+            "latencia_habitual": {
+                tipo: {"segundos": round(l["media"], 3), "muestras": l["muestras"]}
+                for tipo, l in actual["latencias"].items()
+            },
+            "decisiones": list(actual["decisiones"]),
+        }
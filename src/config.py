@@ -4,4 +4,109 @@ from dotenv import load_dotenv
 load_dotenv()
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 api_key = os.getenv("KEY03")
-evaluacion_activa = True
\ No newline at end of file
+
+# Endpoint compatible con OpenAI; apúntalo al mock local (herramientas/mock_groq.py) para pruebas sin cupo
+LLM_API_BASE = os.getenv("LLM_API_BASE", "https://api.groq.com/openai/v1")
+
+# Pool de claves del proveedor separadas por comas (sin definir, sólo KEY03). Cada
+# clave tiene su propio cupo RPM/TPM; LLM_ENDPOINTS da la base URL de cada una en
+# el mismo orden (las que falten usan LLM_API_BASE)
+LLM_CLAVES = [c.strip() for c in os.getenv("LLM_CLAVES", "").split(",") if c.strip()] or ([api_key] if api_key else [])
+LLM_ENDPOINTS = [u.strip() for u in os.getenv("LLM_ENDPOINTS", "").split(",") if u.strip()]
+# Segundos fuera de rotación de una clave que recibió 429 sin Retry-After
+LLM_CLAVE_PAUSA_429 = float(os.getenv("LLM_CLAVE_PAUSA_429", "20"))
+
+# Número máximo de indicadores evaluados en paralelo por apartado
+MAX_CONCURRENCIA_INDICADORES = int(os.getenv("MAX_CONCURRENCIA_INDICADORES", "5"))
+
+# Llamadas simultáneas al evaluar un taller completo (todos los apartados comparten este cupo)
+MAX_CONCURRENCIA_TALLER = int(os.getenv("MAX_CONCURRENCIA_TALLER", "15"))
+
+# Control adaptativo (AIMD) de llamadas LLM en vuelo por worker: arranque lento desde
+# CONCURRENCIA_INICIAL, +1 por ronda mientras todo va bien, x FACTOR_REDUCCION ante un 429,
+# un timeout o una llamada PICO_LATENCIA veces más lenta de lo habitual para su tipo. Por
+# defecto arranca en el cupo de un taller: un worker nuevo no frena por debajo de él
+CONCURRENCIA_ADAPTATIVA = os.getenv("CONCURRENCIA_ADAPTATIVA", "1") == "1"
+CONCURRENCIA_INICIAL = int(os.getenv("CONCURRENCIA_INICIAL", str(MAX_CONCURRENCIA_TALLER)))
+CONCURRENCIA_MINIMA = int(os.getenv("CONCURRENCIA_MINIMA", "1"))
+CONCURRENCIA_MAXIMA = int(os.getenv("CONCURRENCIA_MAXIMA", "128"))
+CONCURRENCIA_FACTOR_REDUCCION = float(os.getenv("CONCURRENCIA_FACTOR_REDUCCION", "0.5"))
+CONCURRENCIA_PICO_LATENCIA = float(os.getenv("CONCURRENCIA_PICO_LATENCIA", "3"))
+
+# Carpeta para el estado compartido entre workers de gunicorn (SQLite)
+ESTADO_DIR = os.getenv("ESTADO_DIR", os.path.join(BASE_DIR, ".estado"))
+
+# Cupo de Groq por clave, compartido por todos los workers (peticiones y tokens por minuto)
+LIMITE_RPM = int(os.getenv("GROQ_LIMITE_RPM", "30"))
+LIMITE_TPM = int(os.getenv("GROQ_LIMITE_TPM", "6000"))
+TOKENS_RESPUESTA_ESTIMADOS = int(os.getenv("GROQ_TOKENS_RESPUESTA_ESTIMADOS", "400"))
+
+# Presupuesto de tokens del texto del usuario en cada prompt (se recorta en fin de oración)
+TOKENS_CONTENIDO_OBJETIVO = int(os.getenv("TOKENS_CONTENIDO_OBJETIVO", "400"))
+TOKENS_CONTENIDO_ACTIVIDAD = int(os.getenv("TOKENS_CONTENIDO_ACTIVIDAD", "400"))
+TOKENS_CONTENIDO_INTRODUCCION = int(os.getenv("TOKENS_CONTENIDO_INTRODUCCION", "900"))
+
+# Indicadores en streaming: la calificación se avisa en cuanto llega y la lectura se corta
+# al cerrarse el JSON. TOKENS_MAX_INDICADOR es el tope duro de cada respuesta (con o sin streaming)
+LLM_STREAMING_INDICADORES = os.getenv("LLM_STREAMING_INDICADORES", "1") == "1"
+TOKENS_MAX_INDICADOR = int(os.getenv("TOKENS_MAX_INDICADOR", "600"))
+
+# Respuestas fuera de esquema: se reparan en local (vallas, comas colgantes, JSON cortado,
+# "4/5" -> 4) y, si aún faltan campos, se piden sólo esos en una llamada corta
+REPARACION_LLAMADA_ACTIVA = os.getenv("REPARACION_LLAMADA_ACTIVA", "1") == "1"
+
+# Prefiltro léxico (BM25): indicadores sin relación con el texto reciben nivel 1 sin llamar
+# a la IA (opt-in: no ve sinónimos, así que conviene calibrar el umbral con textos reales)
+PREFILTRO_ACTIVO = os.getenv("PREFILTRO_ACTIVO", "0") == "1"
+PREFILTRO_UMBRAL = float(os.getenv("PREFILTRO_UMBRAL", "0.3"))
+
+# Single-flight: peticiones idénticas simultáneas comparten una sola evaluación (entre workers)
+DEDUPLICACION_ACTIVA = os.getenv("DEDUPLICACION_ACTIVA", "1") == "1"
+VUELO_LATIDO_SEGUNDOS = float(os.getenv("VUELO_LATIDO_SEGUNDOS", "2"))
+VUELO_SEGUNDOS_SIN_LATIDO = float(os.getenv("VUELO_SEGUNDOS_SIN_LATIDO", "10"))
+VUELO_RETENCION_SEGUNDOS = float(os.getenv("VUELO_RETENCION_SEGUNDOS", "5"))  # resultado reutilizable tras terminar
+
+# Puntos de control: cada indicador terminado se guarda en SQLite bajo su apartado (aunque la cache
+# esté apagada); reenviar el apartado o /evaluaciones/<id>/reanudar sólo evalúa los que faltan
+PUNTOS_CONTROL_ACTIVOS = os.getenv("PUNTOS_CONTROL_ACTIVOS", "1") == "1"
+PUNTOS_CONTROL_RETENCION_SEGUNDOS = float(os.getenv("PUNTOS_CONTROL_RETENCION_SEGUNDOS", "86400"))
+
+# Modo lote: una sola llamada por modelo pedagógico (opt-in)
+EVALUACION_EN_LOTE = os.getenv("EVALUACION_EN_LOTE", "0") == "1"
+
+# Cache de calificaciones y feedback (memoria LRU + SQLite compartido)
+CACHE_ACTIVA = os.getenv("CACHE_ACTIVA", "1") == "1"
+CACHE_LRU_TAMANO = int(os.getenv("CACHE_LRU_TAMANO", "2000"))
+CACHE_TTL_SEGUNDOS = int(os.getenv("CACHE_TTL_SEGUNDOS", "0"))  # 0 = sin caducidad
+
+# Cada cuántos segundos se revisa si cambiaron los JSON de data/
+CATALOGO_REVISION_SEGUNDOS = float(os.getenv("CATALOGO_REVISION_SEGUNDOS", "5"))
+
+# Cola de trabajos en segundo plano (por worker de gunicorn)
+TRABAJOS_MAX_WORKERS = int(os.getenv("TRABAJOS_MAX_WORKERS", "4"))
+TRABAJOS_MAX_PENDIENTES = int(os.getenv("TRABAJOS_MAX_PENDIENTES", "50"))
+TRABAJOS_REINTENTOS = int(os.getenv("TRABAJOS_REINTENTOS", "2"))
+TRABAJOS_ESPERA_REINTENTO = float(os.getenv("TRABAJOS_ESPERA_REINTENTO", "2"))
+TRABAJOS_RETENCION_SEGUNDOS = float(os.getenv("TRABAJOS_RETENCION_SEGUNDOS", "86400"))  # resultado consultable
+
+# Ruta asíncrona: conexiones keep-alive compartidas hacia el endpoint LLM
+ASYNC_POOL_CONEXIONES = int(os.getenv("ASYNC_POOL_CONEXIONES", "20"))
+ASYNC_MAX_EN_VUELO = int(os.getenv("ASYNC_MAX_EN_VUELO", "50"))
+
+# Gateway LLM: reintentos con backoff exponencial + jitter y circuit breaker
+LLM_REINTENTOS = int(os.getenv("LLM_REINTENTOS", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAXIMO = float(os.getenv("LLM_BACKOFF_MAXIMO", "20"))
+LLM_PLAZO_SEGUNDOS = float(os.getenv("LLM_PLAZO_SEGUNDOS", "90"))
+CIRCUITO_UMBRAL_FALLOS = int(os.getenv("CIRCUITO_UMBRAL_FALLOS", "5"))
+CIRCUITO_SEGUNDOS_ABIERTO = float(os.getenv("CIRCUITO_SEGUNDOS_ABIERTO", "30"))
+
+# Plazo de cada petición síncrona o en streaming (por debajo del --timeout de gunicorn del
+# Procfile; 0 = sin plazo). Al vencer no se lanzan más llamadas y se responde con lo ya evaluado.
+# Las reservas guardan tiempo para el feedback de cada apartado y para el informe del taller
+PLAZO_PETICION_SEGUNDOS = float(os.getenv("PLAZO_PETICION_SEGUNDOS", "100"))
+PLAZO_RESERVA_FEEDBACK = float(os.getenv("PLAZO_RESERVA_FEEDBACK", "8"))
+PLAZO_RESERVA_INFORME = float(os.getenv("PLAZO_RESERVA_INFORME", "15"))
+
+# Métricas: cada cuánto vuelca cada worker sus contadores al almacén compartido
+METRICAS_VOLCADO_SEGUNDOS = float(os.getenv("METRICAS_VOLCADO_SEGUNDOS", "5"))
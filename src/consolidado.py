@@ -0,0 +1,132 @@
+import statistics
+
+# Métricas consolidadas del taller calculadas en local a partir de las
+# calificaciones ya recibidas: no dependen de la IA, son deterministas y
+# cuestan microsegundos. Alimentan el informe final (el modelo las comenta,
+# no las inventa) y se sirven tal cual en el modo solo_metricas.
+
+INDICADORES_DESTACADOS = 3  # cuántos indicadores más débiles / más fuertes se listan
+
+
+def _redondear(valor):
+    return round(valor, 2)
+
+
+def _calificaciones(evaluaciones):
+    """(modelo, indicador, calificacion) de las evaluaciones con una nota 1-5 válida"""
+    notas = []
+    for ev in evaluaciones or []:
+        if not isinstance(ev, dict):
+            continue
+        nota = ev.get("calificacion")
+        if isinstance(nota, bool) or not isinstance(nota, (int, float)) or not 1 <= nota <= 5:
+            continue
+        notas.append((ev.get("modelo", "Sin modelo"), ev.get("indicador", "Sin indicador"), float(nota)))
+    return notas
+
+
+def _resumen(valores):
+    return {
+        "promedio": _redondear(statistics.fmean(valores)),
+        "desviacion_estandar": _redondear(statistics.pstdev(valores)),
+        "total_indicadores": len(valores),
+    }
+
+
+def promedio(evaluaciones):
+    """Promedio de un apartado a partir de sus evaluaciones (None si no trae calificaciones)"""
+    notas = [nota for _, _, nota in _calificaciones(evaluaciones)]
+    return _redondear(statistics.fmean(notas)) if notas else None
+
+
+def _por_indicador(notas):
+    agrupadas = {}
+    for modelo, indicador, nota in notas:
+        agrupadas.setdefault((modelo, indicador), []).append(nota)
+    return {clave: statistics.fmean(valores) for clave, valores in agrupadas.items()}
+
+
+def consolidar(objetivo, actividades):
+    """
+    objetivo: {"texto", "evaluaciones"}; actividades: [{"nombre", "evaluaciones"}].
+    El promedio general pondera cada apartado por los indicadores que tiene
+    evaluados, así un apartado cortado por el plazo pesa menos que uno completo.
+    """
+    apartados = [("objetivo", (objetivo or {}).get("texto", "Objetivo"), _calificaciones((objetivo or {}).get("evaluaciones")))]
+    apartados += [("actividad", act.get("nombre", "Actividad"), _calificaciones(act.get("evaluaciones")))
+                  for act in actividades or []]
+    todas = [n for _, _, notas in apartados for n in notas]
+    if not todas:
+        return {"promedio_general": 0, "promedio": 0, "total_indicadores": 0}
+
+    valores = [nota for _, _, nota in todas]
+    por_modelo = {}
+    for modelo, _, nota in todas:
+        por_modelo.setdefault(modelo, []).append(nota)
+
+    indicadores = [
+        {"modelo": modelo, "indicador": indicador, "promedio": _redondear(media)}
+        for (modelo, indicador), media in sorted(_por_indicador(todas).items())
+    ]
+    # Empates: orden alfabético por modelo e indicador, para que dos llamadas den lo mismo
+    debiles = sorted(indicadores, key=lambda i: (i["promedio"], i["modelo"], i["indicador"]))
+    fuertes = sorted(indicadores, key=lambda i: (-i["promedio"], i["modelo"], i["indicador"]))
+
+    general = _redondear(statistics.fmean(valores))
+    return {
+        "promedio_general": general,
+        "promedio": general,  # nombre que ya leen los clientes en metricas_consolidadas
+        "desviacion_estandar": _redondear(statistics.pstdev(valores)),
+        "minimo": min(valores),
+        "maximo": max(valores),
+        "total_indicadores": len(valores),
+        "por_apartado": [dict(_resumen([n for _, _, n in notas]), tipo=tipo, apartado=nombre)
+                         for tipo, nombre, notas in apartados if notas],
+        "por_modelo": {modelo: _resumen(notas) for modelo, notas in sorted(por_modelo.items())},
+        "por_indicador": indicadores,
+        "indicadores_mas_debiles": debiles[:INDICADORES_DESTACADOS],
+        "indicadores_mas_fuertes": fuertes[:INDICADORES_DESTACADOS],
+        "brechas_objetivo_actividad": brechas(apartados[0][2], [n for tipo, _, notas in apartados[1:] for n in notas]),
+    }
+
+
+def brechas(notas_objetivo, notas_actividades):
+    """
+    Diferencia actividad - objetivo en cada indicador que tienen en común
+    (positiva: las actividades rinden más de lo que promete el objetivo),
+    de la mayor a la menor en valor absoluto.
+    """
+    if not notas_objetivo or not notas_actividades:
+        return None
+    objetivo = _por_indicador(notas_objetivo)
+    actividades = _por_indicador(notas_actividades)
+    por_indicador = [
+        {"modelo": modelo, "indicador": indicador, "objetivo": _redondear(objetivo[(modelo, indicador)]),
+         "actividades": _redondear(actividades[(modelo, indicador)]),
+         "brecha": _redondear(actividades[(modelo, indicador)] - objetivo[(modelo, indicador)])}
+        for modelo, indicador in sorted(objetivo.keys() & actividades.keys())
+    ]
+    por_indicador.sort(key=lambda b: -abs(b["brecha"]))
+    return {
+        "promedio": _redondear(statistics.fmean(n for _, _, n in notas_actividades)
+                               - statistics.fmean(n for _, _, n in notas_objetivo)),
+        "por_indicador": por_indicador,
+    }
+
+
+def formatear(metricas_totales):
+    """Resumen compacto de las métricas para el prompt del informe"""
+    if not metricas_totales.get("total_indicadores"):
+        return "Sin calificaciones."
+    m = metricas_totales
+    lineas = [f"Promedio general {m['promedio_general']}/5 (desviación {m['desviacion_estandar']}, "
+              f"{m['total_indicadores']} indicadores, rango {m['minimo']:g}-{m['maximo']:g})"]
+    lineas += [f"- {a['apartado']}: {a['promedio']} (desviación {a['desviacion_estandar']})" for a in m["por_apartado"]]
+    lineas += [f"- Modelo {modelo}: {r['promedio']}" for modelo, r in m["por_modelo"].items()]
+    lineas.append("Más débiles: " + ", ".join(f"{i['indicador']} ({i['promedio']})" for i in m["indicadores_mas_debiles"]))
+    lineas.append("Más fuertes: " + ", ".join(f"{i['indicador']} ({i['promedio']})" for i in m["indicadores_mas_fuertes"]))
+    if m["brechas_objetivo_actividad"]:
+        b = m["brechas_objetivo_actividad"]
+        mayores = ", ".join(f"{x['indicador']} ({x['brecha']:+g})" for x in b["por_indicador"][:INDICADORES_DESTACADOS])
+        lineas.append(f"Brecha actividad - objetivo: {b['promedio']:+g}" + (f"; mayores: {mayores}" if mayores else ""))
+    return "\n    ".join(lineas)
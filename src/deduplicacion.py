@@ -0,0 +1,267 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from src import config, metricas, puntos_control
+from src.cancelacion import PlazoAgotado
+from src.almacen import conectar
+
+# Single-flight: si llega una evaluación idéntica a otra que todavía está en
+# curso (doble clic, reintento del frontend), la segunda no llama a la IA:
+# se engancha a la primera, recibe sus mismos eventos y su mismo resultado.
+# El registro vive en SQLite, así que funciona entre workers de gunicorn. El
+# dueño deja un latido; si desaparece, el primero que espera toma el relevo.
+# Quien espera respeta su propio plazo: al vencer deja de esperar aunque el
+# dueño siga calculando.
+
+INTERVALO_SONDEO = 0.2
+_PURGA_SEGUNDOS = 3600
+# Los eventos y el resultado del dueño se escriben desde este único hilo: la
+# evaluación no espera a SQLite por cada evento (ni bloquea el event loop en
+# la versión async) y, al ser uno solo, todo se guarda numerado y en orden
+_escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vuelo_eventos")
+
+
+def _db():
+    conn = conectar("vuelos")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vuelos (
+            clave TEXT PRIMARY KEY,
+            dueno TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            resultado TEXT,
+            actualizado REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vuelo_eventos (
+            clave TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            evento TEXT NOT NULL,
+            PRIMARY KEY (clave, n)
+        )
+    """)
+    return conn
+
+
+def _reclamar(clave, dueno):
+    """
+    True si esta petición pasa a ser la dueña del cálculo: no hay otro en
+    curso, el anterior se canceló o falló, su dueño dejó de dar latidos o
+    su resultado ya es demasiado viejo para reutilizarlo.
+    """
+    conn = _db()
+    ahora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        fila = conn.execute("SELECT estado, actualizado FROM vuelos WHERE clave = ?", (clave,)).fetchone()
+        libre = (
+            fila is None
+            or fila[0] in ("cancelado", "error")
+            or (fila[0] == "en_curso" and ahora - fila[1] > config.VUELO_SEGUNDOS_SIN_LATIDO)
+            or (fila[0] == "listo" and ahora - fila[1] > config.VUELO_RETENCION_SEGUNDOS)
+        )
+        if libre:
+            conn.execute("INSERT OR REPLACE INTO vuelos (clave, dueno, estado, resultado, actualizado) "
+                         "VALUES (?, ?, 'en_curso', NULL, ?)", (clave, dueno, ahora))
+            conn.execute("DELETE FROM vuelo_eventos WHERE clave = ?", (clave,))
+            conn.execute("DELETE FROM vuelos WHERE actualizado < ? AND estado != 'en_curso'",
+                         (ahora - _PURGA_SEGUNDOS,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if libre and fila is not None and fila[0] == "en_curso":
+        print("♻️  Evaluación duplicada sin latido: se toma el relevo.")
+    return libre
+
+
+class _Vuelo:
+    """Lado del dueño: anota eventos, mantiene el latido y publica el resultado"""
+
+    def __init__(self, clave, dueno):
+        self.clave = clave
+        self.dueno = dueno
+        self.n = 0  # sólo lo toca el hilo _escritor
+        self._fin = threading.Event()
+        threading.Thread(target=self._latir, daemon=True, name="vuelo_latido").start()
+
+    def _latir(self):
+        while not self._fin.wait(config.VUELO_LATIDO_SEGUNDOS):
+            try:
+                _db().execute("UPDATE vuelos SET actualizado = ? WHERE clave = ? AND dueno = ?",
+                              (time.time(), self.clave, self.dueno))
+            except Exception as e:
+                print(f"⚠️ No se pudo renovar el latido de la evaluación: {e}")
+
+    def anotar(self, evento):
+        self.n += 1
+        try:
+            _db().execute("INSERT INTO vuelo_eventos (clave, n, evento) VALUES (?, ?, ?)",
+                          (self.clave, self.n, json.dumps(evento, ensure_ascii=False, default=str)))
+        except Exception as e:
+            print(f"⚠️ No se pudo compartir el evento: {e}")
+
+    def terminar(self, estado, resultado=None):
+        self._fin.set()
+        try:
+            _db().execute(
+                "UPDATE vuelos SET estado = ?, resultado = ?, actualizado = ? WHERE clave = ? AND dueno = ?",
+                (estado, json.dumps(resultado, ensure_ascii=False, default=str) if resultado is not None else None,
+                 time.time(), self.clave, self.dueno)
+            )
+        except Exception as e:
+            print(f"⚠️ No se pudo publicar el resultado compartido: {e}")
+
+    def emisor(self, al_evento):
+        """El evento llega ya al cliente propio; quienes esperan lo leen cuando el _escritor lo guarda"""
+        def emitir(evento):
+            if al_evento:
+                al_evento(evento)
+            _escritor.submit(self.anotar, evento)
+        return emitir
+
+    def publicar(self, estado, resultado=None):
+        """terminar() en el hilo _escritor, detrás de los eventos pendientes; devuelve su futuro"""
+        return _escritor.submit(self.terminar, estado, resultado)
+
+
+def _estado_final(cancelacion, resultado):
+    """Un resultado a medias (cancelado, sin plazo) no se comparte: quien espera retoma el cálculo"""
+    if cancelacion is not None and cancelacion.is_set():
+        return "cancelado"
+    return "listo" if puntos_control.esta_completo(resultado) else "cancelado"
+
+
+def _consultar(clave, visto):
+    """
+    Un sondeo del lado de quien espera: devuelve (eventos nuevos, estado,
+    resultado). estado es "listo", "relevo" (hay que reclamar el cálculo)
+    o None (seguir esperando).
+    """
+    conn = _db()
+    eventos = conn.execute("SELECT n, evento FROM vuelo_eventos WHERE clave = ? AND n > ? ORDER BY n",
+                           (clave, visto)).fetchall()
+    fila = conn.execute("SELECT estado, resultado, actualizado FROM vuelos WHERE clave = ?", (clave,)).fetchone()
+    if fila is None or fila[0] in ("cancelado", "error"):
+        return eventos, "relevo", None
+    if fila[0] == "listo":
+        return eventos, "listo", json.loads(fila[1]) if fila[1] else None
+    if time.time() - fila[2] > config.VUELO_SEGUNDOS_SIN_LATIDO:
+        return eventos, "relevo", None
+    return eventos, None, None
+
+
+def _reenviar(eventos, visto, al_evento):
+    for n, evento in eventos:
+        visto = n
+        if al_evento:
+            al_evento(json.loads(evento))
+    return visto
+
+
+def _reiniciar_eventos(visto, al_evento):
+    """
+    El nuevo cálculo numera sus eventos desde el principio y en otro orden:
+    si ya se reenvió algo, el cliente recibe un evento 'reinicio' para
+    descartarlo antes de la repetición. Devuelve el nuevo 'visto'.
+    """
+    if visto and al_evento:
+        al_evento({"evento": "reinicio", "motivo": "relevo"})
+    return 0
+
+
+def _plazo_vencido(cancelacion):
+    if cancelacion is not None and cancelacion.vencido():
+        metricas.incrementar("deduplicacion_peticiones_total", resultado="plazo_agotado")
+        raise PlazoAgotado(f"Evaluación {cancelacion.id}: plazo agotado esperando un cálculo compartido")
+
+
+def _seguir(clave, visto, al_evento):
+    """Sondeo + reenvío de sus eventos; devuelve (estado, resultado, visto)"""
+    eventos, estado, resultado = _consultar(clave, visto)
+    return estado, resultado, _reenviar(eventos, visto, al_evento)
+
+
+def compartir(clave, calcular, al_evento=None, cancelacion=None):
+    """
+    Ejecuta calcular(al_evento) salvo que ya haya un cálculo idéntico en
+    curso; en ese caso espera su resultado reenviando sus eventos. Devuelve
+    None si esta petición se cancela mientras espera y lanza PlazoAgotado
+    si se le acaba el plazo esperando.
+    """
+    if not config.DEDUPLICACION_ACTIVA:
+        return calcular(al_evento)
+
+    dueno = uuid.uuid4().hex
+    visto = 0
+    espero = False
+    while True:
+        if _reclamar(clave, dueno):
+            metricas.incrementar("deduplicacion_peticiones_total", resultado="relevo" if espero else "propia")
+            vuelo = _Vuelo(clave, dueno)
+            try:
+                resultado = calcular(vuelo.emisor(al_evento))
+            except Exception:
+                vuelo.publicar("error").result()
+                raise
+            vuelo.publicar(_estado_final(cancelacion, resultado), resultado).result()
+            return resultado
+
+        print("🔗 Evaluación idéntica en curso: se reutiliza su resultado.")
+        espero = True
+        while True:
+            if cancelacion is not None and cancelacion.is_set():
+                return None
+            _plazo_vencido(cancelacion)
+            estado, resultado, visto = _seguir(clave, visto, al_evento)
+            if estado == "listo":
+                metricas.incrementar("deduplicacion_peticiones_total", resultado="compartida")
+                return resultado
+            if estado == "relevo":
+                visto = _reiniciar_eventos(visto, al_evento)
+                break
+            time.sleep(INTERVALO_SONDEO)
+
+
+async def compartir_async(clave, calcular, al_evento=None, cancelacion=None):
+    """
+    Igual que compartir(), pero calcular(al_evento) devuelve una corrutina;
+    las esperas ceden el loop y las lecturas y escrituras en SQLite van a hilos.
+    """
+    if not config.DEDUPLICACION_ACTIVA:
+        return await calcular(al_evento)
+
+    dueno = uuid.uuid4().hex
+    visto = 0
+    espero = False
+    while True:
+        if await asyncio.to_thread(_reclamar, clave, dueno):
+            metricas.incrementar("deduplicacion_peticiones_total", resultado="relevo" if espero else "propia")
+            vuelo = _Vuelo(clave, dueno)
+            try:
+                resultado = await calcular(vuelo.emisor(al_evento))
+            except Exception:
+                await asyncio.wrap_future(vuelo.publicar("error"))
+                raise
+            estado = await asyncio.to_thread(_estado_final, cancelacion, resultado)
+            await asyncio.wrap_future(vuelo.publicar(estado, resultado))
+            return resultado
+
+        print("🔗 Evaluación idéntica en curso: se reutiliza su resultado.")
+        espero = True
+        while True:
+            if cancelacion is not None and await cancelacion.is_set_async():
+                return None
+            _plazo_vencido(cancelacion)
+            eventos, estado, resultado = await asyncio.to_thread(_consultar, clave, visto)
+            visto = _reenviar(eventos, visto, al_evento)
+            if estado == "listo":
+                metricas.incrementar("deduplicacion_peticiones_total", resultado="compartida")
+                return resultado
+            if estado == "relevo":
+                visto = _reiniciar_eventos(visto, al_evento)
+                break
+            await asyncio.sleep(INTERVALO_SONDEO)
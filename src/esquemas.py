@@ -0,0 +1,290 @@
+import json
+import re
+from src import config, json_parcial, llm_gateway, metricas, prompts
+
+# Esquema estricto de cada tipo de respuesta (indicador, introducción,
+# feedback, informe final). Una respuesta que no lo cumple no se tira:
+# primero se repara en local (vallas ```json, comas colgantes, JSON cortado,
+# "4/5" -> 4, claves con otra capitalización) y, si aún faltan campos o
+# vienen mal, se piden SÓLO esos en una llamada corta que continúa la
+# conversación. Cuesta unas decenas de tokens en vez de repetir la evaluación.
+
+_FALTA = object()
+
+
+def _texto(valor):
+    if isinstance(valor, str) and valor.strip():
+        return valor
+    raise ValueError("debe ser un texto no vacío")
+
+
+def _nivel(valor):
+    """Calificación 1-5; acepta 4.0, "4", "4/5" o "Nivel 4" """
+    if isinstance(valor, bool):
+        raise ValueError("debe ser un entero de 1 a 5")
+    if isinstance(valor, (int, float)) and float(valor).is_integer():
+        nivel = int(valor)
+    elif isinstance(valor, str) and re.search(r"\d", valor):
+        nivel = int(re.search(r"\d+", valor).group())
+    else:
+        raise ValueError("debe ser un entero de 1 a 5")
+    if not 1 <= nivel <= 5:
+        raise ValueError("debe ser un entero de 1 a 5")
+    return nivel
+
+
+def _lista_textos(valor):
+    if isinstance(valor, str) and valor.strip():
+        valor = [valor]
+    if isinstance(valor, list) and valor and all(isinstance(v, str) and v.strip() for v in valor):
+        return valor
+    raise ValueError("debe ser una lista de textos")
+
+
+def _ruta_de_accion(valor):
+    """Lista de {"estrategia", "fundamentacion"}; un texto suelto pasa a ser la estrategia"""
+    if not isinstance(valor, list) or not valor:
+        raise ValueError("debe ser una lista de estrategias")
+    pasos = []
+    for paso in valor:
+        if isinstance(paso, str) and paso.strip():
+            paso = {"estrategia": paso}
+        if not isinstance(paso, dict) or not isinstance(paso.get("estrategia"), str):
+            raise ValueError("cada paso necesita 'estrategia'")
+        pasos.append(paso)
+    return pasos
+
+
+def _es_rechazo(datos):
+    """El filtro de seguridad del prompt: {"es_valido": false, "mensaje_error": ...} también es válido"""
+    return datos.get("es_valido") is False
+
+
+def _indicador(tipo):
+    campos = [(("calificacion",), _nivel, "<Número entero 1-5>", 10)]
+    campos += [(("analisis", campo), _texto, descripcion, 120)
+               for campo, descripcion in prompts.CAMPOS_ANALISIS[tipo].items()]
+    return {"campos": campos, "alternativa": _es_rechazo}
+
+
+# Cada campo: (ruta dentro del JSON, validador que normaliza o lanza ValueError,
+# descripción para pedirlo de nuevo, tokens de respuesta que se le dan)
+ESQUEMAS = {
+    "indicador_objetivo": _indicador("objetivo"),
+    "indicador_actividad": _indicador("actividad"),
+    "introduccion": {
+        "campos": [
+            (("analisis_disciplinar",), _texto, "Tu valoración desde la perspectiva educativa (150-200 palabras).", 350),
+            (("frases_discurso",), _lista_textos, ["Frase 1", "Frase 2", "Frase 3"], 150),
+        ],
+        "alternativa": _es_rechazo,
+    },
+    "feedback": {
+        "campos": [(("comentario_general",), _texto, "Tu análisis en dos párrafos separados por \\n\\n.", 450)],
+    },
+    "informe": {
+        "campos": [
+            (("analisis_final", "sintesis_ejecutiva"), _texto, "Ensayo sobre la solidez del taller.", 500),
+            (("analisis_final", "diagnostico_coherencia"), _texto, "Análisis de la coherencia objetivo-actividad.", 450),
+            (("analisis_final", "ruta_de_accion"), _ruta_de_accion,
+             [{"estrategia": "Técnica pedagógica concreta", "fundamentacion": "Vínculo con la edad"}], 400),
+        ],
+    },
+}
+
+
+def esquema_indicador(tipo):
+    return "indicador_actividad" if tipo == "actividad" else "indicador_objetivo"
+
+
+# --- REPARACIÓN LOCAL ---
+
+def _sin_comas_colgantes(texto):
+    """Quita las comas justo antes de } o ] que no estén dentro de una cadena"""
+    salida, en_cadena, escape = [], False, False
+    for i, c in enumerate(texto):
+        if en_cadena:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                en_cadena = False
+        elif c == '"':
+            en_cadena = True
+        elif c == "," and texto[i + 1:].lstrip()[:1] in ("}", "]"):
+            continue
+        salida.append(c)
+    return "".join(salida)
+
+
+def cargar(texto):
+    """(dict, reparado): el JSON de la respuesta, arreglando en local lo que se pueda"""
+    texto = texto or ""
+    try:
+        datos = json.loads(texto)
+        if isinstance(datos, dict):
+            return datos, False
+    except ValueError:
+        pass
+    limpio = texto.replace("```json", "").replace("```", "").strip()
+    inicio, fin = limpio.find("{"), limpio.rfind("}") + 1
+    candidatos = [limpio[inicio:fin]] if inicio >= 0 and fin > inicio else []
+    for candidato in candidatos + [_sin_comas_colgantes(c) for c in candidatos]:
+        try:
+            datos = json.loads(candidato, strict=False)
+            if isinstance(datos, dict):
+                return datos, True
+        except ValueError:
+            pass
+    # JSON cortado (tope de tokens, stream interrumpido): lo que haya llegado
+    return json_parcial.rescatar(_sin_comas_colgantes(limpio)), True
+
+
+def _clave(clave):
+    return str(clave).strip().lower().replace(" ", "_")
+
+
+def _leer(datos, ruta):
+    for parte in ruta:
+        if not isinstance(datos, dict):
+            return _FALTA
+        if parte not in datos:
+            parecida = next((k for k in datos if _clave(k) == parte), None)
+            if parecida is None:
+                return _FALTA
+            datos[parte] = datos.pop(parecida)
+        datos = datos[parte]
+    return datos
+
+
+def _escribir(datos, ruta, valor):
+    for parte in ruta[:-1]:
+        if not isinstance(datos.get(parte), dict):
+            datos[parte] = {}
+        datos = datos[parte]
+    datos[ruta[-1]] = valor
+
+
+def revisar(nombre, datos):
+    """
+    Normaliza 'datos' según el esquema. Devuelve (datos, invalidos, cambiado):
+    invalidos son los campos que faltan o no se pudieron arreglar.
+    """
+    esquema = ESQUEMAS[nombre]
+    if esquema.get("alternativa") and esquema["alternativa"](datos):
+        return datos, [], False
+    invalidos = []
+    original = json.dumps(datos, sort_keys=True, default=str)
+    for campo in esquema["campos"]:
+        ruta, validar = campo[0], campo[1]
+        valor = _leer(datos, ruta)
+        if len(ruta) > 1 and isinstance(_leer(datos, ruta[:-1]), str):
+            # "analisis": "texto" -> el texto va al primer campo del análisis
+            _escribir(datos, ruta[:-1], {ruta[-1]: _leer(datos, ruta[:-1])})
+            valor = _leer(datos, ruta)
+        try:
+            normalizado = validar(None if valor is _FALTA else valor)
+        except (ValueError, TypeError):
+            invalidos.append(campo)
+            continue
+        if normalizado != valor:
+            _escribir(datos, ruta, normalizado)
+    return datos, invalidos, json.dumps(datos, sort_keys=True, default=str) != original
+
+
+# --- REPARACIÓN CON UNA LLAMADA CORTA ---
+
+def mensajes_reparacion(mensajes, texto, invalidos):
+    """La conversación original + la respuesta fallida + la petición de sólo los campos que faltan"""
+    plantilla = {}
+    for ruta, _, descripcion, _ in invalidos:
+        _escribir(plantilla, ruta, descripcion)
+    nombres = ", ".join(".".join(ruta) for ruta, _, _, _ in invalidos)
+    return list(mensajes) + [
+        {"role": "assistant", "content": texto or "{}"},
+        {"role": "user", "content": (
+            f"Faltan o no son válidos estos campos de tu respuesta: {nombres}. "
+            "Responde ÚNICAMENTE con un JSON que contenga solo esos campos, con este formato: "
+            + json.dumps(plantilla, ensure_ascii=False)
+        )},
+    ]
+
+
+def _preparar(nombre, comp):
+    """
+    Repara en local. Devuelve (comp, pendiente): pendiente es None si ya no
+    hace falta nada más, o (texto, datos, invalidos) si hay que pedir campos.
+    """
+    if comp is None:
+        return None, None
+    texto = comp.choices[0].message.content or ""
+    datos, reparado = cargar(texto)
+    datos, invalidos, cambiado = revisar(nombre, datos)
+    if not invalidos:
+        if reparado or cambiado:
+            metricas.incrementar("llm_reparaciones_total", esquema=nombre, via="local", resultado="ok")
+            _reescribir(comp, datos)
+        return comp, None
+    if not config.REPARACION_LLAMADA_ACTIVA or len(invalidos) == len(ESQUEMAS[nombre]["campos"]):
+        # Sin ningún campo aprovechable pedirlo todo sería repetir la evaluación
+        print(f"⚠️ Respuesta {nombre} fuera de esquema y sin campos aprovechables.")
+        metricas.incrementar("llm_reparaciones_total", esquema=nombre, via="local", resultado="fallida")
+        return comp, None
+    print(f"🩹 Respuesta {nombre} incompleta: se piden sólo {', '.join('.'.join(c[0]) for c in invalidos)}.")
+    return comp, (texto, datos, invalidos)
+
+
+def _completar(nombre, comp, pendiente, respuesta):
+    texto, datos, invalidos = pendiente
+    nuevos = cargar(respuesta.choices[0].message.content or "")[0] if respuesta else {}
+    for ruta, _, _, _ in invalidos:
+        # El modelo a veces devuelve el campo suelto, sin la sección que lo contiene
+        valor = _leer(nuevos, ruta)
+        valor = _leer(nuevos, ruta[-1:]) if valor is _FALTA else valor
+        if valor is not _FALTA:
+            _escribir(datos, ruta, valor)
+    datos, invalidos, _ = revisar(nombre, datos)
+    resultado = "fallida" if invalidos else "ok"
+    metricas.incrementar("llm_reparaciones_total", esquema=nombre, via="llamada", resultado=resultado)
+    if not invalidos:
+        _reescribir(comp, datos)
+    return comp
+
+
+def _reescribir(comp, datos):
+    comp.choices[0].message.content = json.dumps(datos, ensure_ascii=False)
+
+
+def _argumentos_reparacion(pendiente, mensajes, cancelacion, etiquetas):
+    _, _, invalidos = pendiente
+    return {
+        "messages": mensajes_reparacion(mensajes, pendiente[0], invalidos),
+        "temperature": 0.0,
+        "max_tokens": 20 + sum(c[3] for c in invalidos),
+        "cancelacion": cancelacion,
+        "etiqueta": "Reparación",
+        "reintentos": 2,
+        "etiquetas": dict(etiquetas or {}, indicador="_reparacion"),
+    }
+
+
+def reparar(nombre, comp, mensajes, cancelacion=None, etiquetas=None):
+    """
+    Devuelve la respuesta con su contenido ya conforme al esquema 'nombre'
+    (reparado en local o completado con una llamada corta) o, si no hubo
+    forma, la respuesta original para que el llamador aplique su fallback.
+    """
+    comp, pendiente = _preparar(nombre, comp)
+    if pendiente is None:
+        return comp
+    respuesta = llm_gateway.llamar(**_argumentos_reparacion(pendiente, mensajes, cancelacion, etiquetas))
+    return _completar(nombre, comp, pendiente, respuesta)
+
+
+async def reparar_async(nombre, comp, mensajes, cancelacion=None, etiquetas=None):
+    comp, pendiente = _preparar(nombre, comp)
+    if pendiente is None:
+        return comp
+    respuesta = await llm_gateway.llamar_async(**_argumentos_reparacion(pendiente, mensajes, cancelacion, etiquetas))
+    return _completar(nombre, comp, pendiente, respuesta)
@@ -1,10 +1,10 @@
 import collections
 import json
-import openai
-import time  
+import time
 from src.loaders import cargar_perfil_edad, cargar_modelos_poblacion
 from src.feedback import generar_comentario_global
-from src import config
+from src import config, cache, catalogo, esquemas, json_parcial, llm_gateway, metricas, prefiltro, prompts, puntos_control
+from src.motor_evaluacion import listar_indicadores, ejecutar_indicadores, esta_cancelado, plazo_vencido, reservar
 
 def es_contenido_invalido(texto):
     t = texto.strip()
@@ -26,38 +26,29 @@ def es_contenido_invalido(texto):
             
     return None
 
-def llamada_segura_groq(messages, model="llama-3.1-8b-instant", temperature=0.1, retries=5):
-    for i in range(retries):
-        try:
-            comp = openai.ChatCompletion.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                response_format={"type": "json_object"}
-            )
-            return comp
-        except openai.error.RateLimitError as e:
-            wait_time = (i + 1) * 5  # Espera progresiva: 5s, 10s, 15s...
-            print(f"⚠️ Rate Limit (Intento {i+1}/{retries}). Pausando {wait_time}s...")
-            time.sleep(wait_time)
-        except Exception as e:
-            print(f"❌ Error desconocido API: {str(e)}")
-            return None
-    
-    print("❌ Se agotaron los reintentos con Groq.")
-    return None
-
-#FUNCIÓN DE EVALUACIÓN DE INTRODUCCIÓN 
 #FUNCIÓN DE EVALUACIÓN DE INTRODUCCIÓN 
-def evaluar_introduccion(contenido, nombre_apartado):
-    error_previo = es_contenido_invalido(contenido)
+def resolver_introduccion_local(contenido):
+    """
+    Validación previa y cache. Devuelve (resultado, clave_cache); si el
+    resultado es None hay que consultar a la IA.
+    """
+    with metricas.cronometro("evaluacion_etapa_segundos", tipo="introduccion", etapa="validacion"):
+        error_previo = es_contenido_invalido(contenido)
     if error_previo:
         return {
             "es_valido": False, 
             "mensaje_error": error_previo,
             "analisis_disciplinar": "Evaluación cancelada por contenido no apto."
-        }
+        }, None
+
+    clave_cache = cache.clave("introduccion", cache.normalizar(prompts.contenido_para_prompt(contenido, "introduccion")))
+    guardado = cache.obtener(clave_cache)
+    if guardado:
+        print("⚡ Introducción servida desde cache.")
+    return guardado, clave_cache
 
+def mensajes_introduccion(contenido):
+    texto = prompts.contenido_para_prompt(contenido, "introduccion")
     prompt_intro = f'''
     Actúa como un Coordinador de Educación y Mediación en Museos.
     Tu misión es ENTRENAR a los guías. Estás validando el MANUAL DEL GUÍA (Introducción).
@@ -65,7 +56,7 @@ def evaluar_introduccion(contenido, nombre_apartado):
     FASE 1: FILTRO DE SEGURIDAD ---
     Antes de evaluar, analiza el texto del usuario:
     """
-    {contenido[:3500]}
+    {texto}
     """
     Si el texto NO tiene sentido educativo, o es una lista de palabras inconexas, 
     responde ÚNICAMENTE este JSON exacto:
@@ -100,17 +91,19 @@ def evaluar_introduccion(contenido, nombre_apartado):
       "frases_discurso": ["Frase 1", "Frase 2", "Frase 3"]
     }}
     '''
-  
 
     # Usamos un System Message más agresivo para forzar la Fase 2
-    comp = llamada_segura_groq(
-        messages=[
-            {"role": "system", "content": "Eres un Coordinador de Museos. Si el texto es válido, DEBES ejecutar la FASE 2 y entregar el análisis disciplinar. No te detengas en la validación."},
-            {"role": "user", "content": prompt_intro}
-        ],
-        temperature=0.2 # Elevamos ligeramente para evitar respuestas perezosas
+    return prompts.construir(
+        "Eres un Coordinador de Museos. Si el texto es válido, DEBES ejecutar la FASE 2 y entregar el análisis disciplinar. No te detengas en la validación.",
+        prompt_intro,
+        "introduccion"
     )
 
+def procesar_respuesta_introduccion(comp, clave_cache):
+    with metricas.cronometro("evaluacion_etapa_segundos", tipo="introduccion", etapa="parseo"):
+        return _interpretar_introduccion(comp, clave_cache)
+
+def _interpretar_introduccion(comp, clave_cache):
     if comp:
         try:
             raw_content = comp.choices[0].message.content.strip()
@@ -126,159 +119,438 @@ def evaluar_introduccion(contenido, nombre_apartado):
             if "analisis_disciplinar" in res_json:
                 res_json["es_valido"] = True
                 res_json["mensaje_error"] = ""
+                cache.guardar(clave_cache, res_json)
             
             return res_json
         except Exception as e:
             print(f"❌ Error parseando JSON de Introducción: {e}")
+            metricas.incrementar("llm_parseo_fallos_total", tipo="introduccion")
             return {"es_valido": False, "mensaje_error": "Error en el formato de la respuesta de IA."}
             
     return {"es_valido": False, "mensaje_error": "No se pudo conectar con el servicio de evaluación."}
-# FUNCIÓN DE EVALUACIÓN DE OBJETIVOS
-def evaluar_objetivo(contenido, nombre_apartado, poblacion, rango):
+
+def evaluar_introduccion(contenido, nombre_apartado, cancelacion=None):
+    resultado, clave_cache = resolver_introduccion_local(contenido)
+    if resultado:
+        return resultado
+
+    mensajes = mensajes_introduccion(contenido)
+    comp = llm_gateway.llamar(
+        mensajes,
+        temperature=0.2, # Elevamos ligeramente para evitar respuestas perezosas
+        cancelacion=cancelacion,
+        etiquetas={"tipo": "introduccion"}
+    )
+    comp = esquemas.reparar("introduccion", comp, mensajes, cancelacion, {"tipo": "introduccion"})
+    return procesar_respuesta_introduccion(comp, clave_cache)
+
+# --- HELPERS DE INDICADORES ---
+def procesar_respuesta_indicador(comp, modelo_nombre, ind_nombre, tipo="objetivo"):
+    """Convierte la respuesta de la IA en la entrada de 'evaluaciones' (o None si falla)"""
+    if not comp:
+        return None
+    with metricas.cronometro("evaluacion_etapa_segundos", tipo=tipo, etapa="parseo"):
+        return _interpretar_indicador(comp, modelo_nombre, ind_nombre, tipo)
+
+def _interpretar_indicador(comp, modelo_nombre, ind_nombre, tipo):
+    try:
+        content_resp = comp.choices[0].message.content.replace("```json", "").replace("```", "").strip()
+        try:
+            res_json = json.loads(content_resp)
+        except ValueError:
+            # Respuesta cortada por el tope de tokens: vale si al menos llegó la calificación
+            res_json = json_parcial.rescatar(content_resp)
+            if "calificacion" not in res_json:
+                raise
+            print(f"✂️ {ind_nombre}: respuesta incompleta, se conserva la calificación.")
+        cal = int(res_json.get('calificacion', 1))
+        analisis = res_json.get('analisis', {})
+        if isinstance(analisis, str): 
+            analisis = {"razonamiento": analisis}
+        print(f"✅ {ind_nombre} evaluado.")
+        return {
+            "modelo": modelo_nombre,
+            "indicador": ind_nombre,
+            "calificacion": cal,
+            "analisis": analisis 
+        }
+    except Exception as e: 
+        print(f"Error procesando respuesta JSON en {ind_nombre}: {e}")
+        metricas.incrementar("llm_parseo_fallos_total", tipo=tipo, modelo=modelo_nombre, indicador=ind_nombre)
+        return None
+
+def recolectar_resultados(res_final, resultados):
+    """Agrega los resultados (en orden modelo/indicador) y devuelve sus calificaciones"""
+    calificaciones = []
+    for r in resultados:
+        if r:
+            res_final["evaluaciones"].append(r)
+            calificaciones.append(r["calificacion"])
+    return calificaciones
+
+def emitir(al_evento, evento, **datos):
+    """Notifica un evento parcial (streaming, jobs) si alguien lo escucha"""
+    if al_evento:
+        al_evento({"evento": evento, **datos})
+
+def emisor_texto(al_evento, origen, **datos):
+    """
+    al_texto para el feedback y el informe: cada trozo de texto generado
+    sale como evento 'texto' (origen, campo, texto). None si nadie escucha,
+    y entonces la llamada no se hace en streaming.
+    """
+    if not al_evento:
+        return None
+    return lambda trozo: emitir(al_evento, "texto", origen=origen, **datos, **trozo)
+
+def mensajes_indicador(contenido, perfil, tarea, tipo):
+    """La rúbrica va en el prefijo system compartido; aquí sólo los datos de esta llamada"""
+    modelo_nombre, ind_nombre, def_tec = tarea
+    prompt = f'''
+    {tipo.upper()} A EVALUAR: "{prompts.contenido_para_prompt(contenido, tipo)}"
+    INDICADOR DEL MODELO {modelo_nombre} ({ind_nombre}): {def_tec}
+    CONTEXTO (EDAD): {perfil.get('etapa_cognitiva', '')} ({perfil.get('caracteristicas', '')})
+    '''
+    return prompts.construir(prompts.SISTEMA_INDICADOR[tipo], prompt, tipo)
+
+def mensajes_indicador_objetivo(contenido, perfil, tarea):
+    return mensajes_indicador(contenido, perfil, tarea, "objetivo")
+
+def escucha_indicador(tarea, tipo, al_parcial=None):
+    """
+    Callback de streaming para la llamada de un indicador: avisa con la
+    calificación en cuanto se lee (al_parcial) y pide cortar la lectura al
+    cerrarse el JSON. None si el streaming está desactivado.
+    """
+    if not config.LLM_STREAMING_INDICADORES:
+        return None
+    modelo_nombre, ind_nombre, _ = tarea
+    inicio = time.perf_counter()
+    lector = json_parcial.LectorJSON()
+
+    def al_fragmento(texto):
+        nonlocal lector
+        if not texto.startswith(lector.texto):  # reintento: la respuesta empieza de nuevo
+            lector = json_parcial.LectorJSON()
+        if "calificacion" in lector.alimentar(texto[len(lector.texto):]):
+            metricas.observar("evaluacion_etapa_segundos", time.perf_counter() - inicio,
+                              tipo=tipo, etapa="primera_calificacion")
+            try:
+                cal = int(lector.campos["calificacion"])
+            except (TypeError, ValueError):
+                cal = None
+            if cal is not None and al_parcial:
+                al_parcial({"modelo": modelo_nombre, "indicador": ind_nombre, "calificacion": cal})
+        return lector.completo
+    return al_fragmento
+
+def evaluar_indicador(contenido, perfil, tarea, tipo, cancelacion=None, al_parcial=None):
+    modelo_nombre, ind_nombre, _ = tarea
+    if esta_cancelado(cancelacion):
+        print(f"🛑 Proceso abortado: Saltando indicador {ind_nombre}")
+        return None
+
+    # FUNCIÓN SEGURA
+    mensajes = mensajes_indicador(contenido, perfil, tarea, tipo)
+    etiquetas = {"tipo": tipo, "modelo": modelo_nombre, "indicador": ind_nombre}
+    comp = llm_gateway.llamar(
+        mensajes,
+        temperature=0.0,
+        max_tokens=config.TOKENS_MAX_INDICADOR,
+        cancelacion=cancelacion,
+        etiquetas=etiquetas,
+        al_fragmento=escucha_indicador(tarea, tipo, al_parcial)
+    )
+    # Fuera de esquema: se piden sólo los campos que faltan en vez de perder el indicador
+    comp = esquemas.reparar(esquemas.esquema_indicador(tipo), comp, mensajes, cancelacion, etiquetas)
+    return procesar_respuesta_indicador(comp, modelo_nombre, ind_nombre, tipo)
+
+def evaluar_indicador_objetivo(contenido, perfil, tarea, cancelacion=None, al_parcial=None):
+    return evaluar_indicador(contenido, perfil, tarea, "objetivo", cancelacion, al_parcial)
+
+
+# --- MODO LOTE: UNA LLAMADA POR MODELO PEDAGÓGICO ---
+def agrupar_por_modelo(tareas):
+    """Agrupa las tareas (modelo, indicador, info) conservando el orden original"""
+    grupos = {}
+    for tarea in tareas:
+        grupos.setdefault(tarea[0], []).append(tarea)
+    return list(grupos.values())
+
+def validar_item_lote(item, nombres_validos):
+    """Devuelve (indicador, calificacion, analisis) si el item del lote es válido, o None"""
+    if not isinstance(item, dict):
+        return None
+    nombre = str(item.get('indicador', '')).strip()
+    nombre = next((n for n in nombres_validos if n.lower() == nombre.lower()), None)
+    if not nombre:
+        return None
+    try:
+        cal = int(item.get('calificacion'))
+    except (TypeError, ValueError):
+        return None
+    if cal < 1 or cal > 5:
+        return None
+    analisis = item.get('analisis')
+    if isinstance(analisis, str) and analisis.strip():
+        analisis = {"razonamiento": analisis}
+    if not isinstance(analisis, dict) or not analisis:
+        return None
+    return nombre, cal, analisis
+
+def mensajes_lote(contenido, perfil, grupo, tipo="objetivo"):
+    modelo_nombre = grupo[0][0]
+    bloque_indicadores = "\n\n".join(
+        f"INDICADOR \"{ind_nombre}\":\n{def_tec}"
+        for _, ind_nombre, def_tec in grupo
+    )
+    prompt = f'''
+    MODELO PEDAGÓGICO: {modelo_nombre}
+    TEXTO A EVALUAR: "{prompts.contenido_para_prompt(contenido, tipo)}"
+    CONTEXTO (EDAD): {perfil.get('etapa_cognitiva', '')} ({perfil.get('caracteristicas', '')})
+
+    INDICADORES DEL MODELO:
+    {bloque_indicadores}
+    '''
+    return prompts.construir(prompts.SISTEMA_LOTE[tipo], prompt, tipo)
+
+def procesar_respuesta_lote(comp, grupo, tipo="objetivo"):
+    """Lista alineada con 'grupo' (None en los indicadores que faltan o vienen mal formados)"""
+    with metricas.cronometro("evaluacion_etapa_segundos", tipo=tipo, etapa="parseo"):
+        return _interpretar_lote(comp, grupo, tipo)
+
+def _interpretar_lote(comp, grupo, tipo):
+    modelo_nombre = grupo[0][0]
+    validos = {}
+    if comp:
+        try:
+            content_resp = comp.choices[0].message.content.replace("```json", "").replace("```", "").strip()
+            res_json = json.loads(content_resp)
+            items = res_json if isinstance(res_json, list) else res_json.get('evaluaciones', [])
+            nombres = [ind_nombre for _, ind_nombre, _ in grupo]
+            for item in items:
+                valido = validar_item_lote(item, nombres)
+                if valido and valido[0] not in validos:
+                    validos[valido[0]] = valido
+        except Exception as e:
+            print(f"Error procesando respuesta JSON del lote {modelo_nombre}: {e}")
+
+    resultados = []
+    for _, ind_nombre, _ in grupo:
+        if ind_nombre in validos:
+            _, cal, analisis = validos[ind_nombre]
+            resultados.append({
+                "modelo": modelo_nombre,
+                "indicador": ind_nombre,
+                "calificacion": cal,
+                "analisis": analisis
+            })
+        else:
+            resultados.append(None)
+            if comp:
+                metricas.incrementar("llm_parseo_fallos_total", tipo=tipo, modelo=modelo_nombre, indicador=ind_nombre)
+    print(f"✅ Lote {modelo_nombre}: {len(validos)}/{len(grupo)} indicadores válidos.")
+    return resultados
+
+def evaluar_modelo_en_lote(contenido, perfil, grupo, tipo="objetivo", cancelacion=None):
+    """
+    Califica todos los indicadores de un modelo en una sola llamada.
+    Devuelve una lista alineada con 'grupo' (None en los indicadores que
+    faltan o vienen mal formados).
+    """
+    if esta_cancelado(cancelacion):
+        return [None] * len(grupo)
+
+    comp = llm_gateway.llamar(
+        mensajes_lote(contenido, perfil, grupo, tipo),
+        temperature=0.0,
+        cancelacion=cancelacion,
+        etiquetas={"tipo": tipo, "modelo": grupo[0][0], "indicador": "_lote"}
+    )
+    return procesar_respuesta_lote(comp, grupo, tipo)
+
+def clave_apartado(contenido, nombre_apartado, poblacion, rango, en_lote=None):
+    """Dos peticiones con esta misma clave producen la misma evaluación"""
+    return cache.clave("apartado", cache.normalizar(contenido), cache.normalizar(nombre_apartado),
+                       detectar_tipo_apartado(nombre_apartado, contenido), poblacion,
+                       catalogo.normalizar_rango(rango), en_lote)
+
+def clave_indicador(contenido, perfil, tarea, tipo):
+    # def_tec entra en la clave: si el catálogo se recarga con otra definición
+    # del indicador, sus calificaciones guardadas dejan de servirse
+    modelo_nombre, ind_nombre, def_tec = tarea
+    return cache.clave("indicador", tipo, cache.normalizar(contenido), modelo_nombre, ind_nombre, def_tec, perfil)
+
+def prefiltrar(contenido, tareas, pendientes, resultados, tipo, al_resultado=None):
+    """Resuelve en local los indicadores sin relación léxica con el texto; devuelve los que siguen pendientes"""
+    pendientes, locales = prefiltro.separar(catalogo.obtener().indice, contenido, tareas, pendientes,
+                                            tipo, prompts.CAMPOS_ANALISIS[tipo])
+    for i, r in locales.items():
+        resultados[i] = r
+        if al_resultado:
+            al_resultado(r)
+    return pendientes
+
+def evaluar_tareas(contenido, perfil, tareas, evaluar_individual, tipo="objetivo", en_lote=None,
+                   al_resultado=None, cancelacion=None, al_parcial=None, apartado=None):
+    """
+    Resuelve primero desde la cache y los puntos de control del apartado;
+    sólo los indicadores sin resultado guardado van a la IA (y se guardan
+    al volver). al_resultado(resultado) se llama con cada indicador en
+    cuanto está listo; al_parcial, con su calificación en cuanto se lee del
+    streaming (antes que el análisis).
+    """
+    claves = [clave_indicador(contenido, perfil, t, tipo) for t in tareas]
+    resultados = puntos_control.recuperar(apartado, claves, [cache.obtener(k) for k in claves], tipo)
+    pendientes = [i for i, r in enumerate(resultados) if r is None]
+    if len(pendientes) < len(tareas):
+        print(f"⚡ {len(tareas) - len(pendientes)}/{len(tareas)} indicadores servidos desde cache.")
+        if al_resultado:
+            for r in resultados:
+                if r:
+                    al_resultado(r)
+    pendientes = prefiltrar(contenido, tareas, pendientes, resultados, tipo, al_resultado)
+    if not pendientes:
+        return resultados
+
+    def al_llegar(i, r):
+        cache.guardar(claves[pendientes[i]], r)
+        puntos_control.guardar(apartado, claves[pendientes[i]], r)
+        if r and al_resultado:
+            al_resultado(r)
+
+    nuevos = evaluar_tareas_llm(contenido, perfil, [tareas[i] for i in pendientes], evaluar_individual,
+                                tipo, en_lote, al_llegar, cancelacion, al_parcial)
+    for i, r in zip(pendientes, nuevos):
+        resultados[i] = r
+    return resultados
+
+def evaluar_tareas_llm(contenido, perfil, tareas, evaluar_individual, tipo="objetivo", en_lote=None,
+                       al_completar=None, cancelacion=None, al_parcial=None):
+    """
+    Evalúa las tareas indicador por indicador o, en modo lote, con una
+    llamada por modelo; en modo lote sólo se repiten individualmente los
+    indicadores que faltaron o llegaron mal formados.
+    """
+    individual = lambda t: evaluar_individual(contenido, perfil, t, cancelacion, al_parcial)
+    if en_lote is None:
+        en_lote = config.EVALUACION_EN_LOTE
+    if not en_lote:
+        return ejecutar_indicadores(tareas, individual, al_completar=al_completar)
+
+    grupos = agrupar_por_modelo(tareas)
+    inicios = []
+    for grupo in grupos:
+        inicios.append(sum(len(g) for g in grupos[:len(inicios)]))
+
+    resultados = [None] * len(tareas)
+    def al_completar_lote(g, lote):
+        for j, r in enumerate(lote or []):
+            resultados[inicios[g] + j] = r
+            if r and al_completar:
+                al_completar(inicios[g] + j, r)
+    ejecutar_indicadores(grupos, lambda g: evaluar_modelo_en_lote(contenido, perfil, g, tipo, cancelacion),
+                         al_completar=al_completar_lote)
+
+    pendientes = [i for i, r in enumerate(resultados) if r is None]
+    if pendientes and not esta_cancelado(cancelacion):
+        print(f"🔁 Reintentando {len(pendientes)} indicadores de forma individual...")
+        def al_completar_relleno(j, r):
+            resultados[pendientes[j]] = r
+            if al_completar:
+                al_completar(pendientes[j], r)
+        ejecutar_indicadores([tareas[i] for i in pendientes], individual, al_completar=al_completar_relleno)
+    return resultados
+
+# --- PASOS COMUNES A OBJETIVOS Y ACTIVIDADES ---
+EXCLUIDOS = {
+    "objetivo": ['definicion', 'nombre', 'titulo'],
+    "actividad": ['definicion', 'nombre', 'titulo', 'descripcion'],
+}
+
+def preparar_evaluacion(contenido, nombre_apartado, poblacion, rango, tipo="objetivo"):
+    """
+    Validación, perfil y lista de indicadores. Devuelve
+    (respuesta_inmediata, perfil, tareas, res_final); si respuesta_inmediata
+    no es None, la evaluación termina ahí.
+    """
     # --- AJUSTE AQUÍ: Recibimos solo una variable ---
-    mensaje_error = es_contenido_invalido(contenido)
+    with metricas.cronometro("evaluacion_etapa_segundos", tipo=tipo, etapa="validacion"):
+        mensaje_error = es_contenido_invalido(contenido)
     
     # Si mensaje_error tiene texto (no es None), significa que es inválido
     if mensaje_error:
-        return {
+        respuesta = {
             "es_valido": False, 
             "mensaje_error": mensaje_error,
             "apartado": nombre_apartado,
             "feedback_global": {"comentario_general": "Evaluación cancelada: " + mensaje_error}
         }
+        if tipo == "actividad":
+            respuesta["tipo_detectado"] = "actividad"
+        return respuesta, None, None, None
         
-    perfil = cargar_perfil_edad(poblacion, rango)
-    modelos = cargar_modelos_poblacion(poblacion)
+    with metricas.cronometro("evaluacion_etapa_segundos", tipo=tipo, etapa="carga_datos"):
+        perfil = cargar_perfil_edad(poblacion, rango)
+        modelos = cargar_modelos_poblacion(poblacion)
     if not perfil: 
-        return {"error": "Faltan datos de perfil o edad."}
+        return {"error": "Faltan datos de perfil o edad."}, None, None, None
 
     res_final = {"apartado": nombre_apartado, "evaluaciones": []}
-    calificaciones = []
+    if tipo == "actividad":
+        res_final = {"apartado": nombre_apartado, "tipo_detectado": "actividad", "evaluaciones": []}
+        print(f"--- EVALUANDO ACTIVIDAD: {nombre_apartado} ---")
 
-    for m_key, m_val in modelos.items():
-        for ind_nombre, ind_info in m_val['indicadores'].items():
-            if ind_nombre.lower() in ['definicion', 'nombre', 'titulo']: 
-                continue
-            if not config.evaluacion_activa:
-                print(f"🛑 Proceso abortado: Saltando indicador {ind_nombre}")
-                # Retornamos lo que llevamos acumulado en res_final hasta el momento
-                return res_final
-
-            # Preparación de la definición técnica del indicador
-            def_tec = str(ind_info)
-            if isinstance(ind_info, dict):
-                parts = []
-                if 'Definicion' in ind_info: 
-                    parts.append(f"DEFINICIÓN: {ind_info['Definicion']}")
-                if 'Indicadores' in ind_info: 
-                    inds = ind_info['Indicadores']
-                    txt = ", ".join(inds) if isinstance(inds, list) else str(inds)
-                    parts.append(f"ELEMENTOS ESPERADOS: {txt}")
-                def_tec = "\n".join(parts)
-
-            prompt = f'''
-            ERES UN EVALUADOR DE CONTENIDO EDUCATIVO CON EXCELENTE REDACCIÓN Y ORTOGRAFÍA.
-            
-            Analiza el texto: "{contenido}"
-            FASE 1: FILTRO DE SEGURIDAD ---
-            Si el texto NO tiene sentido educativo, o es una lista de palabras inconexas:
-            Responde ÚNICAMENTE: {{"es_valido": false, "mensaje_error": "CONTENIDO_IRRELEVANTE"}}
-            Responde ÚNICAMENTE este JSON exacto:
-            {{
-                "es_valido": false,
-                "mensaje_error": "El contenido ingresado no parece ser una introducción válida. Por favor verifica la redacción."
-            }}
-           
-            --- FASE 2: EVALUACIÓN (Solo si es válido) ---
-            Tu tarea es determinar el NIVEL DE ALINEACIÓN pedagógica entre un Objetivo, un Indicador Pedagógico y la edad DE ACUERDO A LA RÚBRICA DEL PUNTO 2.
-
-            1. LOS DATOS A COMPARAR:
-            - OBJETIVO A EVALUAR: "{contenido}"
-            - INDICADOR DEL MODELO ({ind_nombre}): {def_tec}
-            - CONTEXTO (EDAD): {perfil.get('etapa_cognitiva')} ({perfil.get('caracteristicas')})
-
-            2. RÚBRICA DE EVALUACIÓN (TU ÚNICA REFERENCIA):
-            Usa estas definiciones para asignar la calificación. Basa tu decisión únicamente en la correspondencia entre el significado del objetivo, la definición del indicador y la pertinencia de la edad.
+    tareas = listar_indicadores(modelos, EXCLUIDOS[tipo])
+    return None, perfil, tareas, res_final
 
-            
-            - NIVEL 1 (No observado): Las características evaluadas no se mencionan ni se infieren en el objetivo.
-            - NIVEL 2 (Observado en menor medida): Las características se presentan de forma limitada y sin continuidad, apareciendo esporádicamente y con poca integración en la estructura pedagógica. 
-            En este nivel, la aplicación es mínima y carece de una relación clara con los modelos pedagógicos.
-            - NIVEL 3 (Observado parcialmente): Las características están presentes en el objetivo, pero de forma limitada en cuanto a su alineación con el modelo pedagógico y edad.
-            - NIVEL 4 (Observado con frecuencia):Las características evaluadas están presentes y se utilizan de manera continua en el objetivo. Hay una buena integración en el diseño pedagógico,
-            aunque ciertos detalles o consistencias podrían mejorar para alinearse completamente al modelo.
-            - NIVEL 5 (Completamente observado): Las características evaluadas están presentes de manera completa y efectiva en todo el objetivo, y su uso está plenamente alineado con los principios 
-            pedagógicos y la edad. La característica no solo se encuentra integrada en el diseño y desarrollo, sino que también está articulada para maximizar el impacto pedagógico deseado.
-            
-            3. INSTRUCCIÓN DE ANÁLISIS:
-            - Analiza el significado del OBJETIVO.
-            - Compáralo con la DEFINICIÓN del indicador.
-            - Evalúa si el objetivo es coherente con la EDAD del estudiante.
-            - Asigna el nivel que mejor describa esta relación de acuerdo a la rúbrica de evaluación.
-            EVALUACIÓN CRÍTICA: No asumas intenciones que no estén escritas. Si el OBJETIVO es vago, no puede alcanzar niveles altos.
-            - USO DEL CONTEXTO: Es OBLIGATORIO usar el dato "{perfil.get('etapa_cognitiva')}" para la compatibilidad. Si el objetivo pide algo demasiado complejo para esa etapa, la calificación debe bajar.
-            - REGLA DE DESEMPATE: Ante la duda o falta de detalle en el texto, opta siempre por el nivel inferior inmediato. El Nivel 5 se reserva únicamente para alineaciones perfectas y explícitas.
-            - PROHIBICIÓN DE CIRCULARIDAD: En el análisis, no repitas la definición de la rúbrica; explica qué palabras del texto justifican tu decisión.
-            TEN MUY EN CUENTA LA EVALUACIÓN Y LA REFLEXIÓN, TIENE QUE ESTÁR INMERSO EN EL TEXTO INGRESADO.
-
-            4. FORMATO DE RESPUESTA (JSON):
-            Responde únicamente en JSON.
-            IMPORTANTE: El campo "calificacion" debe ser el resultado directo de aplicar la Rúbrica de la Sección 2.
-            El lenguaje debe ser netamente constructivista y pedagógico.
-            
-            {{
-                "calificacion": <Número entero 1-5 que corresponda EXACTAMENTE a la definición de la rúbrica seleccionada>,
-                "analisis": {{
-                    "evidencia_pedagogica": "Cita textual del objetivo y su conexión técnica con el indicador. ¿Qué proceso mental se activa?",
-                    "justificacion_edad": "Análisis de por qué el contenido es apto (o no) para la etapa {perfil.get('etapa_cognitiva')}, mencionando un hito del desarrollo cognitivo.",
-                    "razonamiento_nivel": "Diferenciación técnica: Explica qué elemento específico tiene para estar en Nivel X y qué le falta EXACTAMENTE para subir al Nivel X+1."
-                }}
-            }}
-            '''
-
-            # FUNCIÓN SEGURA
-            comp = llamada_segura_groq(
-                messages=[
-                    {"role": "system", "content": "Eres un evaluador objetivo que responde solo en JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.0
-            )
+def calcular_estadisticas(calificaciones):
+    return {
+        "promedio": round(sum(calificaciones) / len(calificaciones), 2),
+        "total_indicadores": len(calificaciones)
+    }
 
-            if comp:
-                try:
-                    content_resp = comp.choices[0].message.content.replace("```json", "").replace("```", "").strip()
-                    res_json = json.loads(content_resp)
-                    cal = int(res_json.get('calificacion', 1))
-                    analisis = res_json.get('analisis', {})
-                    if isinstance(analisis, str): 
-                        analisis = {"razonamiento": analisis}
-                    res_final["evaluaciones"].append({
-                        "modelo": m_val['nombre'],
-                        "indicador": ind_nombre,
-                        "calificacion": cal,
-                        "analisis": analisis 
-                    })
-                    calificaciones.append(cal)                 
-                    # --- RETRASO PREVENTIVO ---
-                    # Esperar 2 segundos entre indicadores para Rate Limit
-                    print(f"✅ {ind_nombre} evaluado. Esperando 2s...")
-                    time.sleep(2) 
-
-                except Exception as e: 
-                    print(f"Error procesando respuesta JSON en {ind_nombre}: {e}")
+def marcar_plazo_agotado(res_final, resultados, tramo, tipo):
+    """Si el plazo dejó indicadores sin evaluar, el resultado lo indica (trae sólo los ya evaluados)"""
+    if plazo_vencido(tramo) and None in resultados:
+        print(f"⌛ Plazo agotado: se sigue con {len(res_final['evaluaciones'])}/{len(resultados)} indicadores.")
+        res_final["plazo_agotado"] = True
+        metricas.incrementar("evaluacion_degradada_total", tipo=tipo, parte="indicadores")
+
+# FUNCIÓN DE EVALUACIÓN DE OBJETIVOS
+def evaluar_objetivo(contenido, nombre_apartado, poblacion, rango, en_lote=None, al_evento=None, cancelacion=None):
+    respuesta, perfil, tareas, res_final = preparar_evaluacion(contenido, nombre_apartado, poblacion, rango, "objetivo")
+    if respuesta:
+        return respuesta
+
+    # Todos los indicadores salen en paralelo; el orden de salida se conserva
+    emitir(al_evento, "inicio", apartado=nombre_apartado, tipo="objetivo", total_indicadores=len(tareas))
+    # Los indicadores terminan PLAZO_RESERVA_FEEDBACK antes del plazo: el feedback también cuenta
+    tramo = reservar(cancelacion, config.PLAZO_RESERVA_FEEDBACK)
+    apartado = clave_apartado(contenido, nombre_apartado, poblacion, rango, en_lote)
+    resultados = evaluar_tareas(contenido, perfil, tareas, evaluar_indicador_objetivo, "objetivo", en_lote,
+                                lambda r: emitir(al_evento, "indicador", **r), tramo,
+                                lambda r: emitir(al_evento, "calificacion", **r), apartado)
+    calificaciones = recolectar_resultados(res_final, resultados)
+    marcar_plazo_agotado(res_final, resultados, tramo, "objetivo")
+
+    if esta_cancelado(cancelacion):
+        print("🛑 Proceso abortado: devolviendo indicadores ya evaluados")
+        # Retornamos lo que llevamos acumulado en res_final hasta el momento
+        return res_final
 
     # CÁLCULOS Y FEEDBACK GLOBAL 
     if calificaciones:
-        promedio = round(sum(calificaciones)/len(calificaciones), 2)
-        res_final["estadisticas"] = {
-            "promedio": promedio,
-            "total_indicadores": len(calificaciones)
-        }
+        res_final["estadisticas"] = calcular_estadisticas(calificaciones)
+        emitir(al_evento, "estadisticas", **res_final["estadisticas"])
 
-        feedback = generar_comentario_global(contenido, res_final["evaluaciones"], perfil.get('etapa_cognitiva'))
+        feedback = generar_comentario_global(contenido, res_final["evaluaciones"], perfil.get('etapa_cognitiva'),
+                                             cancelacion=cancelacion,
+                                             al_texto=emisor_texto(al_evento, "feedback_global", apartado=nombre_apartado))
         res_final["feedback_global"] = feedback
+        emitir(al_evento, "feedback_global", **feedback)
 
+    puntos_control.cerrar(apartado, res_final)
     return res_final
 
 def es_una_actividad(nombre_apartado, contenido):
@@ -310,156 +582,79 @@ def es_una_actividad(nombre_apartado, contenido):
     
     return encontrados >= 3
 
-def evaluar_actividad(contenido, nombre_apartado, poblacion, rango):
-    # --- AJUSTE DE VALIDACIÓN ---
-    mensaje_error = es_contenido_invalido(contenido)
-    
-    if mensaje_error:
-        return {
-            "es_valido": False, 
-            "mensaje_error": mensaje_error,
-            "apartado": nombre_apartado,
-            "tipo_detectado": "actividad",
-            "feedback_global": {"comentario_general": "Evaluación cancelada: " + mensaje_error}
-        }
-    
-    perfil = cargar_perfil_edad(poblacion, rango)
-    modelos = cargar_modelos_poblacion(poblacion)
-    
-    if not perfil:
-        return {"error": "Faltan datos de perfil o edad."}
-    
-    res_final = {
-        "apartado": nombre_apartado,
-        "tipo_detectado": "actividad",
-        "evaluaciones": []
-    }
-    calificaciones = []
+def mensajes_indicador_actividad(contenido, perfil, tarea):
+    return mensajes_indicador(contenido, perfil, tarea, "actividad")
+
+def evaluar_indicador_actividad(contenido, perfil, tarea, cancelacion=None, al_parcial=None):
+    return evaluar_indicador(contenido, perfil, tarea, "actividad", cancelacion, al_parcial)
+
+def evaluar_actividad(contenido, nombre_apartado, poblacion, rango, en_lote=None, al_evento=None, cancelacion=None):
+    respuesta, perfil, tareas, res_final = preparar_evaluacion(contenido, nombre_apartado, poblacion, rango, "actividad")
+    if respuesta:
+        return respuesta
     
-    print(f"--- EVALUANDO ACTIVIDAD: {nombre_apartado} ---")
+    emitir(al_evento, "inicio", apartado=nombre_apartado, tipo="actividad", total_indicadores=len(tareas))
+    # Los indicadores terminan PLAZO_RESERVA_FEEDBACK antes del plazo: el feedback también cuenta
+    tramo = reservar(cancelacion, config.PLAZO_RESERVA_FEEDBACK)
+    apartado = clave_apartado(contenido, nombre_apartado, poblacion, rango, en_lote)
+    resultados = evaluar_tareas(contenido, perfil, tareas, evaluar_indicador_actividad, "actividad", en_lote,
+                                lambda r: emitir(al_evento, "indicador", **r), tramo,
+                                lambda r: emitir(al_evento, "calificacion", **r), apartado)
+    calificaciones = recolectar_resultados(res_final, resultados)
+    marcar_plazo_agotado(res_final, resultados, tramo, "actividad")
     
-    for m_key, m_val in modelos.items():
-        for ind_nombre, ind_info in m_val['indicadores'].items():
-            if ind_nombre.lower() in ['definicion', 'nombre', 'titulo', 'descripcion']:
-                continue
-            
-            if not config.evaluacion_activa:
-                print(f"🛑 Proceso abortado: Saltando indicador {ind_nombre}")
-                # Retornamos lo que llevamos acumulado en res_final hasta el momento
-                return res_final
-            
-            def_tec = str(ind_info)
-            if isinstance(ind_info, dict):
-                parts = []
-                if 'Definicion' in ind_info:
-                    parts.append(f"DEFINICIÓN: {ind_info['Definicion']}")
-                if 'Indicadores' in ind_info:
-                    inds = ind_info['Indicadores']
-                    txt = ", ".join(inds) if isinstance(inds, list) else str(inds)
-                    parts.append(f"ELEMENTOS ESPERADOS: {txt}")
-                def_tec = "\n".join(parts)
-            
-            prompt = f'''
-            ERES UN EVALUADOR DE ACTIVIDADES EDUCATIVAS CON EXCELENTE REDACCIÓN Y ORTOGRAFÍA.
-            
-            Analiza el texto: "{contenido[:1000]}..."
-            FASE 1: FILTRO DE SEGURIDAD ---
-            Si el texto NO tiene sentido educativo, o es una lista de palabras inconexas:
-            Responde ÚNICAMENTE: {{"es_valido": false, "mensaje_error": "CONTENIDO_IRRELEVANTE"}}
-            Responde ÚNICAMENTE este JSON exacto:
-            {{
-                "es_valido": false,
-                "mensaje_error": "El contenido ingresado no parece ser una introducción válida. Por favor verifica la redacción."
-            }}
-           
-            --- FASE 2: EVALUACIÓN (Solo si es válido) ---
-            
-            TU TAREA: Determinar si una ACTIVIDAD implementa o aplica un indicador pedagógico.
-            
-            DATOS A EVALUAR:
-            - ACTIVIDAD: "{contenido[:1000]}..."
-            - INDICADOR PEDAGÓGICO ({ind_nombre}): {def_tec}
-            - CONTEXTO (EDAD): {perfil.get('etapa_cognitiva', '')} 
-              Características: {perfil.get('caracteristicas', '')}
-            
-            RÚBRICA DE EVALUACIÓN:
-            - NIVEL 1 (No observado): Las características evaluadas no se mencionan ni se infieren en la actividad.
-            - NIVEL 2 (Observado en menor medida): Las características se presentan de forma limitada y sin continuidad, apareciendo esporádicamente y con poca integración en la estructura pedagógica. 
-            En este nivel, la aplicación es mínima y carece de una relación clara con los modelos pedagógicos.
-            - NIVEL 3 (Observado parcialmente): Las características están presentes en la actividad, pero de forma limitada en cuanto a su alineación con el modelo pedagógico y edad.
-            - NIVEL 4 (Observado con frecuencia):Las características evaluadas están presentes y se utilizan de manera continua en la actividad. Hay una buena integración en el diseño pedagógico,
-            aunque ciertos detalles o consistencias podrían mejorar para alinearse completamente al modelo.
-            - NIVEL 5 (Completamente observado): Las características evaluadas están presentes de manera completa y efectiva en todo la actividad, y su uso está plenamente alineado con los principios 
-            pedagógicos y la edad. La característica no solo se encuentra integrada en el diseño y desarrollo, sino que también está articulada para maximizar el impacto pedagógico deseado.
-            
-            INSTRUCCIÓN DE ANÁLISIS:
-            - Analiza la ACTIVIDAD completa
-            - Determina si IMPLEMENTA o APLICA el indicador "{ind_nombre}"
-            - Considera si es apropiada para la EDAD del estudiante
-            - Asigna nivel 1-5 según la rúbrica
-            - IMPLEMENTACIÓN REAL: No evalúes si la actividad es "bonita". Evalúa si el paso a paso de la actividad obliga al estudiante a ejecutar lo que dice el indicador "{ind_nombre}".
-            - PERTINENCIA DE DESARROLLO: Contrasta la actividad con la etapa "{perfil.get('etapa_cognitiva', '')}". ¿Tienen los estudiantes la madurez necesaria para los retos propuestos?
-            TEN MUY EN CUENTA LA EVALUACIÓN Y LA REFLEXIÓN, TIENE QUE ESTÁR INMERSO EN EL TEXTO INGRESADO.
-            FORMATO DE RESPUESTA (JSON):
-            {{
-                "calificacion": <Número entero 1-5>,
-                "analisis": {{
-                    "ejecucion_indicador": "Análisis de cómo la secuencia de la actividad activa (o no) el indicador técnico.",
-                    "adecuacion_cognitiva": "Justificación de por qué la actividad es apta para la etapa {perfil.get('etapa_cognitiva', '')}, citando un hito de esta edad.",
-                }}
-            }}
-            Responde ÚNICAMENTE en JSON.
-            '''
-            
-            comp = llamada_segura_groq(
-                messages=[
-                    {"role": "system", "content": "Eres un evaluador objetivo que responde solo en JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.0
-            )
-            
-            if comp:
-                try:
-                    content_resp = comp.choices[0].message.content.replace("```json", "").replace("```", "").strip()
-                    res_json = json.loads(content_resp)
-                    
-                    cal = int(res_json.get('calificacion', 1))
-                    analisis = res_json.get('analisis', {})
-                    if isinstance(analisis, str):
-                        analisis = {"razonamiento": analisis}
-                    
-                    res_final["evaluaciones"].append({
-                        "modelo": m_val['nombre'],
-                        "indicador": ind_nombre,
-                        "calificacion": cal,
-                        "analisis": analisis
-                    })
-                    calificaciones.append(cal)
-                    
-                    # --- RETRASO PREVENTIVO ---
-                    print(f"✅ {ind_nombre} evaluado. Esperando 2s...")
-                    time.sleep(2)
-                    
-                except Exception as e:
-                    print(f"Error procesando respuesta JSON en {ind_nombre}: {e}")
+    if esta_cancelado(cancelacion):
+        print("🛑 Proceso abortado: devolviendo indicadores ya evaluados")
+        return res_final
     
     if calificaciones:
-        promedio = round(sum(calificaciones) / len(calificaciones), 2)
-        res_final["estadisticas"] = {
-            "promedio": promedio,
-            "total_indicadores": len(calificaciones)
-        }
+        res_final["estadisticas"] = calcular_estadisticas(calificaciones)
+        emitir(al_evento, "estadisticas", **res_final["estadisticas"])
         
-        # Ojo: Aquí usaba feedback_global que está en tu archivo original.
-        # Asegúrate que generar_comentario_global soporta el parámetro 'tipo'
-        # o importa la función correcta.
         feedback = generar_comentario_global(
             contenido, 
             res_final["evaluaciones"], 
             perfil.get('etapa_cognitiva', ''),
-            tipo="actividad"
+            tipo="actividad",
+            cancelacion=cancelacion,
+            al_texto=emisor_texto(al_evento, "feedback_global", apartado=nombre_apartado)
         )
         res_final["feedback_global"] = feedback
+        emitir(al_evento, "feedback_global", **feedback)
+    
+    puntos_control.cerrar(apartado, res_final)
+    return res_final
+
+# --- DESPACHO SEGÚN EL TIPO DE APARTADO ---
+def detectar_tipo_apartado(nombre_apartado, contenido):
+    """'introduccion', 'actividad' u 'objetivo' (por defecto)"""
+    nombre_normalizado = nombre_apartado.strip().lower()
+    if "introducción" in nombre_normalizado or "introduccion" in nombre_normalizado:
+        return "introduccion"
+    if es_una_actividad(nombre_apartado, contenido):
+        return "actividad"
+    return "objetivo"
+
+def evaluar_apartado(contenido, nombre_apartado, poblacion, rango, en_lote=None, al_evento=None, cancelacion=None):
+    """Decide si el apartado es introducción, actividad u objetivo y lo evalúa"""
+    tipo = detectar_tipo_apartado(nombre_apartado, contenido)
+    
+    # 1. INTRODUCCIÓN
+    if tipo == "introduccion":
+        print(">>> Detectado modo: COORDINADOR DE MUSEOS (Introducción)")
+        emitir(al_evento, "inicio", apartado=nombre_apartado, tipo="introduccion", total_indicadores=0)
+        resultado = evaluar_introduccion(contenido, nombre_apartado, cancelacion=cancelacion)
+        emitir(al_evento, "introduccion", **resultado)
+        return resultado
+    
+    # 2. ACTIVIDADES
+    elif tipo == "actividad":
+        print(">>> Detectado modo: EVALUADOR DE ACTIVIDADES")
+        return evaluar_actividad(contenido, nombre_apartado, poblacion, rango, en_lote=en_lote,
+                                 al_evento=al_evento, cancelacion=cancelacion)
     
-    return res_final
\ No newline at end of file
+    # 3. OBJETIVOS (por defecto)
+    else:
+        print(">>> Detectado modo: EVALUADOR PEDAGÓGICO (Objetivos)")
+        return evaluar_objetivo(contenido, nombre_apartado, poblacion, rango, en_lote=en_lote,
+                                al_evento=al_evento, cancelacion=cancelacion)
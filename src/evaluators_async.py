@@ -0,0 +1,247 @@
+import asyncio
+import contextlib
+from src import config, cache, esquemas, puntos_control
+from src.llm_gateway import llamar_async
+from src.motor_evaluacion import esta_cancelado_async, reservar
+from src.feedback import generar_comentario_global_async
+from src.analizador_resultados import analizar_resultados_taller_async
+from src.evaluators import (
+    preparar_evaluacion, calcular_estadisticas, recolectar_resultados, marcar_plazo_agotado, emitir, emisor_texto,
+    detectar_tipo_apartado, clave_apartado, clave_indicador, prefiltrar, escucha_indicador,
+    mensajes_indicador_objetivo, mensajes_indicador_actividad, procesar_respuesta_indicador,
+    mensajes_lote, procesar_respuesta_lote,
+    resolver_introduccion_local, mensajes_introduccion, procesar_respuesta_introduccion,
+)
+
+# Misma lógica que evaluators.py, pero cada llamada es una corrutina sobre
+# el loop compartido de llm_async: un hilo sostiene decenas de llamadas.
+# La cache y los puntos de control (SQLite) se leen y escriben en hilos
+# (asyncio.to_thread) para que un lock disputado no frene el loop.
+
+MENSAJES_INDICADOR = {
+    "objetivo": mensajes_indicador_objetivo,
+    "actividad": mensajes_indicador_actividad,
+}
+
+
+def _guardados(apartado, claves, tipo):
+    return puntos_control.recuperar(apartado, claves, [cache.obtener(k) for k in claves], tipo)
+
+
+def _guardar(apartado, clave, resultado):
+    cache.guardar(clave, resultado)
+    puntos_control.guardar(apartado, clave, resultado)
+
+
+async def evaluar_indicador_async(contenido, perfil, tarea, tipo, semaforo, cancelacion=None, al_parcial=None):
+    modelo_nombre, ind_nombre, _ = tarea
+    if await esta_cancelado_async(cancelacion):
+        print(f"🛑 Proceso abortado: Saltando indicador {ind_nombre}")
+        return None
+    mensajes = MENSAJES_INDICADOR[tipo](contenido, perfil, tarea)
+    etiquetas = {"tipo": tipo, "modelo": modelo_nombre, "indicador": ind_nombre}
+    async with semaforo:
+        comp = await llamar_async(mensajes, temperature=0.0, max_tokens=config.TOKENS_MAX_INDICADOR,
+                                  cancelacion=cancelacion, etiquetas=etiquetas,
+                                  al_fragmento=escucha_indicador(tarea, tipo, al_parcial))
+        comp = await esquemas.reparar_async(esquemas.esquema_indicador(tipo), comp, mensajes, cancelacion, etiquetas)
+    return procesar_respuesta_indicador(comp, modelo_nombre, ind_nombre, tipo)
+
+
+async def evaluar_lote_async(contenido, perfil, grupo, tipo, semaforo, cancelacion=None):
+    if await esta_cancelado_async(cancelacion):
+        return [None] * len(grupo)
+    async with semaforo:
+        comp = await llamar_async(mensajes_lote(contenido, perfil, grupo, tipo),
+                                temperature=0.0, cancelacion=cancelacion,
+                                etiquetas={"tipo": tipo, "modelo": grupo[0][0], "indicador": "_lote"})
+    return procesar_respuesta_lote(comp, grupo, tipo)
+
+
+async def evaluar_tareas_async(contenido, perfil, tareas, tipo="objetivo", en_lote=None,
+                               al_resultado=None, cancelacion=None, semaforo=None, al_parcial=None,
+                               apartado=None):
+    """
+    Cache y puntos de control primero; los pendientes se lanzan todos a la
+    vez (acotados por semáforo). Si se pasa 'semaforo', el cupo se comparte
+    con otros apartados. al_parcial recibe cada calificación en cuanto se lee
+    del streaming.
+    """
+    claves = [clave_indicador(contenido, perfil, t, tipo) for t in tareas]
+    resultados = await asyncio.to_thread(_guardados, apartado, claves, tipo)
+    pendientes = [i for i, r in enumerate(resultados) if r is None]
+    if len(pendientes) < len(tareas):
+        print(f"⚡ {len(tareas) - len(pendientes)}/{len(tareas)} indicadores servidos desde cache.")
+        if al_resultado:
+            for r in resultados:
+                if r:
+                    al_resultado(r)
+
+    # El prefiltro lee el catálogo (stat de data/, BM25): va a un hilo y sus
+    # resultados se emiten después, desde el loop
+    antes = pendientes
+    pendientes = await asyncio.to_thread(prefiltrar, contenido, tareas, pendientes, resultados, tipo)
+    if al_resultado:
+        for i in sorted(set(antes) - set(pendientes)):
+            al_resultado(resultados[i])
+    semaforo = semaforo or asyncio.Semaphore(config.MAX_CONCURRENCIA_INDICADORES)
+
+    async def llego(i, r):
+        resultados[i] = r
+        await asyncio.to_thread(_guardar, apartado, claves[i], r)
+        if r and al_resultado:
+            al_resultado(r)
+
+    async def individual(i):
+        await llego(i, await evaluar_indicador_async(contenido, perfil, tareas[i], tipo, semaforo, cancelacion, al_parcial))
+
+    if en_lote is None:
+        en_lote = config.EVALUACION_EN_LOTE
+    if not en_lote:
+        await asyncio.gather(*(individual(i) for i in pendientes))
+        return resultados
+
+    async def lote(grupo_indices):
+        grupo = [tareas[i] for i in grupo_indices]
+        for i, r in zip(grupo_indices, await evaluar_lote_async(contenido, perfil, grupo, tipo, semaforo, cancelacion)):
+            if r:
+                await llego(i, r)
+
+    por_modelo = {}
+    for i in pendientes:
+        por_modelo.setdefault(tareas[i][0], []).append(i)
+    await asyncio.gather(*(lote(indices) for indices in por_modelo.values()))
+
+    faltantes = [i for i in pendientes if resultados[i] is None]
+    if faltantes and not await esta_cancelado_async(cancelacion):
+        print(f"🔁 Reintentando {len(faltantes)} indicadores de forma individual...")
+        await asyncio.gather(*(individual(i) for i in faltantes))
+    return resultados
+
+
+async def evaluar_indicadores_async(contenido, nombre_apartado, poblacion, rango, tipo="objetivo",
+                                    en_lote=None, al_evento=None, cancelacion=None, semaforo=None):
+    """evaluar_objetivo / evaluar_actividad en versión async"""
+    respuesta, perfil, tareas, res_final = await asyncio.to_thread(
+        preparar_evaluacion, contenido, nombre_apartado, poblacion, rango, tipo)
+    if respuesta:
+        return respuesta
+
+    emitir(al_evento, "inicio", apartado=nombre_apartado, tipo=tipo, total_indicadores=len(tareas))
+    tramo = reservar(cancelacion, config.PLAZO_RESERVA_FEEDBACK)
+    apartado = clave_apartado(contenido, nombre_apartado, poblacion, rango, en_lote)
+    resultados = await evaluar_tareas_async(contenido, perfil, tareas, tipo, en_lote,
+                                            lambda r: emitir(al_evento, "indicador", **r), tramo, semaforo,
+                                            lambda r: emitir(al_evento, "calificacion", **r), apartado)
+    calificaciones = recolectar_resultados(res_final, resultados)
+    marcar_plazo_agotado(res_final, resultados, tramo, tipo)
+
+    if await esta_cancelado_async(cancelacion):
+        print("🛑 Proceso abortado: devolviendo indicadores ya evaluados")
+        return res_final
+
+    if calificaciones:
+        res_final["estadisticas"] = calcular_estadisticas(calificaciones)
+        emitir(al_evento, "estadisticas", **res_final["estadisticas"])
+
+        async with semaforo or contextlib.nullcontext():
+            feedback = await generar_comentario_global_async(
+                contenido, res_final["evaluaciones"], perfil.get('etapa_cognitiva', ''),
+                tipo=tipo, cancelacion=cancelacion,
+                al_texto=emisor_texto(al_evento, "feedback_global", apartado=nombre_apartado)
+            )
+        res_final["feedback_global"] = feedback
+        emitir(al_evento, "feedback_global", **feedback)
+
+    await asyncio.to_thread(puntos_control.cerrar, apartado, res_final)
+    return res_final
+
+
+async def evaluar_objetivo_async(contenido, nombre_apartado, poblacion, rango, **kwargs):
+    return await evaluar_indicadores_async(contenido, nombre_apartado, poblacion, rango, "objetivo", **kwargs)
+
+
+async def evaluar_actividad_async(contenido, nombre_apartado, poblacion, rango, **kwargs):
+    return await evaluar_indicadores_async(contenido, nombre_apartado, poblacion, rango, "actividad", **kwargs)
+
+
+async def evaluar_introduccion_async(contenido, nombre_apartado, cancelacion=None, semaforo=None):
+    resultado, clave_cache = await asyncio.to_thread(resolver_introduccion_local, contenido)
+    if resultado:
+        return resultado
+    mensajes = mensajes_introduccion(contenido)
+    async with semaforo or contextlib.nullcontext():
+        comp = await llamar_async(mensajes, temperature=0.2, cancelacion=cancelacion,
+                                  etiquetas={"tipo": "introduccion"})
+        comp = await esquemas.reparar_async("introduccion", comp, mensajes, cancelacion, {"tipo": "introduccion"})
+    return await asyncio.to_thread(procesar_respuesta_introduccion, comp, clave_cache)
+
+
+async def evaluar_apartado_async(contenido, nombre_apartado, poblacion, rango, en_lote=None,
+                                 al_evento=None, cancelacion=None):
+    tipo = detectar_tipo_apartado(nombre_apartado, contenido)
+    print(f">>> Detectado modo async: {tipo}")
+    if tipo == "introduccion":
+        emitir(al_evento, "inicio", apartado=nombre_apartado, tipo="introduccion", total_indicadores=0)
+        resultado = await evaluar_introduccion_async(contenido, nombre_apartado, cancelacion=cancelacion)
+        emitir(al_evento, "introduccion", **resultado)
+        return resultado
+    return await evaluar_indicadores_async(contenido, nombre_apartado, poblacion, rango, tipo,
+                                           en_lote=en_lote, al_evento=al_evento, cancelacion=cancelacion)
+
+
+# --- TALLER COMPLETO: TODOS LOS APARTADOS A LA VEZ ---
+
+async def _evaluar_seccion(nombre_seccion, corrutina, al_evento):
+    try:
+        resultado = await corrutina
+    except Exception as e:
+        print(f"❌ Error evaluando {nombre_seccion}: {e}")
+        resultado = {"error": str(e)}
+    emitir(al_evento, "apartado", seccion=nombre_seccion, resultado=resultado)
+    return resultado
+
+
+async def evaluar_taller_async(taller, poblacion, rango, en_lote=None, al_evento=None, cancelacion=None):
+    """
+    Evalúa introducción, objetivo y todas las actividades en paralelo bajo
+    un único semáforo (el limitador de Groq ya es global) y lanza la síntesis
+    final en cuanto están sus datos. 'taller' trae introduccion, objetivo y
+    actividades como dicts {"Apartado", "Contenido"} (ver routes.leer_taller).
+    """
+    semaforo = asyncio.Semaphore(config.MAX_CONCURRENCIA_TALLER)
+    # Los apartados dejan PLAZO_RESERVA_INFORME libre para el análisis integrado
+    tramo = reservar(cancelacion, config.PLAZO_RESERVA_INFORME)
+    comunes = {"en_lote": en_lote, "cancelacion": tramo, "semaforo": semaforo}
+
+    secciones = {}
+    intro = taller.get("introduccion")
+    if intro:
+        secciones["introduccion"] = evaluar_introduccion_async(
+            intro["Contenido"], intro["Apartado"], cancelacion=tramo, semaforo=semaforo)
+    objetivo = taller.get("objetivo")
+    if objetivo:
+        secciones["objetivo"] = evaluar_indicadores_async(
+            objetivo["Contenido"], objetivo["Apartado"], poblacion, rango, "objetivo", **comunes)
+    for i, actividad in enumerate(taller.get("actividades", [])):
+        secciones[f"actividad_{i}"] = evaluar_indicadores_async(
+            actividad["Contenido"], actividad["Apartado"], poblacion, rango, "actividad", **comunes)
+
+    print(f"🧩 Evaluando taller completo: {len(secciones)} apartados en paralelo")
+    resultados = dict(zip(secciones, await asyncio.gather(
+        *(_evaluar_seccion(nombre, corrutina, al_evento) for nombre, corrutina in secciones.items())
+    )))
+
+    evaluaciones = {
+        "introduccion": resultados.get("introduccion", {}),
+        "objetivo": resultados.get("objetivo", {}),
+        "actividades": [resultados[nombre] for nombre in secciones if nombre.startswith("actividad_")],
+    }
+    if await esta_cancelado_async(cancelacion):
+        print("🛑 Proceso abortado: devolviendo apartados ya evaluados")
+        return evaluaciones
+
+    analisis = await analizar_resultados_taller_async(evaluaciones, rango, cancelacion=cancelacion,
+                                                      al_texto=emisor_texto(al_evento, "analisis_integrado"))
+    emitir(al_evento, "analisis_integrado", **analisis)
+    return dict(evaluaciones, analisis_integrado=analisis)
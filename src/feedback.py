@@ -1,8 +1,9 @@
+import asyncio
 import json
 import openai
 import os
-import time
 from dotenv import load_dotenv
+from src import cache, config, esquemas, json_parcial, llm_gateway, metricas
 
 # --- CONFIGURACIÓN ---
 load_dotenv()
@@ -11,45 +12,17 @@ api_key = os.getenv("KEY03")
 
 # Configurar openai para Groq
 openai.api_key = api_key
-openai.api_base = "https://api.groq.com/openai/v1"
+openai.api_base = config.LLM_API_BASE
 
 print(f"✅ OpenAI configurado para feedback. Base URL: {openai.api_base}")
 
-# --- HELPER: LLAMADA SEGURA (VERSIÓN ROBUSTA) ---
-def llamada_segura_feedback(messages, model="llama-3.1-8b-instant", temperature=0.2, retries=5):
-    """
-    Intenta llamar a Groq manejando Rate Limits con una espera agresiva.
-    Garantiza cubrir >60 segundos para reiniciar la ventana de tokens.
-    """
-    for i in range(retries):
-        try:
-            comp = openai.ChatCompletion.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                response_format={"type": "json_object"}
-            )
-            return comp
-        except openai.error.RateLimitError:
-            # Espera agresiva: 10s, 20s, 30s, 40s, 50s
-            # Esto permite "sobrevivir" al bloqueo de 1 minuto de Groq
-            wait_time = (i + 1) * 10 
-            print(f"⚠️ Rate Limit en Feedback (Intento {i+1}/{retries}). Pausando {wait_time}s para liberar cupo...")
-            time.sleep(wait_time)
-        except Exception as e:
-            print(f"❌ Error desconocido en Feedback: {str(e)}")
-            return None
-    
-    print("❌ Se agotaron los reintentos (incluso tras esperar >2 min).")
-    return None
-
 # --- FUNCIONES PRINCIPALES ---
 
-def generar_comentario_global(objetivo, evaluaciones, perfil_edad, tipo="objetivo"):
-    """
-    Genera un análisis cualitativo (Pros/Contras) sin dar órdenes directas.
-    Maneja reintentos robustos.
-    """
+def clave_comentario_global(objetivo, evaluaciones, perfil_edad, tipo="objetivo"):
+    return cache.clave("feedback", tipo, cache.normalizar(objetivo), perfil_edad, evaluaciones)
+
+def mensajes_comentario_global(objetivo, evaluaciones, perfil_edad, tipo="objetivo"):
+    """Prompt del análisis cualitativo (Pros/Contras) según los puntos débiles"""
     # Filtramos los puntos débiles (Notas 1, 2 y 3)
     puntos_debiles = [
         f"- {ev['indicador']} ({ev['calificacion']}/5): {ev['analisis'].get('razonamiento', '')}"
@@ -117,22 +90,100 @@ def generar_comentario_global(objetivo, evaluaciones, perfil_edad, tipo="objetiv
                 "comentario_general": "[Inserta aquí solo el texto fluido, usando \\n\\n entre párrafos]"
             }}
             '''
-    # Usamos la llamada segura
-    print("⏳ Generando feedback global (esto puede tardar si hay congestión)...")
-    comp = llamada_segura_feedback(
-        messages=[{"role": "user", "content": prompt_feedback}],
-        temperature=0.1,
-        retries=5 # Aseguramos 5 intentos
-    )
+    return [{"role": "user", "content": prompt_feedback}]
+
+def escucha_comentario(al_texto):
+    """Streaming del comentario: al_texto recibe el texto de comentario_general según se genera"""
+    return json_parcial.escucha(al_texto, [("comentario_general",)]) if al_texto else None
 
+def comentario_de_respaldo(evaluaciones, tipo="objetivo"):
+    """
+    Feedback armado sin IA a partir de las calificaciones, para cuando no
+    hay respuesta útil del modelo (plazo de la petición agotado, rate limit
+    persistente, JSON cortado o irreparable). No se guarda en cache.
+    """
+    metricas.incrementar("evaluacion_degradada_total", tipo=tipo, parte="feedback")
+    sujeto = "La actividad" if tipo == "actividad" else "El objetivo"
+    debiles = sorted((ev for ev in evaluaciones if ev['calificacion'] <= 3), key=lambda ev: ev['calificacion'])
+    if not debiles:
+        texto = (f"{sujeto} alcanza un nivel alto (4 o 5 sobre 5) en los {len(evaluaciones)} indicadores "
+                 "evaluados, con una alineación sólida con el modelo pedagógico y la edad de los destinatarios.")
+    else:
+        lista = ", ".join(f"{ev['indicador']} ({ev['calificacion']}/5)" for ev in debiles)
+        texto = (f"{sujeto} tiene margen de mejora en: {lista}.\n\n"
+                 "El razonamiento de cada indicador, en el detalle de la evaluación, señala qué ajustar.")
+    return {"comentario_general": texto, "degradado": True}
+
+def procesar_respuesta_comentario(comp, clave_cache, tipo="objetivo", evaluaciones=None):
     if comp:
         try:
-            return json.loads(comp.choices[0].message.content)
+            res_json = json.loads(comp.choices[0].message.content)
+            if not isinstance(res_json.get("comentario_general"), str):
+                raise ValueError("falta 'comentario_general'")
+            cache.guardar(clave_cache, res_json)
+            return res_json
         except Exception as e:
+            # Respuesta cortada por el plazo o que ni la reparación deja en esquema
+            metricas.incrementar("llm_parseo_fallos_total", tipo=tipo, indicador="_feedback_global")
+            if evaluaciones:
+                return comentario_de_respaldo(evaluaciones, tipo)
             return {"comentario_general": f"Error procesando JSON: {str(e)}"}
+    elif evaluaciones:
+        return comentario_de_respaldo(evaluaciones, tipo)
     else:
         return {"comentario_general": "No se pudo generar el análisis global (Rate Limit persistente)."}
 
+def generar_comentario_global(objetivo, evaluaciones, perfil_edad, tipo="objetivo", cancelacion=None, al_texto=None):
+    """
+    Genera un análisis cualitativo (Pros/Contras) sin dar órdenes directas.
+    Maneja reintentos robustos. Con al_texto el comentario se recibe en
+    streaming ({"campo", "texto"} por trozo) y el JSON se valida al final.
+    Si la IA no responde a tiempo se devuelve comentario_de_respaldo().
+    """
+    clave_cache = clave_comentario_global(objetivo, evaluaciones, perfil_edad, tipo)
+    guardado = cache.obtener(clave_cache)
+    if guardado:
+        print("⚡ Feedback global servido desde cache.")
+        return guardado
+
+    # Usamos la llamada segura
+    print("⏳ Generando feedback global (esto puede tardar si hay congestión)...")
+    mensajes = mensajes_comentario_global(objetivo, evaluaciones, perfil_edad, tipo)
+    etiquetas = {"tipo": tipo, "indicador": "_feedback_global"}
+    comp = llm_gateway.llamar(
+        mensajes,
+        temperature=0.1,
+        cancelacion=cancelacion,
+        etiqueta="Feedback",
+        etiquetas=etiquetas,
+        al_fragmento=escucha_comentario(al_texto)
+    )
+    comp = esquemas.reparar("feedback", comp, mensajes, cancelacion, etiquetas)
+    return procesar_respuesta_comentario(comp, clave_cache, tipo, evaluaciones)
+
+async def generar_comentario_global_async(objetivo, evaluaciones, perfil_edad, tipo="objetivo", cancelacion=None,
+                                          al_texto=None):
+    """Versión async de generar_comentario_global (loop compartido de llm_async); la cache se lee en un hilo"""
+    clave_cache = clave_comentario_global(objetivo, evaluaciones, perfil_edad, tipo)
+    guardado = await asyncio.to_thread(cache.obtener, clave_cache)
+    if guardado:
+        print("⚡ Feedback global servido desde cache.")
+        return guardado
+
+    print("⏳ Generando feedback global (async)...")
+    mensajes = mensajes_comentario_global(objetivo, evaluaciones, perfil_edad, tipo)
+    etiquetas = {"tipo": tipo, "indicador": "_feedback_global"}
+    comp = await llm_gateway.llamar_async(
+        mensajes,
+        temperature=0.1,
+        cancelacion=cancelacion,
+        etiqueta="Feedback",
+        etiquetas=etiquetas,
+        al_fragmento=escucha_comentario(al_texto)
+    )
+    comp = await esquemas.reparar_async("feedback", comp, mensajes, cancelacion, etiquetas)
+    return await asyncio.to_thread(procesar_respuesta_comentario, comp, clave_cache, tipo, evaluaciones)
+
 def generar_comentario_actividad(actividad, evaluaciones, perfil_edad):
     """
     Versión alternativa para actividades.
@@ -164,10 +215,10 @@ def generar_comentario_actividad(actividad, evaluaciones, perfil_edad):
         '''
     
     print("⏳ Generando feedback de actividad...")
-    comp = llamada_segura_feedback(
-        messages=[{"role": "user", "content": prompt_feedback}],
+    comp = llm_gateway.llamar(
+        [{"role": "user", "content": prompt_feedback}],
         temperature=0.2,
-        retries=5
+        etiqueta="Feedback"
     )
     
     if comp:
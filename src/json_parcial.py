@@ -0,0 +1,175 @@
+import json
+
+# Lector incremental de JSON para respuestas en streaming. No construye un
+# árbol: sigue comillas, escapes y anidamiento carácter a carácter. Publica
+# cada campo de primer nivel en cuanto su valor está completo (la
+# calificación llega mucho antes que el análisis) y, si se le pide, reenvía
+# el texto de cada cadena a medida que se genera (feedback, informe final).
+
+
+class LectorJSON:
+    """
+    Se alimenta con trozos de texto. 'campos' tiene los campos de primer
+    nivel ya completos y 'completo' pasa a True al cerrarse el objeto; lo
+    que llegue después (o las vallas ```json de antes) se ignora.
+    Con al_texto(ruta, texto) recibe, trozo a trozo y ya sin escapes, el
+    contenido de cada cadena; ruta es la tupla de claves e índices hasta ella.
+    """
+
+    def __init__(self, al_texto=None):
+        self.al_texto = al_texto
+        self.texto = ""
+        self.campos = {}
+        self.completo = False
+        self._pos = 0
+        self._inicio = None
+        self._pila = []  # un marco por objeto / lista abiertos
+        self._en_cadena = False
+        self._es_clave = False
+        self._cadena_inicio = None
+        self._escape = 0  # caracteres que faltan de la secuencia de escape en curso
+        self._tras_barra = False
+        self._barra = None
+        self._emitido = None
+        self._valor_inicio = None
+
+    def ruta(self):
+        return tuple(m["clave"] if m["cierre"] == "}" else m["indice"] for m in self._pila)
+
+    def _abrir(self, cierre):
+        if cierre == "}":
+            self._pila.append({"cierre": "}", "clave": None, "esperando_clave": True})
+        else:
+            self._pila.append({"cierre": "]", "indice": 0})
+
+    def alimentar(self, fragmento):
+        """Añade un trozo; devuelve los nombres de los campos que se completaron con él"""
+        self.texto += fragmento or ""
+        nuevos = []
+        texto = self.texto
+        while self._pos < len(texto) and not self.completo:
+            i, c = self._pos, texto[self._pos]
+            self._pos += 1
+            if self._inicio is None:
+                if c == "{":
+                    self._inicio = i
+                    self._abrir("}")
+                continue
+            if self._en_cadena:
+                if self._escape:
+                    self._escape = 4 if self._tras_barra and c == "u" else self._escape - 1
+                    self._tras_barra = False
+                elif c == "\\":
+                    self._escape, self._tras_barra, self._barra = 1, True, i
+                elif c == '"':
+                    self._en_cadena = False
+                    self._cerrar_cadena(i)
+                continue
+
+            marco = self._pila[-1]
+            if c == '"':
+                self._en_cadena = True
+                self._cadena_inicio = i
+                self._es_clave = marco["cierre"] == "}" and marco["esperando_clave"]
+                self._emitido = i + 1
+            elif c == ":" and len(self._pila) == 1:
+                self._valor_inicio = i + 1
+            elif c in "{[":
+                self._abrir("}" if c == "{" else "]")
+            elif c in "}]":
+                if len(self._pila) == 1:
+                    self._cerrar_campo(i, nuevos)
+                    self.completo = True
+                self._pila.pop()
+            elif c == ",":
+                if len(self._pila) == 1:
+                    self._cerrar_campo(i, nuevos)
+                if marco["cierre"] == "}":
+                    marco["clave"], marco["esperando_clave"] = None, True
+                else:
+                    marco["indice"] += 1
+
+        if self._en_cadena and not self._es_clave:
+            self._reenviar(self._barra if self._escape else self._pos)
+        return nuevos
+
+    def _cerrar_cadena(self, fin):
+        if self._es_clave:
+            marco = self._pila[-1]
+            marco["clave"] = json.loads(self.texto[self._cadena_inicio:fin + 1], strict=False)
+            marco["esperando_clave"] = False
+        else:
+            self._reenviar(fin)
+
+    def _reenviar(self, hasta):
+        """Pasa a al_texto lo nuevo de la cadena en curso, sin cortar una secuencia de escape"""
+        if self.al_texto is None or hasta <= self._emitido:
+            return
+        trozo = json.loads('"' + self.texto[self._emitido:hasta] + '"', strict=False)
+        if trozo and "\ud800" <= trozo[-1] <= "\udbff":
+            # Primera mitad de un par 😀: se espera a la segunda
+            trozo, hasta = trozo[:-1], hasta - 6
+        self._emitido = hasta
+        if trozo:
+            self.al_texto(self.ruta(), trozo)
+
+    def _cerrar_campo(self, fin, nuevos):
+        clave = self._pila[0]["clave"]
+        if clave is not None and self._valor_inicio is not None:
+            try:
+                self.campos[clave] = json.loads(self.texto[self._valor_inicio:fin], strict=False)
+                nuevos.append(clave)
+            except ValueError:
+                pass
+        self._valor_inicio = None
+
+    def rescatar(self):
+        """
+        Para una respuesta cortada (max_tokens): intenta cerrar la cadena y
+        los corchetes abiertos; si ni así es JSON válido, devuelve sólo los
+        campos de primer nivel que llegaron completos.
+        """
+        if self.completo:
+            return json.loads(self.texto[self._inicio:self._pos], strict=False)
+        if self._inicio is None:
+            return {}
+        candidato = self.texto[self._inicio:]
+        if self._en_cadena:
+            candidato = (self.texto[self._inicio:self._barra] if self._escape else candidato) + '"'
+        candidato = candidato.rstrip().rstrip(",")
+        try:
+            return json.loads(candidato + "".join(m["cierre"] for m in reversed(self._pila)), strict=False)
+        except ValueError:
+            return dict(self.campos)
+
+
+def rescatar(texto):
+    """El mejor dict que se puede sacar de un JSON posiblemente truncado"""
+    lector = LectorJSON()
+    lector.alimentar(texto)
+    return lector.rescatar()
+
+
+def escucha(al_texto, campos):
+    """
+    Callback al_fragmento para llm_gateway: reenvía a al_texto, como
+    {"campo": "a.b.0.c", "texto": ...}, lo que va llegando de las cadenas que
+    cuelgan de alguna de las rutas de 'campos', y corta la lectura al
+    cerrarse el JSON. Si la llamada se reintenta avisa con {"reinicio": True}.
+    """
+    campos = [tuple(c) for c in campos]
+
+    def reenviar(ruta, trozo):
+        if any(ruta[:len(c)] == c for c in campos):
+            al_texto({"campo": ".".join(str(p) for p in ruta), "texto": trozo})
+
+    lector = LectorJSON(reenviar)
+
+    def al_fragmento(texto):
+        nonlocal lector
+        if not texto.startswith(lector.texto):
+            lector = LectorJSON(reenviar)
+            al_texto({"reinicio": True})
+        lector.alimentar(texto[len(lector.texto):])
+        return lector.completo
+    return al_fragmento
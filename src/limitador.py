@@ -0,0 +1,131 @@
+import time
+from src import config, prompts
+from src.almacen import conectar
+
+# Token bucket (peticiones/minuto y tokens/minuto) guardado en SQLite para que
+# todos los workers de gunicorn compartan el mismo cupo de Groq.
+
+ESPERA_MAXIMA_POR_CICLO = 5.0
+
+
+def _db():
+    conn = conectar("limitador")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS buckets (
+            nombre TEXT PRIMARY KEY,
+            peticiones REAL NOT NULL,
+            tokens REAL NOT NULL,
+            actualizado REAL NOT NULL
+        )
+    """)
+    return conn
+
+
+def estimar_tokens(messages, max_tokens=None):
+    """Aproximación barata: ~4 caracteres por token más la respuesta esperada"""
+    texto = sum(prompts.contar_tokens(m.get("content")) for m in messages)
+    return texto + (max_tokens or config.TOKENS_RESPUESTA_ESTIMADOS)
+
+
+def _leer_y_recargar(conn, nombre, rpm, tpm, ahora):
+    fila = conn.execute(
+        "SELECT peticiones, tokens, actualizado FROM buckets WHERE nombre = ?", (nombre,)
+    ).fetchone()
+    if fila is None:
+        return float(rpm), float(tpm)
+    peticiones, tokens, actualizado = fila
+    transcurrido = max(0.0, ahora - actualizado)
+    peticiones = min(rpm, peticiones + transcurrido * rpm / 60.0)
+    tokens = min(tpm, tokens + transcurrido * tpm / 60.0)
+    return peticiones, tokens
+
+
+def _guardar(conn, nombre, peticiones, tokens, ahora):
+    conn.execute(
+        "INSERT OR REPLACE INTO buckets (nombre, peticiones, tokens, actualizado) VALUES (?, ?, ?, ?)",
+        (nombre, peticiones, tokens, ahora)
+    )
+
+
+def intentar(tokens, nombre="groq", rpm=None, tpm=None):
+    """
+    Un intento atómico de tomar cupo. Devuelve 0 si se descontó, o los
+    segundos que conviene esperar antes de volver a intentar.
+    """
+    rpm = rpm or config.LIMITE_RPM
+    tpm = tpm or config.LIMITE_TPM
+    necesarios = min(tokens, tpm)
+    conn = _db()
+    ahora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        peticiones, disponibles = _leer_y_recargar(conn, nombre, rpm, tpm, ahora)
+        if peticiones >= 1 and disponibles >= necesarios:
+            _guardar(conn, nombre, peticiones - 1, disponibles - necesarios, ahora)
+            conn.execute("COMMIT")
+            return 0
+        _guardar(conn, nombre, peticiones, disponibles, ahora)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    espera = max(
+        (1 - peticiones) * 60.0 / rpm if peticiones < 1 else 0,
+        (necesarios - disponibles) * 60.0 / tpm if disponibles < necesarios else 0
+    )
+    return min(max(espera, 0.05), ESPERA_MAXIMA_POR_CICLO)
+
+
+def margen(nombre="groq", rpm=None, tpm=None):
+    """Fracción del cupo que le queda al bucket (0 = vacío, 1 = lleno), sin consumir nada"""
+    rpm = rpm or config.LIMITE_RPM
+    tpm = tpm or config.LIMITE_TPM
+    peticiones, tokens = _leer_y_recargar(_db(), nombre, rpm, tpm, time.time())
+    return min(peticiones / rpm, tokens / tpm)
+
+
+def ajustar(reservados, reales, nombre="groq", rpm=None, tpm=None):
+    """Corrige el bucket con los tokens reales que reportó la API (usage)"""
+    if reales is None:
+        return
+    rpm = rpm or config.LIMITE_RPM
+    tpm = tpm or config.LIMITE_TPM
+    conn = _db()
+    ahora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        peticiones, disponibles = _leer_y_recargar(conn, nombre, rpm, tpm, ahora)
+        disponibles = min(tpm, disponibles + reservados - reales)
+        _guardar(conn, nombre, peticiones, disponibles, ahora)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def vaciar(nombre="groq", rpm=None, tpm=None):
+    """
+    Tras un 429 vaciamos el bucket: todos los workers esperan a que se
+    recargue en lugar de insistir con pausas fijas.
+    """
+    conn = _db()
+    ahora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _guardar(conn, nombre, 0.0, 0.0, ahora)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def tokens_usados(comp):
+    """Extrae total_tokens del objeto de respuesta (o None si no viene)"""
+    try:
+        return comp["usage"]["total_tokens"]
+    except Exception:
+        usage = getattr(comp, "usage", None)
+        if isinstance(usage, dict):
+            return usage.get("total_tokens")
+        return getattr(usage, "total_tokens", None)
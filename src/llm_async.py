@@ -0,0 +1,89 @@
+import asyncio
+import atexit
+import os
+import threading
+import aiohttp
+import openai
+from src import config
+from src.cancelacion import EvaluacionCancelada, INTERVALO_REVISION
+
+# Un único event loop por worker, en su propio hilo, con una sesión aiohttp
+# compartida: todas las llamadas async reutilizan conexiones TLS keep-alive
+# hacia el endpoint LLM en lugar de abrir una por llamada.
+
+_loop = None
+_sesion = None
+_en_vuelo = None
+_pid = None
+_lock = threading.Lock()
+
+
+def _arrancar():
+    global _loop, _sesion, _en_vuelo, _pid
+    with _lock:
+        if _loop is not None and _pid == os.getpid():
+            return _loop
+
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True, name="llm_async").start()
+
+        async def crear_sesion():
+            conector = aiohttp.TCPConnector(limit=config.ASYNC_POOL_CONEXIONES, keepalive_timeout=60)
+            return aiohttp.ClientSession(connector=conector), asyncio.Semaphore(config.ASYNC_MAX_EN_VUELO)
+
+        _sesion, _en_vuelo = asyncio.run_coroutine_threadsafe(crear_sesion(), loop).result()
+        _loop, _pid = loop, os.getpid()
+        atexit.register(_cerrar, loop, _sesion)
+        print(f"✅ Loop async listo (pool de {config.ASYNC_POOL_CONEXIONES} conexiones).")
+        return _loop
+
+
+def _cerrar(loop, sesion):
+    try:
+        asyncio.run_coroutine_threadsafe(sesion.close(), loop).result(timeout=2)
+    except Exception:
+        pass
+
+
+def enviar(corrutina):
+    """Programa la corrutina en el loop compartido; devuelve un concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(corrutina, _arrancar())
+
+
+def ejecutar(corrutina):
+    """Versión bloqueante de enviar() para código síncrono"""
+    return enviar(corrutina).result()
+
+
+async def _crear(leer=None, **kwargs):
+    # aiosession es un ContextVar: lo fijamos en el contexto de esta tarea
+    openai.aiosession.set(_sesion)
+    if leer is None:
+        return await openai.ChatCompletion.acreate(**kwargs)
+    return await leer(await openai.ChatCompletion.acreate(stream=True, **kwargs))
+
+
+async def _esperar_cancelable(corrutina, cancelacion):
+    """Espera la llamada HTTP; si el token se cancela (o vence su plazo), la aborta de verdad"""
+    tarea = asyncio.ensure_future(corrutina)
+    if cancelacion is None:
+        return await tarea
+    while True:
+        hecho, _ = await asyncio.wait({tarea}, timeout=INTERVALO_REVISION)
+        if hecho:
+            return tarea.result()
+        try:
+            await cancelacion.verificar_async()
+        except EvaluacionCancelada:
+            tarea.cancel()
+            raise
+
+
+async def crear_cancelable(parametros, cancelacion=None, leer=None):
+    """
+    Una llamada acreate sobre el pool compartido (los reintentos los decide
+    llm_gateway). Con leer, la respuesta llega en streaming y leer(fragmentos)
+    la consume dentro del mismo cupo de llamadas en vuelo.
+    """
+    async with _en_vuelo:
+        return await _esperar_cancelable(_crear(leer, **parametros), cancelacion)
@@ -0,0 +1,504 @@
+import asyncio
+import functools
+import random
+import time
+from email.utils import parsedate_to_datetime
+import openai
+from src import claves, concurrencia, config, limitador, llm_async, metricas, prompts
+from src.almacen import conectar
+from src.cancelacion import EvaluacionCancelada, PlazoAgotado, ejecutar_cancelable, INTERVALO_REVISION
+
+# Punto único de salida hacia el LLM. Todas las llamadas (indicadores,
+# introducción, feedback, informe final; síncronas o async) pasan por aquí:
+# cupo compartido (repartido entre las claves del pool), backoff exponencial
+# con jitter, Retry-After, plazo máximo y un circuit breaker compartido entre
+# workers para fallar rápido cuando el proveedor está caído.
+
+MODELO_POR_DEFECTO = "llama-3.1-8b-instant"
+
+# Errores que merece la pena reintentar (429, 5xx, timeouts, conexión)
+ERRORES_TRANSITORIOS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.TryAgain,
+)
+
+
+# --- CIRCUIT BREAKER ---
+
+def _db():
+    conn = conectar("circuitos")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS circuitos (
+            nombre TEXT PRIMARY KEY,
+            fallos INTEGER NOT NULL,
+            abierto_hasta REAL NOT NULL
+        )
+    """)
+    return conn
+
+
+def circuito_permite(nombre="groq"):
+    """
+    False mientras el circuito está abierto. Al vencer el plazo deja pasar
+    una única llamada de prueba (medio abierto) y mantiene cerrado el paso
+    al resto hasta que esa prueba termine. Con el circuito cerrado (lo
+    normal) basta una lectura: sólo el paso a medio abierto toma el lock.
+    """
+    conn = _db()
+    ahora = time.time()
+    fila = conn.execute("SELECT fallos, abierto_hasta FROM circuitos WHERE nombre = ?", (nombre,)).fetchone()
+    if not fila or fila[0] < config.CIRCUITO_UMBRAL_FALLOS:
+        return True
+    if fila[1] > ahora:
+        return False
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Releer dentro del lock: otro worker pudo mandar ya la llamada de prueba
+        fila = conn.execute("SELECT fallos, abierto_hasta FROM circuitos WHERE nombre = ?", (nombre,)).fetchone()
+        if not fila or fila[0] < config.CIRCUITO_UMBRAL_FALLOS:
+            conn.execute("COMMIT")
+            return True
+        if fila[1] > ahora:
+            conn.execute("COMMIT")
+            return False
+        # Medio abierto: esta llamada es la prueba, el resto sigue esperando
+        conn.execute("UPDATE circuitos SET abierto_hasta = ? WHERE nombre = ?",
+                     (ahora + config.CIRCUITO_SEGUNDOS_ABIERTO, nombre))
+        conn.execute("COMMIT")
+        print(f"🔌 Circuito {nombre} medio abierto: enviando llamada de prueba.")
+        return True
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def registrar_exito(nombre="groq"):
+    conn = _db()
+    fila = conn.execute("SELECT fallos FROM circuitos WHERE nombre = ?", (nombre,)).fetchone()
+    if fila and fila[0]:
+        conn.execute("UPDATE circuitos SET fallos = 0, abierto_hasta = 0 WHERE nombre = ?", (nombre,))
+        if fila[0] >= config.CIRCUITO_UMBRAL_FALLOS:
+            print(f"✅ Circuito {nombre} cerrado: el proveedor vuelve a responder.")
+
+
+def registrar_fallo(nombre="groq"):
+    conn = _db()
+    ahora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        fila = conn.execute("SELECT fallos FROM circuitos WHERE nombre = ?", (nombre,)).fetchone()
+        fallos = (fila[0] if fila else 0) + 1
+        abierto_hasta = ahora + config.CIRCUITO_SEGUNDOS_ABIERTO if fallos >= config.CIRCUITO_UMBRAL_FALLOS else 0
+        conn.execute("INSERT OR REPLACE INTO circuitos (nombre, fallos, abierto_hasta) VALUES (?, ?, ?)",
+                     (nombre, fallos, abierto_hasta))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if fallos == config.CIRCUITO_UMBRAL_FALLOS:
+        print(f"⛔ Circuito {nombre} abierto tras {fallos} fallos seguidos.")
+
+
+def estado_circuito(nombre="groq"):
+    fila = _db().execute("SELECT fallos, abierto_hasta FROM circuitos WHERE nombre = ?", (nombre,)).fetchone()
+    fallos, abierto_hasta = fila if fila else (0, 0)
+    return {
+        "nombre": nombre,
+        "fallos_consecutivos": fallos,
+        "abierto": fallos >= config.CIRCUITO_UMBRAL_FALLOS and abierto_hasta > time.time(),
+    }
+
+
+# --- CLASIFICACIÓN DE ERRORES Y ESPERAS ---
+
+def _estado_http(error):
+    return getattr(error, "http_status", None)
+
+
+def es_rate_limit(error):
+    return isinstance(error, openai.error.RateLimitError) or _estado_http(error) == 429
+
+
+def resultado_para_concurrencia(error):
+    """Cómo cuenta un intento fallido para el control AIMD de llamadas en vuelo"""
+    if isinstance(error, EvaluacionCancelada):
+        return "cancelado"
+    if es_rate_limit(error):
+        return "rate_limit"
+    if isinstance(error, (openai.error.Timeout, asyncio.TimeoutError)):
+        return "timeout"
+    return "error"
+
+
+def es_transitorio(error):
+    if isinstance(error, (ERRORES_TRANSITORIOS, asyncio.TimeoutError)):
+        return True
+    estado = _estado_http(error)
+    if estado is not None:
+        return estado == 429 or estado >= 500
+    # APIError sin estado: respuesta cortada o ilegible, se puede reintentar
+    return isinstance(error, openai.error.APIError)
+
+
+def segundos_retry_after(error):
+    """Lee la cabecera Retry-After (segundos o fecha HTTP) si el servidor la envió"""
+    cabeceras = getattr(error, "headers", None) or {}
+    valor = None
+    for nombre in ("retry-after", "Retry-After"):
+        try:
+            valor = cabeceras.get(nombre)
+        except Exception:
+            valor = None
+        if valor:
+            break
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def calcular_espera(intento, retry_after=None):
+    """Backoff exponencial con 'full jitter'; si el servidor pidió esperar, se respeta"""
+    techo = min(config.LLM_BACKOFF_MAXIMO, config.LLM_BACKOFF_BASE * 2 ** intento)
+    espera = random.uniform(0, techo)
+    if retry_after is not None:
+        # Un poco de jitter encima para que los workers no vuelvan todos a la vez
+        espera = retry_after + random.uniform(0, min(1.0, techo))
+    return espera
+
+
+def _tras_error(error, intento, reintentos, limite, etiqueta, nombre, et, credencial):
+    """Decide si se reintenta. Devuelve los segundos a esperar o None para abandonar."""
+    if not es_transitorio(error):
+        print(f"❌ Error no recuperable en {etiqueta}: {str(error)}")
+        return None
+
+    rotar = False
+    if es_rate_limit(error):
+        # Sólo se castiga la clave que recibió el 429: su cupo se vacía (para
+        # que ningún worker insista) y sale de la rotación un rato
+        limitador.vaciar(credencial.nombre)
+        claves.pausar(credencial, segundos_retry_after(error))
+        metricas.incrementar("llm_rate_limit_total", tipo=et["tipo"], clave=credencial.nombre)
+        motivo = "Rate Limit"
+        rotar = claves.hay_otra_activa(credencial)
+    else:
+        registrar_fallo(nombre)
+        motivo = f"Error transitorio ({type(error).__name__})"
+
+    if intento + 1 >= reintentos:
+        print(f"❌ Se agotaron los reintentos con {etiqueta}.")
+        return None
+
+    # Si otra clave tiene cupo no hace falta esperar: el reintento sale por ella
+    espera = 0.0 if rotar else calcular_espera(intento, segundos_retry_after(error))
+    if time.monotonic() + espera > limite:
+        print(f"⌛ {etiqueta}: no queda plazo para otro reintento, se abandona.")
+        return None
+
+    print(f"⚠️ {motivo} en {etiqueta} (Intento {intento+1}/{reintentos}). Reintentando en {espera:.1f}s...")
+    metricas.incrementar("llm_reintentos_total", tipo=et["tipo"], motivo=type(error).__name__)
+    metricas.incrementar("llm_espera_segundos_total", espera, tipo=et["tipo"], motivo="backoff")
+    return espera
+
+
+def _tras_exito(tokens, comp, credencial, nombre):
+    limitador.ajustar(tokens, limitador.tokens_usados(comp), nombre=credencial.nombre)
+    registrar_exito(nombre)
+
+
+def _etiquetas(etiquetas):
+    """tipo (introduccion, objetivo, actividad, feedback, informe), modelo e indicador"""
+    return dict({"tipo": "otro", "modelo": None, "indicador": None}, **(etiquetas or {}))
+
+
+def _registrar_espera(et, segundos, motivo="limitador"):
+    metricas.incrementar("llm_espera_segundos_total", segundos, tipo=et["tipo"], motivo=motivo)
+    metricas.observar("evaluacion_etapa_segundos", segundos, tipo=et["tipo"], etapa=f"espera_{motivo}")
+
+
+def _registrar_intento(et, duracion, comp=None, error=None, credencial=None):
+    resultado = "ok" if error is None else type(error).__name__
+    metricas.observar("llm_llamada_segundos", duracion, tipo=et["tipo"], modelo=et["modelo"])
+    metricas.observar("evaluacion_etapa_segundos", duracion, tipo=et["tipo"], etapa="llm")
+    metricas.incrementar("llm_llamadas_total", tipo=et["tipo"], modelo=et["modelo"],
+                         indicador=et["indicador"], resultado=resultado)
+    if credencial is not None:
+        metricas.incrementar("llm_clave_llamadas_total", clave=credencial.nombre, resultado=resultado)
+    if comp is None:
+        return
+    try:
+        usage = comp["usage"]
+        for clase in ("prompt", "completion"):
+            metricas.incrementar("llm_tokens_total", usage[f"{clase}_tokens"], tipo=et["tipo"],
+                                 modelo=et["modelo"], indicador=et["indicador"], clase=clase)
+        if credencial is not None:
+            metricas.incrementar("llm_clave_tokens_total", usage["total_tokens"], clave=credencial.nombre)
+    except Exception:
+        pass
+
+
+def _limite(plazo, cancelacion):
+    """Instante tope para esta llamada: su propio plazo o el de la petición, el que venza antes"""
+    limite = time.monotonic() + (plazo or config.LLM_PLAZO_SEGUNDOS)
+    if cancelacion is not None and cancelacion.limite is not None:
+        limite = min(limite, cancelacion.limite)
+    return limite
+
+
+def _sin_tiempo(limite, etiqueta, et):
+    """True si no da tiempo a una llamada de este tipo antes del plazo: mejor degradar ya que a medias"""
+    if limite - time.monotonic() > concurrencia.latencia_habitual(et["tipo"]):
+        return False
+    print(f"⌛ {etiqueta}: no da tiempo antes del plazo de la petición, se degrada sin llamar.")
+    metricas.incrementar("llm_plazo_agotado_total", tipo=et["tipo"], motivo="sin_tiempo")
+    return True
+
+
+def _parametros(messages, model, temperature, max_tokens, en_stream=False):
+    """
+    El modo JSON de Groq no admite stream=True (responde 400): en streaming
+    se pide sin response_format y el JSON lo validan json_parcial y esquemas.
+    """
+    parametros = dict(model=model, messages=messages, temperature=temperature)
+    if not en_stream:
+        parametros["response_format"] = {"type": "json_object"}
+    if max_tokens:
+        parametros["max_tokens"] = max_tokens
+    return parametros
+
+
+def _con_credencial(parametros, credencial, limite):
+    """
+    openai 0.28 acepta api_key, api_base y request_timeout por llamada: cada
+    intento sale por su clave y no espera al proveedor más allá del plazo, así
+    una llamada abandonada (cancelada, plazo vencido) no retiene su hilo.
+    """
+    restante = max(limite - time.monotonic(), 1.0)
+    parametros = dict(parametros, api_base=credencial.api_base, request_timeout=restante)
+    if credencial.api_key:
+        parametros["api_key"] = credencial.api_key
+    return parametros
+
+
+# --- STREAMING ---
+
+def _texto_del_fragmento(fragmento):
+    try:
+        return fragmento["choices"][0]["delta"].get("content") or ""
+    except (KeyError, IndexError, TypeError):
+        return ""
+
+
+def _uso_del_fragmento(fragmento):
+    """Groq manda el usage en x_groq del último fragmento; OpenAI, en 'usage'"""
+    try:
+        return fragmento.get("usage") or (fragmento.get("x_groq") or {}).get("usage")
+    except AttributeError:
+        return None
+
+
+def _debe_cortar(texto, al_fragmento, max_tokens, cancelacion, et):
+    """True si ya no hace falta seguir leyendo el stream"""
+    if cancelacion is not None:
+        cancelacion.verificar()
+    if al_fragmento(texto):
+        metricas.incrementar("llm_stream_cortes_total", tipo=et["tipo"], motivo="json_completo")
+        return True
+    if max_tokens and prompts.contar_tokens(texto) > max_tokens:
+        # Por si el proveedor no respeta max_tokens: no se paga una respuesta que divaga
+        print(f"✂️ Respuesta de {et['indicador'] or et['tipo']} cortada al superar {max_tokens} tokens.")
+        metricas.incrementar("llm_stream_cortes_total", tipo=et["tipo"], motivo="limite_tokens")
+        return True
+    return False
+
+
+def _completion(texto, uso, messages):
+    """Respuesta con la misma forma que la de la API sin streaming (usage estimado si no vino)"""
+    if not uso:
+        entrada = sum(prompts.contar_tokens(m.get("content")) for m in messages)
+        salida = prompts.contar_tokens(texto)
+        uso = {"prompt_tokens": entrada, "completion_tokens": salida, "total_tokens": entrada + salida}
+    return openai.openai_object.OpenAIObject.construct_from({
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": texto}, "finish_reason": "stop"}],
+        "usage": dict(uso),
+    })
+
+
+def _leer_stream(fragmentos, al_fragmento, messages, max_tokens, cancelacion, et):
+    texto, uso = "", None
+    try:
+        for fragmento in fragmentos:
+            texto += _texto_del_fragmento(fragmento)
+            uso = _uso_del_fragmento(fragmento) or uso
+            if _debe_cortar(texto, al_fragmento, max_tokens, cancelacion, et):
+                break
+    finally:
+        fragmentos.close()
+    return _completion(texto, uso, messages)
+
+
+async def _leer_stream_async(fragmentos, al_fragmento, messages, max_tokens, cancelacion, et):
+    texto, uso = "", None
+    try:
+        async for fragmento in fragmentos:
+            texto += _texto_del_fragmento(fragmento)
+            uso = _uso_del_fragmento(fragmento) or uso
+            if cancelacion is not None:
+                await cancelacion.verificar_async()
+            if _debe_cortar(texto, al_fragmento, max_tokens, None, et):
+                break
+    finally:
+        await fragmentos.aclose()
+    return _completion(texto, uso, messages)
+
+
+# --- LLAMADAS ---
+
+def llamar(messages, model=MODELO_POR_DEFECTO, temperature=0.1, max_tokens=None, cancelacion=None,
+           etiqueta="Groq", reintentos=None, plazo=None, etiquetas=None, al_fragmento=None):
+    """
+    Llamada síncrona al LLM con respuesta JSON. Devuelve la respuesta de la
+    API o None si se canceló, el error no era recuperable, el circuito está
+    abierto o se agotaron los reintentos / el plazo. El plazo es el menor
+    entre 'plazo' y el de la petición (que viaja en 'cancelacion'); si no
+    da tiempo a otra llamada no se hace. 'etiquetas' (tipo, modelo,
+    indicador) sólo se usa para las métricas.
+
+    Con al_fragmento la respuesta se pide en streaming: al_fragmento(texto)
+    recibe el texto acumulado tras cada trozo (en un reintento vuelve a
+    empezar) y puede devolver True para dejar de leer.
+    """
+    nombre = "groq"
+    et = _etiquetas(etiquetas)
+    tokens = limitador.estimar_tokens(messages, max_tokens)
+    parametros = _parametros(messages, model, temperature, max_tokens, al_fragmento is not None)
+    reintentos = reintentos or config.LLM_REINTENTOS
+    limite = _limite(plazo, cancelacion)
+
+    def crear(credencial, turno):
+        turno.empezar()
+        parametros_intento = _con_credencial(parametros, credencial, limite)
+        if al_fragmento is None:
+            comp = openai.ChatCompletion.create(**parametros_intento)
+        else:
+            comp = _leer_stream(openai.ChatCompletion.create(stream=True, **parametros_intento),
+                                al_fragmento, messages, max_tokens, cancelacion, et)
+        limitador.ajustar(tokens, limitador.tokens_usados(comp), nombre=credencial.nombre)
+        return comp
+
+    for intento in range(reintentos):
+        if not circuito_permite(nombre):
+            print(f"⛔ Circuito abierto: {etiqueta} falla rápido sin llamar a la API.")
+            return None
+        if _sin_tiempo(limite, etiqueta, et):
+            return None
+        inicio = time.perf_counter()
+        credencial = None
+        try:
+            # Esperamos turno en el cupo de la clave con más margen antes de salir al proveedor
+            credencial, esperado = claves.adquirir(tokens, cancelacion=cancelacion)
+            _registrar_espera(et, esperado)
+            with concurrencia.turno(et["tipo"], cancelacion, resultado_para_concurrencia) as turno:
+                _registrar_espera(et, turno.esperado, "concurrencia")
+                inicio = time.perf_counter()
+                comp = ejecutar_cancelable(functools.partial(crear, credencial, turno), cancelacion)
+            _registrar_intento(et, time.perf_counter() - inicio, comp, credencial=credencial)
+            registrar_exito(nombre)
+            return comp
+        except PlazoAgotado:
+            print(f"⌛ Llamada a {etiqueta} cortada: se agotó el plazo de la petición.")
+            metricas.incrementar("llm_plazo_agotado_total", tipo=et["tipo"], motivo="cortada")
+            return None
+        except EvaluacionCancelada:
+            print(f"🛑 Llamada a {etiqueta} cancelada.")
+            return None
+        except Exception as e:
+            _registrar_intento(et, time.perf_counter() - inicio, error=e, credencial=credencial)
+            espera = _tras_error(e, intento, reintentos, limite, etiqueta, nombre, et, credencial)
+            if espera is None:
+                return None
+
+        if cancelacion is not None:
+            if cancelacion.esperar(espera):
+                print(f"🛑 Llamada a {etiqueta} cancelada.")
+                return None
+        else:
+            time.sleep(espera)
+    return None
+
+
+async def _dormir_async(segundos, cancelacion=None):
+    """asyncio.sleep que se corta si el token se cancela; devuelve True si se canceló"""
+    fin = time.monotonic() + segundos
+    while True:
+        if cancelacion is not None and await cancelacion.is_set_async():
+            return True
+        restante = fin - time.monotonic()
+        if restante <= 0:
+            return False
+        await asyncio.sleep(min(restante, INTERVALO_REVISION) if cancelacion is not None else restante)
+
+
+async def llamar_async(messages, model=MODELO_POR_DEFECTO, temperature=0.1, max_tokens=None, cancelacion=None,
+                       etiqueta="Groq", reintentos=None, plazo=None, etiquetas=None, al_fragmento=None):
+    """Igual que llamar(), sobre el loop y el pool de conexiones de llm_async"""
+    nombre = "groq"
+    et = _etiquetas(etiquetas)
+    tokens = limitador.estimar_tokens(messages, max_tokens)
+    parametros = _parametros(messages, model, temperature, max_tokens, al_fragmento is not None)
+    reintentos = reintentos or config.LLM_REINTENTOS
+    limite = _limite(plazo, cancelacion)
+    leer = None
+    if al_fragmento is not None:
+        leer = functools.partial(_leer_stream_async, al_fragmento=al_fragmento, messages=messages,
+                                 max_tokens=max_tokens, cancelacion=cancelacion, et=et)
+
+    # Todo lo que toca SQLite (circuito, cupo, pausas de claves) va a un hilo:
+    # un lock disputado no debe frenar las demás corrutinas del loop compartido
+    for intento in range(reintentos):
+        if not await asyncio.to_thread(circuito_permite, nombre):
+            print(f"⛔ Circuito abierto: {etiqueta} falla rápido sin llamar a la API.")
+            return None
+        if _sin_tiempo(limite, etiqueta, et):
+            return None
+        inicio = time.perf_counter()
+        credencial = None
+        try:
+            credencial, esperado = await claves.adquirir_async(tokens, cancelacion=cancelacion)
+            _registrar_espera(et, esperado)
+            async with concurrencia.turno(et["tipo"], cancelacion, resultado_para_concurrencia) as turno:
+                _registrar_espera(et, turno.esperado, "concurrencia")
+                inicio = time.perf_counter()
+                comp = await llm_async.crear_cancelable(_con_credencial(parametros, credencial, limite), cancelacion, leer)
+            _registrar_intento(et, time.perf_counter() - inicio, comp, credencial=credencial)
+            await asyncio.to_thread(_tras_exito, tokens, comp, credencial, nombre)
+            return comp
+        except PlazoAgotado:
+            print(f"⌛ Llamada async a {etiqueta} cortada: se agotó el plazo de la petición.")
+            metricas.incrementar("llm_plazo_agotado_total", tipo=et["tipo"], motivo="cortada")
+            return None
+        except EvaluacionCancelada:
+            print(f"🛑 Llamada async a {etiqueta} cancelada.")
+            return None
+        except Exception as e:
+            _registrar_intento(et, time.perf_counter() - inicio, error=e, credencial=credencial)
+            espera = await asyncio.to_thread(_tras_error, e, intento, reintentos, limite, etiqueta, nombre, et,
+                                             credencial)
+            if espera is None:
+                return None
+
+        if await _dormir_async(espera, cancelacion):
+            print(f"🛑 Llamada async a {etiqueta} cancelada.")
+            return None
+    return None
@@ -0,0 +1,209 @@
+import atexit
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from src import config
+from src.almacen import conectar
+
+# Métricas estilo Prometheus. Cada proceso acumula sus contadores e
+# histogramas en memoria y los vuelca a SQLite cada pocos segundos; /metrics
+# suma lo de todos los workers de gunicorn.
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+DEFINICIONES = {
+    "http_peticiones_total": ("counter", "Peticiones HTTP por ruta, método y código"),
+    "http_peticion_segundos": ("histogram", "Duración de las peticiones HTTP por ruta"),
+    "evaluacion_etapa_segundos": ("histogram", "Tiempo por tipo de apartado y etapa (validacion, carga_datos, espera_limitador, espera_concurrencia, llm, primera_calificacion, parseo)"),
+    "llm_llamada_segundos": ("histogram", "Latencia de cada intento de llamada al LLM por tipo y modelo pedagógico"),
+    "llm_llamadas_total": ("counter", "Intentos de llamada al LLM por tipo, modelo, indicador y resultado"),
+    "llm_reintentos_total": ("counter", "Reintentos de llamadas al LLM por tipo y motivo"),
+    "llm_rate_limit_total": ("counter", "Respuestas 429 del proveedor por tipo y clave"),
+    "llm_espera_segundos_total": ("counter", "Segundos dormidos antes de llamar (limitador, concurrencia) o entre reintentos (backoff)"),
+    "llm_stream_cortes_total": ("counter", "Respuestas en streaming cuya lectura se cortó (JSON ya completo o tope de tokens)"),
+    "llm_plazo_agotado_total": ("counter", "Llamadas al LLM no hechas (sin_tiempo) o cortadas (cortada) por el plazo de la petición"),
+    "evaluacion_degradada_total": ("counter", "Partes de una evaluación servidas con plantilla o incompletas por plazo o fallo del LLM"),
+    "llm_reparaciones_total": ("counter", "Respuestas fuera de esquema por esquema, vía (local, llamada) y resultado"),
+    "llm_parseo_fallos_total": ("counter", "Respuestas del LLM que no se pudieron interpretar"),
+    "llm_tokens_total": ("counter", "Tokens reportados por la API (prompt/completion) por tipo, modelo e indicador"),
+    "llm_clave_llamadas_total": ("counter", "Intentos de llamada al LLM por clave del pool y resultado"),
+    "llm_clave_tokens_total": ("counter", "Tokens totales reportados por la API por clave del pool"),
+    "prefiltro_llamadas_evitadas_total": ("counter", "Indicadores resueltos como nivel 1 por el prefiltro léxico, sin llamar al LLM"),
+    "puntos_control_recuperados_total": ("counter", "Indicadores recuperados del punto de control de una evaluación interrumpida"),
+    "deduplicacion_peticiones_total": ("counter", "Evaluaciones de apartado: propias, compartidas con una idéntica en curso o relevos"),
+    "prompt_tokens_ahorrados_total": ("counter", "Tokens estimados que no se enviaron por recorte de contenido o compactación del prompt"),
+}
+
+_valores = {}
+_lock = threading.Lock()
+_proceso = None
+_pid = None
+_ultimo_volcado = 0.0
+_volcando = False
+
+
+def _db():
+    conn = conectar("metricas")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metricas (
+            proceso TEXT NOT NULL,
+            serie TEXT NOT NULL,
+            etiquetas TEXT NOT NULL,
+            valor REAL NOT NULL,
+            PRIMARY KEY (proceso, serie, etiquetas)
+        )
+    """)
+    return conn
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(etiquetas):
+    return ",".join(f'{k}="{_escapar(v)}"' for k, v in sorted(etiquetas.items()) if v is not None)
+
+
+def _revisar_proceso():
+    """Un worker recién creado por fork no debe heredar (ni duplicar) lo del padre"""
+    global _proceso, _pid
+    if _pid != os.getpid():
+        _valores.clear()
+        _pid = os.getpid()
+        _proceso = f"{_pid}-{uuid.uuid4().hex[:8]}"
+
+
+def _sumar(serie, etiquetas, valor):
+    clave = (serie, etiquetas)
+    _valores[clave] = _valores.get(clave, 0.0) + valor
+
+
+def incrementar(nombre, valor=1.0, **etiquetas):
+    with _lock:
+        _revisar_proceso()
+        _sumar(nombre, _etiquetas(etiquetas), valor)
+    _volcar_si_toca()
+
+
+def observar(nombre, valor, **etiquetas):
+    """Registra una observación en un histograma (buckets acumulados, _sum y _count)"""
+    base = _etiquetas(etiquetas)
+    with _lock:
+        _revisar_proceso()
+        for limite in BUCKETS_SEGUNDOS:
+            if valor <= limite:
+                _sumar(f"{nombre}_bucket", _etiquetas(dict(etiquetas, le=limite)), 1)
+        _sumar(f"{nombre}_bucket", _etiquetas(dict(etiquetas, le="+Inf")), 1)
+        _sumar(f"{nombre}_sum", base, valor)
+        _sumar(f"{nombre}_count", base, 1)
+    _volcar_si_toca()
+
+
+@contextmanager
+def cronometro(nombre, **etiquetas):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar(nombre, time.perf_counter() - inicio, **etiquetas)
+
+
+def _volcar():
+    global _ultimo_volcado
+    with _lock:
+        _revisar_proceso()
+        filas = [(_proceso, serie, etiquetas, valor) for (serie, etiquetas), valor in _valores.items()]
+        _ultimo_volcado = time.monotonic()
+    if not filas:
+        return
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO metricas (proceso, serie, etiquetas, valor) VALUES (?, ?, ?, ?)", filas
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _volcar_si_toca():
+    """El volcado periódico va en un hilo aparte: incrementar() no espera nunca a SQLite (ni frena el loop async)"""
+    global _volcando
+    if time.monotonic() - _ultimo_volcado < config.METRICAS_VOLCADO_SEGUNDOS:
+        return
+    with _lock:
+        if _volcando:
+            return
+        _volcando = True
+    threading.Thread(target=_volcar_en_segundo_plano, daemon=True, name="metricas_volcado").start()
+
+
+def _volcar_en_segundo_plano():
+    global _volcando
+    try:
+        _volcar()
+    except Exception as e:
+        print(f"⚠️ No se pudieron volcar las métricas: {e}")
+    finally:
+        _volcando = False
+
+
+def _nombre_base(serie):
+    for sufijo in ("_bucket", "_sum", "_count"):
+        if serie.endswith(sufijo) and DEFINICIONES.get(serie[:-len(sufijo)], ("",))[0] == "histogram":
+            return serie[:-len(sufijo)]
+    return serie
+
+
+def _orden(fila):
+    """Agrupa las series de cada combinación de etiquetas y ordena los buckets por su límite"""
+    serie, etiquetas, _ = fila
+    partes = etiquetas.split(",") if etiquetas else []
+    le = next((p[4:-1] for p in partes if p.startswith('le="')), None)
+    resto = ",".join(p for p in partes if not p.startswith('le="'))
+    limite = float("inf") if le == "+Inf" else float(le) if le else 0.0
+    return resto, serie, limite
+
+
+def exponer(extras=None):
+    """Texto en formato de exposición de Prometheus con la suma de todos los workers"""
+    _volcar()
+    filas = _db().execute(
+        "SELECT serie, etiquetas, SUM(valor) FROM metricas GROUP BY serie, etiquetas"
+    ).fetchall()
+
+    por_metrica = {}
+    for serie, etiquetas, valor in filas:
+        por_metrica.setdefault(_nombre_base(serie), []).append((serie, etiquetas, valor))
+
+    lineas = []
+    for nombre, (tipo, ayuda) in DEFINICIONES.items():
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for serie, etiquetas, valor in sorted(por_metrica.get(nombre, []), key=_orden):
+            lineas.append(f"{serie}{{{etiquetas}}} {valor:g}" if etiquetas else f"{serie} {valor:g}")
+
+    # Valores instantáneos calculados en el momento (gauges), con etiquetas opcionales
+    gauges = {}
+    for nombre, ayuda, valor, *resto in (extras or []):
+        gauges.setdefault((nombre, ayuda), []).append((_etiquetas(resto[0]) if resto else "", valor))
+    for (nombre, ayuda), series in gauges.items():
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} gauge")
+        for etiquetas, valor in series:
+            lineas.append(f"{nombre}{{{etiquetas}}} {valor:g}" if etiquetas else f"{nombre} {valor:g}")
+    return "\n".join(lineas) + "\n"
+
+
+def _volcar_al_salir():
+    try:
+        _volcar()
+    except Exception:
+        pass
+
+
+atexit.register(_volcar_al_salir)
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src import config
+
+
+def listar_indicadores(modelos, excluir):
+    """
+    Aplana los modelos de una población en una lista ordenada de tareas
+    (nombre_modelo, nombre_indicador, def_tec precalculada en el catálogo).
+    """
+    tareas = []
+    for m_key, m_val in modelos.items():
+        for ind_nombre, ind_info in m_val['indicadores'].items():
+            if ind_nombre.lower() in excluir:
+                continue
+            tareas.append((m_val['nombre'], ind_nombre, m_val['def_tec'][ind_nombre]))
+    return tareas
+
+
+def esta_cancelado(cancelacion=None):
+    """True si se pidió detener esta evaluación"""
+    return cancelacion is not None and cancelacion.is_set()
+
+
+async def esta_cancelado_async(cancelacion=None):
+    """esta_cancelado() sin bloquear el event loop"""
+    return cancelacion is not None and await cancelacion.is_set_async()
+
+
+def reservar(cancelacion, segundos):
+    """Token para una etapa que debe terminar 'segundos' antes del plazo de la petición"""
+    return cancelacion.reservando(segundos) if cancelacion is not None else None
+
+
+def plazo_vencido(cancelacion=None):
+    """True si se agotó el plazo de esta etapa (la evaluación sigue con lo que tenga)"""
+    return cancelacion is not None and cancelacion.vencido()
+
+
+def ejecutar_indicadores(tareas, evaluar, max_concurrencia=None, al_completar=None):
+    """
+    Ejecuta evaluar(tarea) para cada tarea en paralelo, con un máximo de
+    max_concurrencia llamadas simultáneas. Devuelve los resultados en el
+    mismo orden modelo/indicador de la lista de tareas (None si falló).
+    Si se pasa al_completar(indice, resultado), se invoca apenas termina
+    cada tarea, en orden de llegada.
+    """
+    if not tareas:
+        return []
+
+    limite = max_concurrencia or config.MAX_CONCURRENCIA_INDICADORES
+    limite = max(1, min(limite, len(tareas)))
+
+    resultados = [None] * len(tareas)
+    with ThreadPoolExecutor(max_workers=limite) as pool:
+        futuros = {pool.submit(evaluar, tarea): i for i, tarea in enumerate(tareas)}
+        for futuro in as_completed(futuros):
+            i = futuros[futuro]
+            try:
+                resultados[i] = futuro.result()
+            except Exception as e:
+                print(f"❌ Error inesperado evaluando indicador: {e}")
+            if al_completar:
+                try:
+                    al_completar(i, resultados[i])
+                except Exception as e:
+                    print(f"⚠️ Error notificando resultado parcial: {e}")
+    return resultados
@@ -0,0 +1,149 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+from types import MappingProxyType
+from src import config, metricas
+
+# Prefiltro léxico: antes de gastar una llamada al LLM se mide, con BM25,
+# cuánto se parece el texto a la definición y los elementos esperados de
+# cada indicador. Si no comparte prácticamente ningún término relevante, el
+# resultado es nivel 1 sin consultar a la IA. El índice se construye una vez
+# con el catálogo.
+
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun cada como con contra cual cuales
+cuando de del desde donde dos durante e el ella ellas ello ellos en entre era eran es esa esas ese eso
+esos esta estas este esto estos fue fueron ha han hasta hay la las le les lo los mas me mediante mi
+mientras muy nada ni no nos o otra otras otro otros para pero poco por porque que quien se sea segun
+ser si sin sino sobre son su sus tal tambien tan tanto te tiene tienen todo todos tu un una uno unos
+y ya yo luego despues final ademas entonces vez veces
+""".split())
+
+_SUFIJOS = (
+    "amientos", "imientos", "aciones", "iciones", "siones", "amiento", "imiento", "mente", "acion",
+    "icion", "sion", "idades", "idad", "ismos", "ismo", "istas", "ista", "ivos", "ivas", "ivo", "iva",
+    "ando", "iendo", "aron", "ieron", "aran", "eran", "iran", "aban", "amos", "emos", "imos",
+    "ores", "ora", "or", "ales", "al", "an", "en", "es", "os", "as", "s", "o", "a", "e",
+)
+
+
+def _sin_tildes(texto):
+    return "".join(c for c in unicodedata.normalize("NFD", texto) if unicodedata.category(c) != "Mn")
+
+
+def _raiz(palabra):
+    """Stemming ligero para español: basta con que 'indagación' e 'indagar' coincidan en 'indag'"""
+    for sufijo in _SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 4:
+            palabra = palabra[:-len(sufijo)]
+            break
+    for final in ("ar", "er", "ir"):
+        if palabra.endswith(final) and len(palabra) - len(final) >= 4:
+            return palabra[:-len(final)]
+    return palabra
+
+
+def terminos(texto):
+    palabras = re.findall(r"[a-zñ]+", _sin_tildes(str(texto or "").lower()))
+    return [_raiz(p) for p in palabras if len(p) > 2 and p not in STOPWORDS]
+
+
+def texto_indicador(ind_nombre, ind_info):
+    """Nombre, Definicion e Indicadores: lo que el LLM compara con el texto"""
+    partes = [ind_nombre.replace("_", " ")]
+    if isinstance(ind_info, (dict, MappingProxyType)):
+        partes.append(str(ind_info.get("Definicion", "")))
+        inds = ind_info.get("Indicadores", ())
+        partes.extend(inds if isinstance(inds, (list, tuple)) else [str(inds)])
+    else:
+        partes.append(str(ind_info))
+    return " ".join(partes)
+
+
+class Indice:
+    """Índice BM25 inmutable: un 'documento' por indicador (modelo, indicador)"""
+
+    def __init__(self, documentos):
+        self.frecuencias = {}
+        self.longitudes = {}
+        for clave, texto in documentos.items():
+            tokens = terminos(texto)
+            self.frecuencias[clave] = Counter(tokens)
+            self.longitudes[clave] = len(tokens)
+        total = len(self.frecuencias) or 1
+        self.longitud_media = (sum(self.longitudes.values()) / total) or 1.0
+        apariciones = Counter(t for tf in self.frecuencias.values() for t in tf)
+        # IDF clásico recortado en 0: un término presente en más de la mitad de
+        # los indicadores ('estudiante', 'actividad'...) no aporta evidencia
+        self.idf = {t: max(0.0, math.log((total - n + 0.5) / (n + 0.5))) for t, n in apariciones.items()}
+
+    def puntaje(self, consulta, clave):
+        """BM25 del texto (términos únicos ya extraídos) contra un indicador; None si no está indexado"""
+        tf = self.frecuencias.get(clave)
+        if tf is None:
+            return None
+        norma = K1 * (1 - B + B * self.longitudes[clave] / self.longitud_media)
+        total = 0.0
+        for termino in consulta:
+            f = tf.get(termino)
+            if f:
+                total += self.idf[termino] * f * (K1 + 1) / (f + norma)
+        return total
+
+    def terminos_clave(self, clave, cuantos=5):
+        """Los términos más distintivos del indicador, para explicar el descarte"""
+        tf = self.frecuencias.get(clave, {})
+        return sorted(tf, key=lambda t: tf[t] * self.idf[t], reverse=True)[:cuantos]
+
+
+def construir_indice(modelos_por_poblacion):
+    documentos = {}
+    for modelos in modelos_por_poblacion.values():
+        for modelo in modelos.values():
+            for ind_nombre, ind_info in modelo["indicadores"].items():
+                documentos[(modelo["nombre"], ind_nombre)] = texto_indicador(ind_nombre, ind_info)
+    return Indice(documentos)
+
+
+def resultado_local(indice, tarea, puntaje, campos):
+    """Nivel 1 determinista, con una explicación en cada campo de análisis"""
+    modelo_nombre, ind_nombre, _ = tarea
+    clave_terminos = ", ".join(indice.terminos_clave((modelo_nombre, ind_nombre)))
+    explicacion = (f"El texto no comparte términos relevantes con el indicador {ind_nombre} "
+                   f"(similitud léxica {puntaje:.2f}); no aparecen ideas como: {clave_terminos}. "
+                   f"Nivel 1 asignado sin consultar a la IA.")
+    return {
+        "modelo": modelo_nombre,
+        "indicador": ind_nombre,
+        "calificacion": 1,
+        "analisis": {campo: explicacion for campo in campos},
+        "prefiltro": {"puntaje": round(puntaje, 3), "umbral": config.PREFILTRO_UMBRAL}
+    }
+
+
+def separar(indice, contenido, tareas, pendientes, tipo, campos):
+    """
+    Reparte los índices pendientes entre los que necesitan al LLM y los que
+    se resuelven aquí (puntaje BM25 por debajo de PREFILTRO_UMBRAL).
+    Devuelve (pendientes_llm, {indice: resultado_local}).
+    """
+    if not config.PREFILTRO_ACTIVO or indice is None or not pendientes:
+        return pendientes, {}
+    consulta = set(terminos(contenido))
+    restantes, locales = [], {}
+    for i in pendientes:
+        modelo_nombre, ind_nombre, _ = tareas[i]
+        puntaje = indice.puntaje(consulta, (modelo_nombre, ind_nombre))
+        if puntaje is not None and puntaje < config.PREFILTRO_UMBRAL:
+            locales[i] = resultado_local(indice, tareas[i], puntaje, campos)
+            metricas.incrementar("prefiltro_llamadas_evitadas_total", tipo=tipo, modelo=modelo_nombre)
+        else:
+            restantes.append(i)
+    if locales:
+        print(f"🔎 Prefiltro: {len(locales)}/{len(pendientes)} indicadores sin relación con el texto, "
+              f"se evitan {len(locales)} llamadas a la IA.")
+    return restantes, locales
@@ -0,0 +1,163 @@
+import json
+import re
+from src import config, metricas
+
+# Construcción de prompts con presupuesto de tokens. El texto del usuario va
+# una sola vez en el mensaje "user"; la rúbrica y el formato de respuesta,
+# que no cambian entre llamadas, viven en un prefijo "system" idéntico para
+# todos los indicadores del mismo tipo.
+
+SUJETOS = {"objetivo": "el objetivo", "actividad": "la actividad"}
+
+CAMPOS_ANALISIS = {
+    "objetivo": {
+        "evidencia_pedagogica": "Cita textual del objetivo y su conexión técnica con el indicador. ¿Qué proceso mental se activa?",
+        "justificacion_edad": "Por qué el contenido es apto (o no) para la etapa indicada, mencionando un hito del desarrollo cognitivo.",
+        "razonamiento_nivel": "Qué tiene para estar en Nivel X y qué le falta EXACTAMENTE para subir al Nivel X+1."
+    },
+    "actividad": {
+        "ejecucion_indicador": "Cómo la secuencia de la actividad activa (o no) el indicador técnico.",
+        "adecuacion_cognitiva": "Por qué la actividad es apta para la etapa indicada, citando un hito de esta edad."
+    }
+}
+
+_FIN_DE_ORACION = re.compile(r'(?<=[.!?;:])\s+|\n+')
+
+
+def contar_tokens(texto):
+    """Aproximación barata: ~4 caracteres por token (la misma que usa el limitador)"""
+    return len(texto or "") // 4
+
+
+def compactar(texto):
+    """Quita la sangría y las líneas vacías repetidas que dejan los f-strings multilínea"""
+    lineas = [linea.strip() for linea in (texto or "").strip().splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', "\n".join(lineas))
+
+
+def recortar(texto, presupuesto):
+    """
+    Deja el texto dentro de 'presupuesto' tokens cortando en el final de una
+    oración. Si ni la primera oración cabe, corta en el último espacio.
+    """
+    texto = (texto or "").strip()
+    if contar_tokens(texto) <= presupuesto:
+        return texto
+
+    oraciones = [o for o in _FIN_DE_ORACION.split(texto) if o.strip()]
+    recortado = ""
+    for oracion in oraciones:
+        candidato = f"{recortado} {oracion}".strip()
+        if contar_tokens(candidato) > presupuesto:
+            break
+        recortado = candidato
+    if not recortado:
+        limite = max(0, presupuesto * 4)
+        recortado = texto[:limite].rsplit(" ", 1)[0]
+    return recortado + " [...]"
+
+
+def _rubrica(sujeto):
+    return f'''
+    RÚBRICA DE EVALUACIÓN (TU ÚNICA REFERENCIA):
+    Basa tu decisión únicamente en la correspondencia entre el significado del texto, la definición del indicador y la pertinencia para la edad.
+    - NIVEL 1 (No observado): Las características evaluadas no se mencionan ni se infieren en {sujeto}.
+    - NIVEL 2 (Observado en menor medida): Las características se presentan de forma limitada y sin continuidad, apareciendo esporádicamente y con poca integración en la estructura pedagógica. En este nivel, la aplicación es mínima y carece de una relación clara con los modelos pedagógicos.
+    - NIVEL 3 (Observado parcialmente): Las características están presentes en {sujeto}, pero de forma limitada en cuanto a su alineación con el modelo pedagógico y edad.
+    - NIVEL 4 (Observado con frecuencia): Las características evaluadas están presentes y se utilizan de manera continua en {sujeto}. Hay una buena integración en el diseño pedagógico, aunque ciertos detalles o consistencias podrían mejorar para alinearse completamente al modelo.
+    - NIVEL 5 (Completamente observado): Las características evaluadas están presentes de manera completa y efectiva en {sujeto}, y su uso está plenamente alineado con los principios pedagógicos y la edad. La característica no solo se encuentra integrada en el diseño y desarrollo, sino que también está articulada para maximizar el impacto pedagógico deseado.
+    '''
+
+
+_INSTRUCCIONES = {
+    "objetivo": '''
+    INSTRUCCIÓN DE ANÁLISIS:
+    - Analiza el significado del OBJETIVO y compáralo con la DEFINICIÓN del indicador.
+    - Evalúa si el objetivo es coherente con la EDAD del estudiante.
+    - EVALUACIÓN CRÍTICA: No asumas intenciones que no estén escritas. Si el OBJETIVO es vago, no puede alcanzar niveles altos.
+    - USO DEL CONTEXTO: Es OBLIGATORIO usar la etapa cognitiva indicada. Si el objetivo pide algo demasiado complejo para esa etapa, la calificación debe bajar.
+    - REGLA DE DESEMPATE: Ante la duda o falta de detalle en el texto, opta siempre por el nivel inferior inmediato. El Nivel 5 se reserva únicamente para alineaciones perfectas y explícitas.
+    - PROHIBICIÓN DE CIRCULARIDAD: En el análisis, no repitas la definición de la rúbrica; explica qué palabras del texto justifican tu decisión.
+    TEN MUY EN CUENTA LA EVALUACIÓN Y LA REFLEXIÓN, TIENE QUE ESTAR INMERSA EN EL TEXTO INGRESADO.
+    El lenguaje debe ser netamente constructivista y pedagógico.
+    ''',
+    "actividad": '''
+    INSTRUCCIÓN DE ANÁLISIS:
+    - Analiza la ACTIVIDAD completa y determina si IMPLEMENTA o APLICA el indicador.
+    - IMPLEMENTACIÓN REAL: No evalúes si la actividad es "bonita". Evalúa si el paso a paso de la actividad obliga al estudiante a ejecutar lo que dice el indicador.
+    - PERTINENCIA DE DESARROLLO: Contrasta la actividad con la etapa cognitiva indicada. ¿Tienen los estudiantes la madurez necesaria para los retos propuestos?
+    - REGLA DE DESEMPATE: Ante la duda, opta siempre por el nivel inferior inmediato.
+    TEN MUY EN CUENTA LA EVALUACIÓN Y LA REFLEXIÓN, TIENE QUE ESTAR INMERSA EN EL TEXTO INGRESADO.
+    ''',
+}
+
+_FILTRO = '''
+    FASE 1: FILTRO DE SEGURIDAD
+    Si el texto NO tiene sentido educativo, o es una lista de palabras inconexas, responde ÚNICAMENTE:
+    {"es_valido": false, "mensaje_error": "CONTENIDO_IRRELEVANTE"}
+
+    FASE 2: EVALUACIÓN (solo si es válido)
+    '''
+
+
+def _sistema_indicador(tipo):
+    sujeto = SUJETOS[tipo]
+    campos = json.dumps(CAMPOS_ANALISIS[tipo], ensure_ascii=False)
+    return compactar(f'''
+    ERES UN EVALUADOR DE CONTENIDO EDUCATIVO CON EXCELENTE REDACCIÓN Y ORTOGRAFÍA. Respondes solo en JSON.
+    {_FILTRO}
+    Determina el NIVEL DE ALINEACIÓN pedagógica entre {sujeto}, el indicador del modelo y la edad que recibes en el mensaje del usuario.
+    {_rubrica(sujeto)}
+    {_INSTRUCCIONES[tipo]}
+    FORMATO DE RESPUESTA (JSON). El campo "calificacion" es el resultado directo de aplicar la rúbrica:
+    {{"calificacion": <Número entero 1-5>, "analisis": {campos}}}
+    ''')
+
+
+def _sistema_lote(tipo):
+    sujeto = SUJETOS[tipo]
+    campos = json.dumps(CAMPOS_ANALISIS[tipo], ensure_ascii=False)
+    return compactar(f'''
+    ERES UN EVALUADOR DE CONTENIDO EDUCATIVO CON EXCELENTE REDACCIÓN Y ORTOGRAFÍA. Respondes solo en JSON.
+    Evalúa {sujeto} frente a CADA indicador del modelo pedagógico que recibes en el mensaje del usuario.
+    {_rubrica(sujeto)}
+    {_INSTRUCCIONES[tipo]}
+    - Evalúa cada indicador de forma independiente.
+
+    FORMATO DE RESPUESTA (JSON), un elemento por indicador, usando EXACTAMENTE sus nombres:
+    {{"evaluaciones": [{{"indicador": "<nombre>", "calificacion": <Número entero 1-5>, "analisis": {campos}}}]}}
+    ''')
+
+
+# Prefijos fijos: se calculan una vez y son idénticos en todas las llamadas
+SISTEMA_INDICADOR = {tipo: _sistema_indicador(tipo) for tipo in SUJETOS}
+SISTEMA_LOTE = {tipo: _sistema_lote(tipo) for tipo in SUJETOS}
+
+
+def presupuesto_contenido(tipo):
+    return {
+        "objetivo": config.TOKENS_CONTENIDO_OBJETIVO,
+        "actividad": config.TOKENS_CONTENIDO_ACTIVIDAD,
+        "introduccion": config.TOKENS_CONTENIDO_INTRODUCCION,
+    }[tipo]
+
+
+def contenido_para_prompt(contenido, tipo):
+    """Texto del usuario recortado al presupuesto de su tipo, contando lo ahorrado"""
+    recortado = recortar(contenido, presupuesto_contenido(tipo))
+    ahorro = contar_tokens((contenido or "").strip()) - contar_tokens(recortado)
+    if ahorro > 0:
+        metricas.incrementar("prompt_tokens_ahorrados_total", ahorro, tipo=tipo, motivo="recorte")
+    return recortado
+
+
+def construir(sistema, usuario, tipo):
+    """Mensajes listos para la API; registra lo que se ahorra al compactar el texto del usuario"""
+    compacto = compactar(usuario)
+    ahorro = contar_tokens(usuario) - contar_tokens(compacto)
+    if ahorro > 0:
+        metricas.incrementar("prompt_tokens_ahorrados_total", ahorro, tipo=tipo, motivo="compactacion")
+    return [
+        {"role": "system", "content": sistema},
+        {"role": "user", "content": compacto}
+    ]
@@ -0,0 +1,143 @@
+import json
+import time
+from src import config, metricas
+from src.almacen import conectar
+
+# Puntos de control de las evaluaciones a medias. Cada indicador terminado
+# se guarda en SQLite bajo la clave de su apartado en cuanto llega, aunque la
+# cache esté apagada o caduque. Si el worker muere, vence el plazo o el
+# usuario cancela, reenviar el mismo apartado (o reanudarlo por su
+# id_evaluacion) sólo evalúa los indicadores que faltan y luego el feedback.
+# Al terminar el apartado completo sus puntos de control se borran.
+
+
+def _db():
+    conn = conectar("puntos_control")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS indicadores (
+            apartado TEXT NOT NULL,
+            indicador TEXT NOT NULL,
+            resultado TEXT NOT NULL,
+            creado REAL NOT NULL,
+            PRIMARY KEY (apartado, indicador)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS evaluaciones (
+            id TEXT PRIMARY KEY,
+            apartado TEXT NOT NULL,
+            datos TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            resultado TEXT,
+            actualizado REAL NOT NULL
+        )
+    """)
+    return conn
+
+
+def _purgar(conn):
+    limite = time.time() - config.PUNTOS_CONTROL_RETENCION_SEGUNDOS
+    conn.execute("DELETE FROM indicadores WHERE creado < ?", (limite,))
+    conn.execute("DELETE FROM evaluaciones WHERE actualizado < ?", (limite,))
+
+
+def leer(apartado):
+    """{clave_indicador: resultado} de lo ya evaluado en este apartado"""
+    if not config.PUNTOS_CONTROL_ACTIVOS or not apartado:
+        return {}
+    try:
+        filas = _db().execute("SELECT indicador, resultado FROM indicadores WHERE apartado = ? AND creado >= ?",
+                              (apartado, time.time() - config.PUNTOS_CONTROL_RETENCION_SEGUNDOS)).fetchall()
+    except Exception as e:
+        print(f"⚠️ No se pudieron leer los puntos de control: {e}")
+        return {}
+    return {indicador: json.loads(resultado) for indicador, resultado in filas}
+
+
+def guardar(apartado, indicador, resultado):
+    if not config.PUNTOS_CONTROL_ACTIVOS or not apartado or resultado is None:
+        return
+    try:
+        _db().execute("INSERT OR REPLACE INTO indicadores (apartado, indicador, resultado, creado) VALUES (?, ?, ?, ?)",
+                      (apartado, indicador, json.dumps(resultado, ensure_ascii=False), time.time()))
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar el punto de control: {e}")
+
+
+def recuperar(apartado, claves, resultados, tipo):
+    """Rellena en 'resultados' (alineado con 'claves') los huecos que ya tengan punto de control"""
+    if not any(r is None for r in resultados):
+        return resultados
+    guardados = leer(apartado)
+    recuperados = 0
+    for i, k in enumerate(claves):
+        if resultados[i] is None and k in guardados:
+            resultados[i] = guardados[k]
+            recuperados += 1
+    if recuperados:
+        print(f"📌 {recuperados}/{len(claves)} indicadores recuperados de una evaluación interrumpida.")
+        metricas.incrementar("puntos_control_recuperados_total", recuperados, tipo=tipo)
+    return resultados
+
+
+def cerrar(apartado, resultado):
+    """Si el apartado terminó entero, sus puntos de control ya no hacen falta"""
+    if not config.PUNTOS_CONTROL_ACTIVOS or not apartado or not esta_completo(resultado):
+        return
+    try:
+        _db().execute("DELETE FROM indicadores WHERE apartado = ?", (apartado,))
+    except Exception as e:
+        print(f"⚠️ No se pudieron borrar los puntos de control: {e}")
+
+
+def esta_completo(resultado):
+    """Un apartado a medias (cancelado, sin plazo, feedback de respaldo) se puede reanudar"""
+    if not isinstance(resultado, dict):
+        return resultado is not None
+    return not (resultado.get("cancelado") or resultado.get("plazo_agotado")
+                or (resultado.get("feedback_global") or {}).get("degradado"))
+
+
+# --- REANUDAR POR id_evaluacion ---
+
+def registrar(id_evaluacion, apartado, datos):
+    """Anota qué pidió la evaluación para poder reanudarla sólo con su id"""
+    if not config.PUNTOS_CONTROL_ACTIVOS or not id_evaluacion:
+        return
+    try:
+        conn = _db()
+        conn.execute("INSERT OR REPLACE INTO evaluaciones (id, apartado, datos, estado, resultado, actualizado) "
+                     "VALUES (?, ?, ?, 'en_curso', NULL, ?)",
+                     (id_evaluacion, apartado, json.dumps(datos, ensure_ascii=False), time.time()))
+        _purgar(conn)
+    except Exception as e:
+        print(f"⚠️ No se pudo registrar la evaluación {id_evaluacion}: {e}")
+
+
+def terminar(id_evaluacion, resultado):
+    if not config.PUNTOS_CONTROL_ACTIVOS or not id_evaluacion:
+        return
+    estado = "terminada" if esta_completo(resultado) else "incompleta"
+    try:
+        _db().execute("UPDATE evaluaciones SET estado = ?, resultado = ?, actualizado = ? WHERE id = ?",
+                      (estado, json.dumps(resultado, ensure_ascii=False, default=str), time.time(), id_evaluacion))
+    except Exception as e:
+        print(f"⚠️ No se pudo cerrar la evaluación {id_evaluacion}: {e}")
+
+
+def consultar(id_evaluacion):
+    """Estado de una evaluación registrada (None si no existe o ya caducó)"""
+    fila = _db().execute("SELECT apartado, datos, estado, resultado, actualizado FROM evaluaciones WHERE id = ?",
+                         (id_evaluacion,)).fetchone()
+    if not fila:
+        return None
+    apartado, datos, estado, resultado, actualizado = fila
+    guardados = _db().execute("SELECT COUNT(*) FROM indicadores WHERE apartado = ?", (apartado,)).fetchone()[0]
+    return {
+        "id_evaluacion": id_evaluacion,
+        "estado": estado,
+        "datos": json.loads(datos),
+        "indicadores_guardados": guardados,
+        "resultado": json.loads(resultado) if resultado else None,
+        "actualizado": actualizado,
+    }
@@ -1,33 +1,238 @@
 # routes.py - VERSIÓN CORREGIDA
-from flask import request, jsonify
-from src.evaluators import evaluar_introduccion, evaluar_objetivo, es_una_actividad, evaluar_actividad
-from src.analizador_resultados import analizar_resultados_taller
+import asyncio
+import json
+import queue
+import threading
+from flask import request, jsonify, Response, stream_with_context
+from src.evaluators import evaluar_apartado, clave_apartado, emisor_texto
+from src.evaluators_async import evaluar_apartado_async, evaluar_taller_async
+from src.analizador_resultados import analizar_resultados_taller, analizar_resultados_taller_async
+from src import config, deduplicacion, trabajos, cancelacion, llm_async, puntos_control
+from src.cancelacion import PlazoAgotado
+
+def leer_apartado(data):
+    """Extrae los campos comunes del payload de /evaluar_apartado"""
+    return {
+        "contenido": data.get('apartado', {}).get('Contenido', ''),
+        "nombre_apartado": data.get('apartado', {}).get('Apartado', 'Objetivo General'),
+        "poblacion": data.get('poblacion', 'joven'),
+        "rango": data.get('rango_edad', ''),
+        "en_lote": data.get('modo_lote'),  # None = usar EVALUACION_EN_LOTE
+    }
+
+def leer_taller(data):
+    """
+    Normaliza el payload de /evaluar_taller. Cada apartado puede venir como
+    texto o como {"Apartado": ..., "Contenido": ...} (igual que en /evaluar_apartado).
+    """
+    taller = data.get('taller', data)
+
+    def apartado(valor, nombre_por_defecto):
+        if isinstance(valor, dict):
+            valor = {"Apartado": valor.get('Apartado', nombre_por_defecto), "Contenido": valor.get('Contenido', '')}
+        else:
+            valor = {"Apartado": nombre_por_defecto, "Contenido": valor or ''}
+        return valor if valor["Contenido"].strip() else None
+
+    actividades = [apartado(a, f"Actividad {i}") for i, a in enumerate(taller.get('actividades') or [], 1)]
+    return {
+        "introduccion": apartado(taller.get('introduccion'), "Introducción"),
+        "objetivo": apartado(taller.get('objetivo'), "Objetivo General"),
+        "actividades": [a for a in actividades if a],
+    }
+
+def leer_id_evaluacion(data):
+    """El cliente puede fijar su propio id (body o cabecera) para poder cancelarlo luego"""
+    return (data or {}).get('id_evaluacion') or request.headers.get('X-Evaluacion-Id')
+
+def leer_plazo(data):
+    """
+    Segundos que tiene la petición para responder: PLAZO_PETICION_SEGUNDOS,
+    o menos si el cliente lo pide (plazo_segundos o cabecera X-Plazo-Segundos).
+    """
+    pedido = (data or {}).get('plazo_segundos') or request.headers.get('X-Plazo-Segundos')
+    try:
+        pedido = float(pedido) if pedido else None
+    except (TypeError, ValueError):
+        pedido = None
+    maximo = config.PLAZO_PETICION_SEGUNDOS
+    if pedido and pedido > 0:
+        return min(pedido, maximo) if maximo else pedido
+    return maximo or None
+
+def registrar_evaluacion(token, clave, contenido, nombre_apartado, poblacion, rango, en_lote):
+    if token is not None:
+        puntos_control.registrar(token.id, clave, {
+            "contenido": contenido, "nombre_apartado": nombre_apartado, "poblacion": poblacion,
+            "rango": rango, "en_lote": en_lote,
+        })
+
+def resultado_cancelado(nombre_apartado):
+    return {"apartado": nombre_apartado, "evaluaciones": [], "cancelado": True}
+
+def resultado_plazo_agotado(nombre_apartado):
+    """Se acabó el plazo esperando una evaluación idéntica: sale degradada, como la del dueño"""
+    return {"apartado": nombre_apartado, "evaluaciones": [], "plazo_agotado": True}
+
+def evaluar_apartado_compartido(contenido, nombre_apartado, poblacion, rango, en_lote=None,
+                                al_evento=None, cancelacion=None):
+    """
+    evaluar_apartado con single-flight: si ya hay una evaluación idéntica en
+    curso (en este o en otro worker) se reutiliza en lugar de repetir las
+    llamadas a la IA. Con un token, la evaluación queda registrada para poder
+    reanudarla por su id si se corta.
+    """
+    clave = clave_apartado(contenido, nombre_apartado, poblacion, rango, en_lote)
+    registrar_evaluacion(cancelacion, clave, contenido, nombre_apartado, poblacion, rango, en_lote)
+    try:
+        resultado = deduplicacion.compartir(
+            clave,
+            lambda emitir: evaluar_apartado(contenido, nombre_apartado, poblacion, rango, en_lote,
+                                            al_evento=emitir, cancelacion=cancelacion),
+            al_evento, cancelacion
+        )
+    except PlazoAgotado:
+        resultado = resultado_plazo_agotado(nombre_apartado)
+    resultado = resultado if resultado is not None else resultado_cancelado(nombre_apartado)
+    if cancelacion is not None:
+        puntos_control.terminar(cancelacion.id, resultado)
+    return resultado
+
+async def evaluar_apartado_compartido_async(contenido, nombre_apartado, poblacion, rango, en_lote=None,
+                                            al_evento=None, cancelacion=None):
+    # Las escrituras del punto de control van a un hilo: en el loop compartido frenarían al resto
+    clave = clave_apartado(contenido, nombre_apartado, poblacion, rango, en_lote)
+    await asyncio.to_thread(registrar_evaluacion, cancelacion, clave, contenido, nombre_apartado,
+                            poblacion, rango, en_lote)
+    try:
+        resultado = await deduplicacion.compartir_async(
+            clave,
+            lambda emitir: evaluar_apartado_async(contenido, nombre_apartado, poblacion, rango, en_lote,
+                                                  al_evento=emitir, cancelacion=cancelacion),
+            al_evento, cancelacion
+        )
+    except PlazoAgotado:
+        resultado = resultado_plazo_agotado(nombre_apartado)
+    resultado = resultado if resultado is not None else resultado_cancelado(nombre_apartado)
+    if cancelacion is not None:
+        await asyncio.to_thread(puntos_control.terminar, cancelacion.id, resultado)
+    return resultado
+
+def es_asincrono(data):
+    """El cliente pide modo trabajo con ?asincrono=1 o "asincrono": true en el body"""
+    return request.args.get('asincrono') in ('1', 'true') or bool((data or {}).get('asincrono'))
+
+def es_solo_metricas(data):
+    """Modo numérico de /analizar_taller_completo: ?solo_metricas=1 o "solo_metricas": true, sin IA"""
+    return request.args.get('solo_metricas') in ('1', 'true') or bool((data or {}).get('solo_metricas'))
+
+def encolar_trabajo(tipo, funcion, id_trabajo=None, **kwargs):
+    try:
+        id_trabajo = trabajos.encolar(tipo, funcion, id_trabajo=id_trabajo, **kwargs)
+    except trabajos.ColaLlena as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify({
+        "id_trabajo": id_trabajo,
+        "estado": "pendiente",
+        "url": f"/jobs/{id_trabajo}"
+    }), 202
 
 def evaluar_apartado_route():
     data = request.json
-    
-    contenido = data.get('apartado', {}).get('Contenido', '')
-    nombre_apartado = data.get('apartado', {}).get('Apartado', 'Objetivo General')
-    poblacion = data.get('poblacion', 'joven')
-    rango = data.get('rango_edad', '')
+    datos = leer_apartado(data)
+    print(f"--- PROCESANDO: {datos['nombre_apartado']} ---")
+    if es_asincrono(data):
+        return encolar_trabajo("evaluar_apartado", evaluar_apartado_compartido, **datos)
 
-    print(f"--- PROCESANDO: {nombre_apartado} ---")
-    nombre_normalizado = nombre_apartado.strip().lower()
-    
-    # 1. INTRODUCCIÓN
-    if "introducción" in nombre_normalizado or "introduccion" in nombre_normalizado:
-        print(">>> Detectado modo: COORDINADOR DE MUSEOS (Introducción)")
-        return jsonify(evaluar_introduccion(contenido, nombre_apartado))
-    
-    # 2. ACTIVIDADES (NUEVO)
-    elif es_una_actividad(nombre_apartado, contenido):
-        print(">>> Detectado modo: EVALUADOR DE ACTIVIDADES")
-        return jsonify(evaluar_actividad(contenido, nombre_apartado, poblacion, rango))
-    
-    # 3. OBJETIVOS (por defecto)
-    else:
-        print(">>> Detectado modo: EVALUADOR PEDAGÓGICO (Objetivos)")
-        return jsonify(evaluar_objetivo(contenido, nombre_apartado, poblacion, rango))
+    token = cancelacion.registrar(leer_id_evaluacion(data), plazo=leer_plazo(data))
+    try:
+        respuesta = jsonify(evaluar_apartado_compartido(**datos, cancelacion=token))
+    finally:
+        cancelacion.liberar(token)
+    respuesta.headers["X-Evaluacion-Id"] = token.id
+    return respuesta
+
+# ============================================================================
+# STREAMING: UN EVENTO POR INDICADOR TERMINADO (SSE o NDJSON)
+# ============================================================================
+
+SEGUNDOS_LATIDO = 15
+
+def formatear_evento(evento, formato):
+    texto = json.dumps(evento, ensure_ascii=False)
+    if formato == "ndjson":
+        return texto + "\n"
+    return f"event: {evento.get('evento', 'mensaje')}\ndata: {texto}\n\n"
+
+def responder_en_stream(calcular, token, formato):
+    """
+    Ejecuta calcular(al_evento) en un hilo y responde con sus eventos:
+    aceptado (id_evaluacion) -> ... -> fin (o cancelado / error).
+    Si el cliente se desconecta, la evaluación se cancela.
+    """
+    cola = queue.Queue()
+    cola.put({"evento": "aceptado", "id_evaluacion": token.id})
+
+    def trabajar():
+        try:
+            resultado = calcular(cola.put)
+            if token.is_set():
+                cola.put({"evento": "cancelado", "resultado": resultado})
+            else:
+                cola.put({"evento": "fin", "resultado": resultado})
+        except Exception as e:
+            print(f"❌ Error en evaluación por streaming: {e}")
+            cola.put({"evento": "error", "mensaje": str(e)})
+        finally:
+            cancelacion.liberar(token)
+            cola.put(None)
+
+    threading.Thread(target=trabajar, daemon=True).start()
+
+    def generar():
+        terminado = False
+        try:
+            while True:
+                try:
+                    evento = cola.get(timeout=SEGUNDOS_LATIDO)
+                except queue.Empty:
+                    # Latido: mantiene viva la conexión y detecta clientes caídos
+                    yield "\n" if formato == "ndjson" else ": ping\n\n"
+                    continue
+                if evento is None:
+                    terminado = True
+                    break
+                yield formatear_evento(evento, formato)
+        finally:
+            # Cliente desconectado (o error al escribir): se cancela la evaluación.
+            # En un fin normal no: el token puede compartirlo otra petición con el
+            # mismo id_evaluacion, y trabajar() ya liberó su registro.
+            if not terminado:
+                token.set()
+
+    mimetype = "application/x-ndjson" if formato == "ndjson" else "text/event-stream"
+    return Response(stream_with_context(generar()), mimetype=mimetype,
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Evaluacion-Id": token.id})
+
+def leer_formato():
+    return "ndjson" if request.args.get('formato') == "ndjson" else "sse"
+
+def evaluar_apartado_stream_route():
+    """
+    Igual que /evaluar_apartado, pero emite cada indicador en cuanto termina:
+    aceptado (id_evaluacion) -> inicio -> calificacion / indicador (uno por
+    indicador) -> estadisticas -> texto (trozos del comentario) ->
+    feedback_global -> fin.
+    """
+    data = request.json or {}
+    datos = leer_apartado(data)
+    print(f"--- PROCESANDO (stream): {datos['nombre_apartado']} ---")
+
+    token = cancelacion.registrar(leer_id_evaluacion(data), plazo=leer_plazo(data))
+    return responder_en_stream(
+        lambda al_evento: evaluar_apartado_compartido(**datos, al_evento=al_evento, cancelacion=token),
+        token, leer_formato()
+    )
 
 # ============================================================================
 # NUEVA FUNCIÓN PARA ANÁLISIS INTEGRADO
@@ -56,10 +261,223 @@ def analizar_taller_completo_route():
             "detalle": f"No se encontró el apartado de Objetivo. Recibido: {list(evaluaciones.keys())}"
         }), 400
 
+    if es_solo_metricas(payload):
+        # Sin llamada a la IA: responde al instante, no hace falta token ni trabajo en segundo plano
+        return jsonify(analizar_resultados_taller(evaluaciones, rango_edad, solo_metricas=True)), 200
+
+    if es_asincrono(payload):
+        return encolar_trabajo("analizar_taller_completo", analizar_taller_trabajo,
+                               evaluaciones=evaluaciones, rango_edad=rango_edad)
+
+    token = cancelacion.registrar(leer_id_evaluacion(payload), plazo=leer_plazo(payload))
     try:
         # Si pasó la validación, llamamos a la lógica
-        analisis = analizar_resultados_taller(evaluaciones, rango_edad)
+        analisis = analizar_resultados_taller(evaluaciones, rango_edad, cancelacion=token)
+        return jsonify(analisis), 200
+    except Exception as e:
+        print(f"❌ Error crítico: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        cancelacion.liberar(token)
+
+def leer_evaluaciones_taller(payload):
+    """(evaluaciones, rango_edad, None) o (None, None, respuesta de error 400)"""
+    evaluaciones = payload.get('evaluaciones', payload)
+    rango_edad = payload.get('rango_edad', 'Población general')
+    if not any("objetivo" in k.lower() for k in evaluaciones.keys()):
+        return None, None, (jsonify({
+            "error": "Faltan datos",
+            "detalle": f"No se encontró el apartado de Objetivo. Recibido: {list(evaluaciones.keys())}"
+        }), 400)
+    return evaluaciones, rango_edad, None
+
+def analizar_taller_completo_stream_route():
+    """
+    Igual que /analizar_taller_completo, pero las secciones narrativas del
+    informe (sintesis_ejecutiva, diagnostico_coherencia, ruta_de_accion)
+    llegan como eventos 'texto' mientras el modelo las escribe; el JSON
+    completo y validado llega al final en 'fin'.
+    """
+    payload = request.json
+    if not payload:
+        return jsonify({"error": "No hay datos"}), 400
+    evaluaciones, rango_edad, error = leer_evaluaciones_taller(payload)
+    if error:
+        return error
+    if es_solo_metricas(payload):
+        return jsonify(analizar_resultados_taller(evaluaciones, rango_edad, solo_metricas=True)), 200
+
+    token = cancelacion.registrar(leer_id_evaluacion(payload), plazo=leer_plazo(payload))
+    return responder_en_stream(
+        lambda al_evento: analizar_resultados_taller(evaluaciones, rango_edad, cancelacion=token,
+                                                     al_texto=emisor_texto(al_evento, "analisis_integrado")),
+        token, leer_formato()
+    )
+
+# ============================================================================
+# TRABAJOS EN SEGUNDO PLANO
+# ============================================================================
+
+def analizar_taller_trabajo(evaluaciones, rango_edad, al_evento=None, cancelacion=None):
+    return analizar_resultados_taller(evaluaciones, rango_edad, cancelacion=cancelacion)
+
+def trabajo_route(id_trabajo):
+    trabajo = trabajos.consultar(id_trabajo)
+    if not trabajo:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify(trabajo), 200
+
+def cancelar_route():
+    """
+    Cancela sólo la evaluación indicada (id_evaluacion o id_trabajo, el que
+    devolvió la petición en X-Evaluacion-Id, el evento 'aceptado' o el 202).
+    Sin id no se cancela nada: adivinar "las de este cliente" por IP o
+    cabecera acababa cancelando evaluaciones de otros usuarios.
+    """
+    data = request.get_json(silent=True) or {}
+    id_objetivo = data.get('id_evaluacion') or data.get('id_trabajo') or request.args.get('id')
+    if not id_objetivo:
+        return jsonify({"error": "Falta id_evaluacion", "detalle": "Indica qué evaluación detener (id_evaluacion o id_trabajo)."}), 400
+    canceladas = cancelacion.cancelar(id_objetivo)
+    print(f"\n🛑 FRENO DE MANO: {canceladas} evaluación(es) marcadas para detenerse.")
+    return jsonify({"status": "success", "message": "Señal de detención enviada", "canceladas": canceladas}), 200
+
+def evaluacion_route(id_evaluacion):
+    """Estado de una evaluación de apartado (en_curso, incompleta o terminada) y cuántos indicadores guardó"""
+    evaluacion = puntos_control.consultar(id_evaluacion)
+    if not evaluacion:
+        return jsonify({"error": "Evaluación no encontrada"}), 404
+    trabajo = trabajos.consultar(id_evaluacion)
+    if trabajo:
+        # Reanudada (o lanzada) en segundo plano: el trabajo lleva el mismo id
+        evaluacion["trabajo"] = {"estado": trabajo["estado"], "url": f"/jobs/{id_evaluacion}"}
+    return jsonify(evaluacion), 200
+
+def reanudar_route(id_evaluacion):
+    """
+    Retoma una evaluación cortada (cancelada, sin plazo o con el worker
+    caído) con los mismos datos: los indicadores ya guardados no se repiten.
+    Si ya había terminado, devuelve su resultado sin volver a evaluar.
+    """
+    evaluacion = puntos_control.consultar(id_evaluacion)
+    if not evaluacion:
+        return jsonify({"error": "Evaluación no encontrada"}), 404
+    if evaluacion["estado"] == "terminada":
+        return jsonify(evaluacion["resultado"]), 200
+
+    data = request.get_json(silent=True) or {}
+    datos = evaluacion["datos"]
+    print(f"--- REANUDANDO: {datos['nombre_apartado']} ({id_evaluacion}, "
+          f"{evaluacion['indicadores_guardados']} indicadores guardados) ---")
+    if es_asincrono(data):
+        trabajo = trabajos.consultar(id_evaluacion)
+        if trabajo and trabajo["estado"] in ("pendiente", "en_curso"):
+            return jsonify({"error": "La evaluación ya se está reanudando", "url": f"/jobs/{id_evaluacion}"}), 409
+        # Mismo id que la evaluación: /cancelar y /evaluaciones/<id> siguen apuntando a ella
+        return encolar_trabajo("evaluar_apartado", evaluar_apartado_compartido, id_trabajo=id_evaluacion, **datos)
+
+    token = cancelacion.registrar(id_evaluacion, plazo=leer_plazo(data))
+    try:
+        respuesta = jsonify(evaluar_apartado_compartido(**datos, cancelacion=token))
+    finally:
+        cancelacion.liberar(token)
+    respuesta.headers["X-Evaluacion-Id"] = token.id
+    return respuesta
+
+# ============================================================================
+# RUTAS ASÍNCRONAS: LAS LLAMADAS LLM CORREN EN EL LOOP COMPARTIDO
+# ============================================================================
+
+async def en_loop_compartido(corrutina):
+    """Ejecuta la corrutina en el loop de llm_async (pool keep-alive) y la espera"""
+    return await asyncio.wrap_future(llm_async.enviar(corrutina))
+
+async def evaluar_apartado_async_route():
+    data = request.json or {}
+    datos = leer_apartado(data)
+    print(f"--- PROCESANDO (async): {datos['nombre_apartado']} ---")
+
+    token = cancelacion.registrar(leer_id_evaluacion(data), plazo=leer_plazo(data))
+    try:
+        respuesta = jsonify(await en_loop_compartido(evaluar_apartado_compartido_async(**datos, cancelacion=token)))
+    finally:
+        cancelacion.liberar(token)
+    respuesta.headers["X-Evaluacion-Id"] = token.id
+    return respuesta
+
+async def analizar_taller_completo_async_route():
+    payload = request.json
+    if not payload:
+        return jsonify({"error": "No hay datos"}), 400
+    evaluaciones, rango_edad, error = leer_evaluaciones_taller(payload)
+    if error:
+        return error
+    if es_solo_metricas(payload):
+        return jsonify(analizar_resultados_taller(evaluaciones, rango_edad, solo_metricas=True)), 200
+
+    token = cancelacion.registrar(leer_id_evaluacion(payload), plazo=leer_plazo(payload))
+    try:
+        analisis = await en_loop_compartido(analizar_resultados_taller_async(evaluaciones, rango_edad, cancelacion=token))
         return jsonify(analisis), 200
     except Exception as e:
         print(f"❌ Error crítico: {str(e)}")
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+    finally:
+        cancelacion.liberar(token)
+
+
+# ============================================================================
+# TALLER COMPLETO EN UNA SOLA PETICIÓN
+# ============================================================================
+
+def leer_datos_taller(data):
+    return {
+        "taller": leer_taller(data),
+        "poblacion": data.get('poblacion', 'joven'),
+        "rango": data.get('rango_edad', ''),
+        "en_lote": data.get('modo_lote'),
+    }
+
+def evaluar_taller_trabajo(taller, poblacion, rango, en_lote=None, al_evento=None, cancelacion=None):
+    return llm_async.ejecutar(evaluar_taller_async(taller, poblacion, rango, en_lote,
+                                                   al_evento=al_evento, cancelacion=cancelacion))
+
+async def evaluar_taller_route():
+    """
+    Recibe el taller entero (introducción, objetivo y actividades), evalúa
+    todos los apartados en paralelo y devuelve el resultado consolidado con
+    el análisis integrado, sin que el cliente tenga que encadenar peticiones.
+    """
+    data = request.json or {}
+    datos = leer_datos_taller(data)
+    if not datos["taller"]["objetivo"]:
+        return jsonify({"error": "Faltan datos", "detalle": "No se encontró el apartado de Objetivo."}), 400
+    print(f"--- PROCESANDO TALLER: {len(datos['taller']['actividades'])} actividades ---")
+    if es_asincrono(data):
+        return encolar_trabajo("evaluar_taller", evaluar_taller_trabajo, **datos)
+
+    token = cancelacion.registrar(leer_id_evaluacion(data), plazo=leer_plazo(data))
+    try:
+        respuesta = jsonify(await en_loop_compartido(evaluar_taller_async(**datos, cancelacion=token)))
+    finally:
+        cancelacion.liberar(token)
+    respuesta.headers["X-Evaluacion-Id"] = token.id
+    return respuesta
+
+def evaluar_taller_stream_route():
+    """
+    /evaluar_taller con eventos: 'apartado' al cerrar cada uno, los trozos
+    del informe integrado ('texto') mientras se escribe, 'analisis_integrado'
+    y 'fin' con el resultado consolidado.
+    """
+    data = request.json or {}
+    datos = leer_datos_taller(data)
+    if not datos["taller"]["objetivo"]:
+        return jsonify({"error": "Faltan datos", "detalle": "No se encontró el apartado de Objetivo."}), 400
+    print(f"--- PROCESANDO TALLER (stream): {len(datos['taller']['actividades'])} actividades ---")
+
+    token = cancelacion.registrar(leer_id_evaluacion(data), plazo=leer_plazo(data))
+    return responder_en_stream(
+        lambda al_evento: evaluar_taller_trabajo(**datos, al_evento=al_evento, cancelacion=token),
+        token, leer_formato()
+    )
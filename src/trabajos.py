@@ -0,0 +1,236 @@
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from src import config, cancelacion
+from src.almacen import conectar
+
+# Cola de evaluaciones en segundo plano. Cada worker de gunicorn tiene su
+# propio pool acotado; el estado vive en SQLite para que GET /jobs/<id>
+# responda desde cualquier worker. Cada trabajo anota el pid del worker que
+# lo ejecuta: si ese worker murió, al arrancar otro el trabajo pasa a fallido.
+
+ESTADOS_FINALES = ("completado", "fallido", "cancelado")
+
+# Trozos de texto en streaming: no se guardan, el campo completo llega en su propio evento
+EVENTOS_SOLO_STREAM = ("texto",)
+
+_pool = None
+_pool_lock = threading.Lock()
+# Los eventos parciales se guardan desde este único hilo: quien los emite (a
+# veces el event loop compartido) no espera a SQLite y el orden se conserva
+_escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trabajo_eventos")
+_en_cola = 0
+_en_cola_lock = threading.Lock()
+
+
+class ColaLlena(Exception):
+    pass
+
+
+def _db():
+    conn = conectar("trabajos")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS trabajos (
+            id TEXT PRIMARY KEY,
+            tipo TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            worker INTEGER,
+            resultado TEXT,
+            error TEXT,
+            intentos INTEGER NOT NULL DEFAULT 0,
+            creado REAL NOT NULL,
+            actualizado REAL NOT NULL
+        )
+    """)
+    # Un evento por fila: guardar uno es un INSERT, no reescribir todos los anteriores
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS trabajo_eventos (
+            id_trabajo TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            evento TEXT NOT NULL,
+            PRIMARY KEY (id_trabajo, n)
+        )
+    """)
+    return conn
+
+
+def _purgar(conn):
+    """Los trabajos terminados se olvidan (con sus eventos) pasado TRABAJOS_RETENCION_SEGUNDOS"""
+    limite = time.time() - config.TRABAJOS_RETENCION_SEGUNDOS
+    finales = ", ".join("?" * len(ESTADOS_FINALES))
+    conn.execute(f"DELETE FROM trabajo_eventos WHERE id_trabajo IN "
+                 f"(SELECT id FROM trabajos WHERE estado IN ({finales}) AND actualizado < ?)", (*ESTADOS_FINALES, limite))
+    conn.execute(f"DELETE FROM trabajos WHERE estado IN ({finales}) AND actualizado < ?", (*ESTADOS_FINALES, limite))
+
+
+def _vivo(pid):
+    if not pid or pid == os.getpid():
+        return False  # este worker acaba de arrancar: nada de lo anterior es suyo
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def recuperar_huerfanos():
+    """
+    Al arrancar el worker: los trabajos pendientes o en curso de un worker
+    que ya no existe no van a terminar nunca; pasan a fallido para que
+    GET /jobs/<id> no los muestre en curso para siempre.
+    """
+    try:
+        conn = _db()
+        filas = conn.execute("SELECT id, worker FROM trabajos WHERE estado IN ('pendiente', 'en_curso')").fetchall()
+        huerfanos = [id_trabajo for id_trabajo, worker in filas if not _vivo(worker)]
+        for id_trabajo in huerfanos:
+            _actualizar(id_trabajo, estado="fallido", error="El worker que ejecutaba el trabajo se detuvo")
+        _purgar(conn)
+    except Exception as e:
+        print(f"⚠️ No se pudieron revisar los trabajos interrumpidos: {e}")
+        return 0
+    if huerfanos:
+        print(f"🧹 {len(huerfanos)} trabajo(s) de un worker detenido marcados como fallidos.")
+    return len(huerfanos)
+
+
+def _obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=config.TRABAJOS_MAX_WORKERS, thread_name_prefix="trabajo")
+        return _pool
+
+
+def _actualizar(id_trabajo, **campos):
+    campos["actualizado"] = time.time()
+    columnas = ", ".join(f"{k} = ?" for k in campos)
+    _db().execute(f"UPDATE trabajos SET {columnas} WHERE id = ?", (*campos.values(), id_trabajo))
+
+
+def _agregar_parcial(id_trabajo, n, texto):
+    try:
+        _db().execute("INSERT INTO trabajo_eventos (id_trabajo, n, evento) VALUES (?, ?, ?)", (id_trabajo, n, texto))
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar el evento del trabajo {id_trabajo}: {e}")
+
+
+def _borrar_parciales(id_trabajo):
+    _db().execute("DELETE FROM trabajo_eventos WHERE id_trabajo = ?", (id_trabajo,))
+
+
+def _emisor(id_trabajo):
+    """
+    al_evento del trabajo: numera el evento (indicador terminado,
+    estadísticas...) y deja su guardado al hilo _escritor.
+    """
+    contador = itertools.count(1)
+    lock = threading.Lock()
+
+    def emitir(evento):
+        if evento.get("evento") in EVENTOS_SOLO_STREAM:
+            return
+        texto = json.dumps(evento, ensure_ascii=False, default=str)
+        with lock:
+            _escritor.submit(_agregar_parcial, id_trabajo, next(contador), texto)
+    return emitir
+
+
+def _vaciar_escritor():
+    """Espera a que se guarden los eventos ya emitidos (el escritor los procesa en orden)"""
+    _escritor.submit(lambda: None).result()
+
+
+def _ejecutar(id_trabajo, funcion, kwargs, token):
+    global _en_cola
+    try:
+        for intento in range(1, config.TRABAJOS_REINTENTOS + 2):
+            if token.is_set():
+                _actualizar(id_trabajo, estado="cancelado")
+                return
+            _escritor.submit(_borrar_parciales, id_trabajo).result()
+            _actualizar(id_trabajo, estado="en_curso", intentos=intento)
+            try:
+                resultado = funcion(**kwargs, al_evento=_emisor(id_trabajo), cancelacion=token)
+                _vaciar_escritor()
+                estado = "cancelado" if token.is_set() else "completado"
+                _actualizar(id_trabajo, estado=estado, error=None,
+                            resultado=json.dumps(resultado, ensure_ascii=False))
+                print(f"✅ Trabajo {id_trabajo} {estado} (intento {intento}).")
+                return
+            except Exception as e:
+                _vaciar_escritor()
+                print(f"❌ Trabajo {id_trabajo} falló (intento {intento}): {e}")
+                _actualizar(id_trabajo, error=str(e))
+                if intento <= config.TRABAJOS_REINTENTOS:
+                    if token.esperar(config.TRABAJOS_ESPERA_REINTENTO * 2 ** (intento - 1)):
+                        _actualizar(id_trabajo, estado="cancelado")
+                        return
+        _actualizar(id_trabajo, estado="fallido")
+    finally:
+        cancelacion.liberar(token)
+        with _en_cola_lock:
+            _en_cola -= 1
+
+
+def encolar(tipo, funcion, id_trabajo=None, **kwargs):
+    """
+    Registra el trabajo y lo lanza en el pool del worker. 'funcion' debe
+    aceptar al_evento (resultados parciales) y cancelacion (token del
+    trabajo, cancelable con POST /cancelar {"id_trabajo": ...}).
+    id_trabajo permite reutilizar un id ya conocido por el cliente (p. ej.
+    el id_evaluacion de una evaluación que se reanuda); si no, se genera.
+    Lanza ColaLlena si ya hay demasiados trabajos pendientes en este worker.
+    """
+    global _en_cola
+    with _en_cola_lock:
+        if _en_cola >= config.TRABAJOS_MAX_PENDIENTES:
+            raise ColaLlena("Hay demasiadas evaluaciones en cola, intenta de nuevo en unos segundos.")
+        _en_cola += 1
+
+    id_trabajo = id_trabajo or uuid.uuid4().hex
+    ahora = time.time()
+    try:
+        conn = _db()
+        conn.execute(
+            "INSERT OR REPLACE INTO trabajos (id, tipo, estado, worker, creado, actualizado) "
+            "VALUES (?, ?, 'pendiente', ?, ?, ?)",
+            (id_trabajo, tipo, os.getpid(), ahora, ahora)
+        )
+        _purgar(conn)
+        token = cancelacion.registrar(id_trabajo)
+        _obtener_pool().submit(_ejecutar, id_trabajo, funcion, kwargs, token)
+    except Exception:
+        with _en_cola_lock:
+            _en_cola -= 1
+        raise
+    print(f"📥 Trabajo {id_trabajo} ({tipo}) encolado.")
+    return id_trabajo
+
+
+def consultar(id_trabajo):
+    conn = _db()
+    fila = conn.execute(
+        "SELECT id, tipo, estado, resultado, error, intentos, creado, actualizado FROM trabajos WHERE id = ?",
+        (id_trabajo,)
+    ).fetchone()
+    if not fila:
+        return None
+    parcial = conn.execute("SELECT evento FROM trabajo_eventos WHERE id_trabajo = ? ORDER BY n", (id_trabajo,))
+    return {
+        "id_trabajo": fila[0],
+        "tipo": fila[1],
+        "estado": fila[2],
+        "parcial": [json.loads(evento) for evento, in parcial],
+        "resultado": json.loads(fila[3]) if fila[3] else None,
+        "error": fila[4],
+        "intentos": fila[5],
+        "creado": fila[6],
+        "actualizado": fila[7],
+    }
@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+import threading
+from types import SimpleNamespace
+import pytest
+
+# Las pruebas importan src/ desde la raíz del repo y guardan el estado
+# compartido (SQLite) en un directorio temporal, nunca en .estado/
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault("ESTADO_DIR", tempfile.mkdtemp(prefix="estado_pruebas_"))
+
+
+def _guion(estado, respuestas):
+    """
+    Las siguientes peticiones al mock responden, en orden, lo que diga la
+    lista ("429", "500", "malformado" u "ok"); después, todas "ok".
+    """
+    pendientes = list(respuestas)
+    # Una probabilidad distinta por sorteo para saber cuál se está pidiendo
+    sorteos = {0.5: "429", 0.6: "500", 0.7: "malformado"}
+    estado.config.update(prob_429=0.5, prob_500=0.6, prob_malformado=0.7)
+    actual = {}
+
+    def sortear(probabilidad):
+        if sorteos[probabilidad] == "429":
+            actual["respuesta"] = pendientes.pop(0) if pendientes else "ok"
+        return actual["respuesta"] == sorteos[probabilidad]
+
+    estado.sortear = sortear
+
+
+@pytest.fixture
+def mock_groq():
+    """herramientas/mock_groq en un hilo de la prueba y sin latencia"""
+    import logging
+    from werkzeug.serving import make_server
+    from herramientas.mock_groq import CONFIG_POR_DEFECTO, EstadoMock, crear_app
+
+    estado = EstadoMock(dict(CONFIG_POR_DEFECTO, latencia_distribucion="fija", latencia_media_ms=0.0, semilla=0))
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    servidor = make_server("127.0.0.1", 0, crear_app(estado), threaded=True)
+    threading.Thread(target=servidor.serve_forever, args=(0.05,), daemon=True).start()
+    yield SimpleNamespace(url=f"http://127.0.0.1:{servidor.server_port}/openai/v1", estado=estado,
+                          guion=lambda respuestas: _guion(estado, respuestas))
+    servidor.shutdown()
@@ -0,0 +1,45 @@
+import uuid
+import pytest
+from src import cache, config
+
+
+@pytest.fixture(autouse=True)
+def cache_activa(monkeypatch):
+    monkeypatch.setattr(config, "CACHE_ACTIVA", True)
+    monkeypatch.setattr(config, "CACHE_TTL_SEGUNDOS", 0)
+
+
+def _clave():
+    return cache.clave("prueba", uuid.uuid4().hex)
+
+
+def test_guarda_y_recupera_de_memoria_y_de_disco():
+    k = _clave()
+    assert cache.obtener(k) is None
+    cache.guardar(k, {"calificacion": 4})
+    assert cache.obtener(k) == {"calificacion": 4}
+    with cache._lock:
+        cache._memoria.clear()
+    assert cache.obtener(k) == {"calificacion": 4}
+
+
+def test_una_entrada_caducada_no_se_sirve_ni_desde_memoria(monkeypatch):
+    k = _clave()
+    cache.guardar(k, {"calificacion": 4})
+    monkeypatch.setattr(config, "CACHE_TTL_SEGUNDOS", 60)
+    with cache._lock:
+        valor, creado = cache._memoria[k]
+        cache._memoria[k] = (valor, creado - 61)
+    cache._db().execute("UPDATE cache SET creado = ? WHERE clave = ?", (creado - 61, k))
+    assert cache.obtener(k) is None
+    assert k not in cache._memoria
+
+
+def test_guardar_purga_las_filas_caducadas(monkeypatch):
+    vieja, nueva = _clave(), _clave()
+    monkeypatch.setattr(config, "CACHE_TTL_SEGUNDOS", 60)
+    cache._db().execute("INSERT INTO cache (clave, valor, creado) VALUES (?, '1', ?)",
+                        (vieja, cache.time.time() - 61))
+    cache.guardar(nueva, 2)
+    filas = {c for c, in cache._db().execute("SELECT clave FROM cache WHERE clave IN (?, ?)", (vieja, nueva))}
+    assert filas == {nueva}
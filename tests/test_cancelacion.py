@@ -0,0 +1,109 @@
+import time
+import uuid
+import pytest
+from src import cancelacion
+
+
+@pytest.fixture
+def id_evaluacion():
+    return uuid.uuid4().hex
+
+
+def test_cancelar_solo_afecta_a_su_id(id_evaluacion):
+    token = cancelacion.registrar(id_evaluacion)
+    otro = cancelacion.registrar()
+    try:
+        assert cancelacion.cancelar(id_evaluacion) == 1
+        assert token.is_set()
+        assert not otro.is_set()
+        with pytest.raises(cancelacion.EvaluacionCancelada):
+            token.verificar()
+        otro.verificar()
+    finally:
+        cancelacion.liberar(token)
+        cancelacion.liberar(otro)
+
+
+def test_cancelar_sin_id_o_desconocido():
+    assert cancelacion.cancelar(None) == 0
+    assert cancelacion.cancelar("no-existe") == 0
+
+
+def test_la_senal_llega_a_otro_worker(id_evaluacion):
+    token = cancelacion.registrar(id_evaluacion)
+    try:
+        # Otro proceso sólo ve la fila de SQLite, no el token en memoria
+        cancelacion._db().execute("UPDATE evaluaciones_activas SET cancelada = 1 WHERE id = ?", (id_evaluacion,))
+        token._ultima_revision = 0.0
+        assert token.is_set()
+    finally:
+        cancelacion.liberar(token)
+
+
+def test_peticiones_con_el_mismo_id_comparten_token_hasta_la_ultima(id_evaluacion):
+    primero = cancelacion.registrar(id_evaluacion)
+    segundo = cancelacion.registrar(id_evaluacion)
+    assert segundo.id == primero.id and cancelacion._activos[id_evaluacion].usos == 2
+    cancelacion.liberar(primero)
+    # La segunda petición sigue registrada: /cancelar todavía la alcanza
+    assert cancelacion.cancelar(id_evaluacion) == 1
+    assert segundo.is_set()
+    cancelacion.liberar(segundo)
+    assert cancelacion.cancelar(id_evaluacion) == 0
+    assert cancelacion.registrar(id_evaluacion) is not primero
+    cancelacion.liberar(cancelacion._activos[id_evaluacion])
+
+
+def test_peticiones_con_el_mismo_id_conservan_su_propio_plazo(id_evaluacion):
+    sin_plazo = cancelacion.registrar(id_evaluacion)
+    corto = cancelacion.registrar(id_evaluacion, plazo=0.05)
+    largo = cancelacion.registrar(id_evaluacion, plazo=10)
+    try:
+        assert sin_plazo.restante() is None
+        assert largo.restante() > 9
+        assert corto.esperar(5) is False
+        assert corto.vencido() and not largo.vencido() and not sin_plazo.vencido()
+        # La cancelación sigue siendo común a todas
+        cancelacion.cancelar(id_evaluacion)
+        assert sin_plazo.is_set() and corto.is_set() and largo.is_set()
+    finally:
+        for token in (sin_plazo, corto, largo):
+            cancelacion.liberar(token)
+    assert id_evaluacion not in cancelacion._activos
+
+
+def test_el_plazo_corta_sin_marcar_cancelada(id_evaluacion):
+    token = cancelacion.registrar(id_evaluacion, plazo=0.05)
+    try:
+        assert token.restante() > 0
+        assert token.esperar(5) is False
+        assert token.vencido() and not token.is_set()
+        with pytest.raises(cancelacion.PlazoAgotado):
+            token.verificar()
+    finally:
+        cancelacion.liberar(token)
+
+
+def test_reservando_adelanta_el_plazo_sin_pasar_de_la_mitad(id_evaluacion):
+    token = cancelacion.registrar(id_evaluacion, plazo=10)
+    try:
+        tramo = token.reservando(8)
+        assert 4.5 < tramo.restante() < 5.5
+        assert token.reservando(0) is token
+        cancelacion.cancelar(id_evaluacion)
+        assert tramo.is_set()
+    finally:
+        cancelacion.liberar(token)
+
+
+def test_ejecutar_cancelable_abandona_la_espera(id_evaluacion):
+    token = cancelacion.registrar(id_evaluacion)
+    try:
+        assert cancelacion.ejecutar_cancelable(lambda: 42, token) == 42
+        inicio = time.monotonic()
+        token.set()
+        with pytest.raises(cancelacion.EvaluacionCancelada):
+            cancelacion.ejecutar_cancelable(lambda: time.sleep(2), token)
+        assert time.monotonic() - inicio < 1
+    finally:
+        cancelacion.liberar(token)
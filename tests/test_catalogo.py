@@ -0,0 +1,101 @@
+import os
+import shutil
+from types import MappingProxyType
+import pytest
+from src import catalogo, config
+
+
+@pytest.mark.parametrize("rango, esperado", [
+    ("7-11", "7-11"),
+    ("7 - 11 años", "7-11"),
+    ("7–11", "7-11"),
+    ("7—11 anos", "7-11"),
+    ("61 en adelante", "61_en_adelante"),
+    ("11-12 en  adelante", "11-12_en_adelante"),
+    ("11-12_en_adelante", "11-12_en_adelante"),
+    (" 39 ", "39"),
+    (None, ""),
+    (7, "7"),
+])
+def test_normalizar_rango(rango, esperado):
+    assert catalogo.normalizar_rango(rango) == esperado
+
+
+def _catalogo(rangos):
+    perfiles = {"adulta": MappingProxyType({catalogo.normalizar_rango(r): {"rango": r} for r in rangos})}
+    return catalogo.Catalogo(MappingProxyType(perfiles), MappingProxyType({}), firma=())
+
+
+def test_perfil_por_clave_exacta_tras_normalizar():
+    c = _catalogo(["30-40", "39-61"])
+    assert c.perfil("adulta", "39 - 61 años") == {"rango": "39-61"}
+
+
+def test_perfil_por_edad_contenida_en_el_rango():
+    c = _catalogo(["19-29", "30-40", "39-61", "61 en adelante"])
+    assert c.perfil("adulta", "45") == {"rango": "39-61"}
+    assert c.perfil("adulta", "20-25") == {"rango": "19-29"}
+    assert c.perfil("adulta", "75") == {"rango": "61 en adelante"}
+    assert c.perfil("adulta", "65-70 años") == {"rango": "61 en adelante"}
+
+
+def test_perfil_en_un_extremo_compartido_gana_el_rango_que_empieza_ahi():
+    c = _catalogo(["2-7", "7-11", "11-12 en adelante", "30-40", "39-61", "61 en adelante"])
+    assert c.perfil("adulta", "61") == {"rango": "61 en adelante"}
+    assert c.perfil("adulta", "39") == {"rango": "39-61"}
+    assert c.perfil("adulta", "11") == {"rango": "11-12 en adelante"}
+    assert c.perfil("adulta", "11-12") == {"rango": "11-12 en adelante"}
+
+
+def test_perfil_vacio_o_desconocido():
+    c = _catalogo(["2-7", "19-29"])
+    assert c.perfil("adulta", "") == {}
+    assert c.perfil("adulta", None) == {}
+    assert c.perfil("adulta", "adolescentes") == {}
+    assert c.perfil("adulta", "80-90") == {}
+    assert c.perfil("adulta", "20-35") == {}
+    assert c.perfil("joven", "19-29") == {}
+
+
+@pytest.mark.parametrize("rango, esperado", [
+    ("7-11", (7, 11)),
+    ("39", (39, 39)),
+    ("61_en_adelante", (61, float("inf"))),
+    ("11-12_en_adelante", (11, float("inf"))),
+    ("", None),
+    ("11-7", None),
+    ("doce", None),
+    ("7-11_meses", None),
+])
+def test_limites_rango(rango, esperado):
+    assert catalogo.limites_rango(rango) == esperado
+
+
+def test_catalogo_de_data_es_inmutable():
+    c = catalogo.construir()
+    assert c.perfil("joven", "11-12")
+    assert c.modelos_de("joven")
+    with pytest.raises(TypeError):
+        c.perfiles["joven"]["nuevo"] = {}
+
+
+def test_un_json_corrupto_en_la_recarga_mantiene_el_catalogo(tmp_path, monkeypatch):
+    shutil.copytree(os.path.join(config.BASE_DIR, "data"), tmp_path / "data")
+    monkeypatch.setattr(config, "BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "CATALOGO_REVISION_SEGUNDOS", 0)
+    monkeypatch.setattr(catalogo, "_actual", None)
+    vigente = catalogo.obtener()
+    assert "pedagogia_critica" in vigente.modelos_de("adulta")
+
+    modelo = tmp_path / "data" / "models" / "pedagogia_critica.json"
+    original = modelo.read_text(encoding="utf-8")
+    modelo.write_text(original[:len(original) // 2], encoding="utf-8")  # a medio escribir
+    os.utime(modelo, ns=(1, 1))
+    assert catalogo.obtener() is vigente
+    assert catalogo.obtener() is vigente  # sigue sin recargar mientras no cambie
+
+    modelo.write_text(original, encoding="utf-8")
+    os.utime(modelo, ns=(2, 2))
+    recargado = catalogo.obtener()
+    assert recargado is not vigente
+    assert "pedagogia_critica" in recargado.modelos_de("adulta")
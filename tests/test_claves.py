@@ -0,0 +1,52 @@
+import uuid
+import pytest
+from src import claves, limitador, llm_gateway
+
+
+def _credencial(api_base="http://127.0.0.1:1/openai/v1"):
+    sufijo = uuid.uuid4().hex
+    return claves.Credencial(f"prueba_{sufijo}", f"clave-{sufijo[:6]}", api_base)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Dos claves nuevas (buckets y pausas propios) con el cupo por defecto"""
+    credenciales = [_credencial(), _credencial()]
+    monkeypatch.setattr(claves, "POOL", credenciales)
+    return credenciales
+
+
+def test_cada_llamada_sale_por_la_clave_con_mas_margen(pool):
+    limitador.intentar(limitador.config.LIMITE_TPM // 2, pool[0].nombre)
+    assert claves.adquirir(10)[0] == pool[1]
+
+    limitador.vaciar(pool[1].nombre)
+    assert claves.adquirir(10)[0] == pool[0]
+
+
+def test_una_clave_en_pausa_queda_fuera_de_la_rotacion(pool):
+    claves.pausar(pool[0], 60)
+    assert {claves.adquirir(10)[0] for _ in range(3)} == {pool[1]}
+    assert claves.hay_otra_activa(pool[0])
+    assert not claves.hay_otra_activa(pool[1])
+    assert [c["en_pausa"] for c in claves.estado()] == [True, False]
+
+
+def test_con_todas_en_pausa_se_espera_a_la_primera_que_vuelve(pool):
+    claves.pausar(pool[0], 0.3)
+    claves.pausar(pool[1], 60)
+    credencial, espera = claves._turno(10)
+    assert credencial is None and 0 < espera <= 0.3
+
+
+def test_un_429_pausa_la_clave_y_el_reintento_sale_por_otra(mock_groq, monkeypatch):
+    pool = [_credencial(mock_groq.url), _credencial(mock_groq.url)]
+    monkeypatch.setattr(claves, "POOL", pool)
+    mock_groq.estado.config["retry_after"] = 60
+    mock_groq.guion(["429"])
+    llm_gateway._db().execute("DELETE FROM circuitos WHERE nombre = 'groq'")
+
+    comp = llm_gateway.llamar([{"role": "user", "content": "Evalúa el indicador de prueba."}], reintentos=2)
+    assert comp is not None
+    assert mock_groq.estado.contadores["por_clave"] == {pool[0].api_key[-6:]: 1, pool[1].api_key[-6:]: 1}
+    assert pool[0].nombre in claves._pausadas() and pool[1].nombre not in claves._pausadas()
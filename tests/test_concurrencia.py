@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+import pytest
+from src import concurrencia, config
+
+
+@pytest.fixture(autouse=True)
+def estado_limpio(monkeypatch):
+    monkeypatch.setattr(config, "CONCURRENCIA_ADAPTATIVA", True)
+    monkeypatch.setattr(config, "CONCURRENCIA_INICIAL", 2)
+    monkeypatch.setattr(config, "CONCURRENCIA_MINIMA", 1)
+    monkeypatch.setattr(config, "CONCURRENCIA_MAXIMA", 8)
+    monkeypatch.setattr(config, "CONCURRENCIA_FACTOR_REDUCCION", 0.5)
+    monkeypatch.setattr(config, "CONCURRENCIA_PICO_LATENCIA", 3)
+    monkeypatch.setattr(concurrencia, "_estado", None)
+    yield
+    concurrencia._estado = None
+
+
+def _llenar(n):
+    for _ in range(n):
+        concurrencia.adquirir()
+
+
+def test_arranque_lento_sube_solo_si_el_limite_se_usa():
+    _llenar(2)
+    concurrencia.liberar("indicador", 0.5)
+    assert concurrencia.estado()["limite"] == 3
+    # Con una sola llamada en vuelo de un límite de 3 no hay motivo para subir
+    concurrencia.liberar("indicador", 0.5)
+    assert concurrencia.estado()["limite"] == 3
+    assert concurrencia.estado()["en_vuelo"] == 0
+
+
+def test_un_429_recorta_una_sola_vez_por_episodio():
+    _llenar(2)
+    concurrencia.liberar("indicador", 0.5, "rate_limit")
+    concurrencia.liberar("indicador", 0.5, "rate_limit")
+    estado = concurrencia.estado()
+    assert estado["limite"] == 1
+    assert estado["fase"] == "evitacion"
+    assert [d["accion"] for d in estado["decisiones"]] == ["bajar"]
+
+
+def test_nunca_baja_del_minimo():
+    concurrencia._actual()["limite"] = 1.0
+    _llenar(1)
+    concurrencia.liberar("indicador", 0.5, "timeout")
+    assert concurrencia.estado()["limite"] == 1
+
+
+def test_en_evitacion_sube_de_a_poco():
+    estado = concurrencia._actual()
+    estado["fase"], estado["limite"] = "evitacion", 4.0
+    _llenar(4)
+    concurrencia.liberar("indicador", 0.5)
+    assert concurrencia.estado()["limite"] == pytest.approx(4.25)
+
+
+def test_errores_y_cancelaciones_no_ajustan():
+    _llenar(2)
+    concurrencia.liberar("indicador", 0.5, "error")
+    concurrencia.liberar("indicador", None, "cancelado")
+    estado = concurrencia.estado()
+    assert estado["limite"] == 2 and estado["en_vuelo"] == 0
+
+
+def test_un_pico_de_latencia_recorta():
+    for _ in range(concurrencia.MUESTRAS_MINIMAS):
+        concurrencia.adquirir()
+        concurrencia.liberar("indicador", 1.0)
+    assert concurrencia.latencia_habitual("indicador") == pytest.approx(1.0)
+    antes = concurrencia.estado()["limite"]
+    concurrencia.adquirir()
+    concurrencia.liberar("indicador", 10.0)
+    assert concurrencia.estado()["limite"] == pytest.approx(antes * 0.5)
+
+
+def test_adquirir_espera_un_hueco():
+    _llenar(2)
+    entro = threading.Event()
+    hilo = threading.Thread(target=lambda: (concurrencia.adquirir(), entro.set()))
+    hilo.start()
+    assert not entro.wait(0.2)
+    assert concurrencia.estado()["esperando"] == 1
+    concurrencia.liberar("indicador", None, "cancelado")
+    assert entro.wait(2)
+    hilo.join()
+
+
+def test_adquirir_cancelado_mientras_espera():
+    class Cancelada(Exception):
+        pass
+
+    class Token:
+        def verificar(self):
+            raise Cancelada()
+
+    _llenar(2)
+    with pytest.raises(Cancelada):
+        concurrencia.adquirir(Token())
+    assert concurrencia.estado()["esperando"] == 0
+    assert concurrencia.estado()["en_vuelo"] == 2
+
+
+def test_adquirir_async_despierta_al_liberar():
+    _llenar(2)
+
+    async def escenario():
+        espera = asyncio.ensure_future(concurrencia.adquirir_async())
+        await asyncio.sleep(0.05)
+        assert not espera.done()
+        concurrencia.liberar("indicador", None, "cancelado")
+        return await asyncio.wait_for(espera, 1)
+
+    assert asyncio.run(escenario()) < 1
+    assert concurrencia.estado()["en_vuelo"] == 2
+
+
+def test_desactivado_no_limita(monkeypatch):
+    monkeypatch.setattr(config, "CONCURRENCIA_ADAPTATIVA", False)
+    _llenar(5)
+    assert concurrencia.estado()["en_vuelo"] == 5
+
+
+def test_la_espera_antes_de_empezar_no_cuenta_como_latencia():
+    with concurrencia.turno("indicador") as turno:
+        time.sleep(0.2)  # p. ej. esperando hilo libre en el pool de llamadas
+        turno.empezar()
+    assert concurrencia.estado()["latencia_habitual"]["indicador"]["segundos"] < 0.1
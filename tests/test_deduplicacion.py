@@ -0,0 +1,110 @@
+import threading
+import time
+import uuid
+import pytest
+from src import deduplicacion
+from src.cancelacion import TokenCancelacion
+
+
+@pytest.fixture
+def clave(monkeypatch):
+    """Una clave propia por prueba y sondeos rápidos"""
+    monkeypatch.setattr(deduplicacion, "INTERVALO_SONDEO", 0.02)
+    monkeypatch.setattr(deduplicacion.config, "DEDUPLICACION_ACTIVA", True)
+    return f"prueba_{uuid.uuid4().hex}"
+
+
+def _en_curso(clave, puede_terminar, eventos=()):
+    """Lanza en un hilo un cálculo dueño que emite 'eventos' y espera a puede_terminar"""
+    salida = {}
+
+    def calcular(al_evento):
+        for evento in eventos:
+            al_evento(evento)
+        puede_terminar.wait(5)
+        return {"evaluaciones": [{"indicador": "A", "calificacion": 4}]}
+
+    hilo = threading.Thread(target=lambda: salida.update(resultado=deduplicacion.compartir(clave, calcular)))
+    hilo.start()
+    time.sleep(0.1)
+    return hilo, salida
+
+
+def _no_debe_calcular(al_evento):
+    raise AssertionError("quien espera no debe calcular")
+
+
+def test_una_evaluacion_identica_recibe_los_mismos_eventos_y_resultado(clave):
+    puede_terminar = threading.Event()
+    eventos = [{"evento": "indicador", "i": i} for i in range(3)]
+    hilo, dueno = _en_curso(clave, puede_terminar, eventos)
+
+    recibidos = []
+    threading.Timer(0.2, puede_terminar.set).start()
+    resultado = deduplicacion.compartir(clave, _no_debe_calcular, recibidos.append)
+    hilo.join()
+    assert resultado == dueno["resultado"]
+    assert recibidos == eventos
+
+
+def test_el_latido_mantiene_al_dueno_mientras_calcula(clave, monkeypatch):
+    monkeypatch.setattr(deduplicacion.config, "VUELO_LATIDO_SEGUNDOS", 0.05)
+    monkeypatch.setattr(deduplicacion.config, "VUELO_SEGUNDOS_SIN_LATIDO", 0.3)
+    puede_terminar = threading.Event()
+    hilo, dueno = _en_curso(clave, puede_terminar)
+
+    threading.Timer(1.0, puede_terminar.set).start()
+    resultado = deduplicacion.compartir(clave, _no_debe_calcular)
+    hilo.join()
+    assert resultado == dueno["resultado"]
+
+
+def test_sin_latido_quien_espera_toma_el_relevo_y_avisa_del_reinicio(clave, monkeypatch):
+    monkeypatch.setattr(deduplicacion.config, "VUELO_SEGUNDOS_SIN_LATIDO", 0.3)
+    # Un dueño que murió tras emitir un evento: no vuelve a dar latidos
+    assert deduplicacion._reclamar(clave, "muerto")
+    deduplicacion._db().execute("INSERT INTO vuelo_eventos (clave, n, evento) VALUES (?, 1, ?)",
+                                (clave, '{"evento": "indicador", "i": 9}'))
+
+    calculos = []
+
+    def calcular(al_evento):
+        calculos.append(1)
+        al_evento({"evento": "indicador", "i": 0})
+        return {"evaluaciones": []}
+
+    recibidos = []
+    assert deduplicacion.compartir(clave, calcular, recibidos.append) == {"evaluaciones": []}
+    assert calculos == [1]
+    assert recibidos == [{"evento": "indicador", "i": 9}, {"evento": "reinicio", "motivo": "relevo"},
+                         {"evento": "indicador", "i": 0}]
+
+
+def test_un_resultado_a_medias_no_se_comparte(clave):
+    cancelado = deduplicacion.compartir(clave, lambda al_evento: {"cancelado": True})
+    assert cancelado == {"cancelado": True}
+    assert deduplicacion.compartir(clave, lambda al_evento: {"evaluaciones": []}) == {"evaluaciones": []}
+
+
+def test_quien_espera_y_se_cancela_devuelve_none(clave):
+    puede_terminar = threading.Event()
+    hilo, _ = _en_curso(clave, puede_terminar)
+    token = TokenCancelacion(uuid.uuid4().hex)
+    token.set()
+    try:
+        assert deduplicacion.compartir(clave, _no_debe_calcular, cancelacion=token) is None
+    finally:
+        puede_terminar.set()
+        hilo.join()
+
+
+def test_quien_espera_respeta_su_propio_plazo(clave):
+    puede_terminar = threading.Event()
+    hilo, _ = _en_curso(clave, puede_terminar)
+    token = TokenCancelacion(uuid.uuid4().hex, plazo=0.2)
+    try:
+        with pytest.raises(deduplicacion.PlazoAgotado):
+            deduplicacion.compartir(clave, _no_debe_calcular, cancelacion=token)
+    finally:
+        puede_terminar.set()
+        hilo.join()
@@ -0,0 +1,73 @@
+from src import esquemas
+
+
+def _indicador_actividad(calificacion=4, **analisis):
+    analisis = analisis or {"ejecucion_indicador": "Activa el indicador.", "adecuacion_cognitiva": "Apta."}
+    return {"calificacion": calificacion, "analisis": analisis}
+
+
+def test_cargar_json_valido():
+    assert esquemas.cargar('{"a": 1}') == ({"a": 1}, False)
+
+
+def test_cargar_repara_vallas_y_comas_colgantes():
+    datos, reparado = esquemas.cargar('Aquí va:\n```json\n{"a": [1, 2,], "b": "x, }",}\n```')
+    assert reparado
+    assert datos == {"a": [1, 2], "b": "x, }"}
+
+
+def test_cargar_rescata_json_cortado():
+    datos, reparado = esquemas.cargar('{"calificacion": 3, "analisis": {"ejecucion_indicador": "a medi')
+    assert reparado
+    assert datos == {"calificacion": 3, "analisis": {"ejecucion_indicador": "a medi"}}
+
+
+def test_cargar_sin_json():
+    assert esquemas.cargar(None) == ({}, True)
+    assert esquemas.cargar("[1, 2]") == ({}, True)
+
+
+def test_revisar_respuesta_conforme_no_cambia_nada():
+    datos = _indicador_actividad()
+    assert esquemas.revisar("indicador_actividad", datos) == (_indicador_actividad(), [], False)
+
+
+def test_revisar_normaliza_calificacion_y_claves():
+    datos = {"Calificacion": "4/5", "Analisis": {"Ejecucion Indicador": "Sí.", "adecuacion_cognitiva": "Apta."}}
+    datos, invalidos, cambiado = esquemas.revisar("indicador_actividad", datos)
+    assert invalidos == [] and cambiado
+    assert datos == _indicador_actividad(4, ejecucion_indicador="Sí.", adecuacion_cognitiva="Apta.")
+
+
+def test_revisar_analisis_en_texto_pasa_al_primer_campo():
+    datos, invalidos, _ = esquemas.revisar("indicador_actividad", {"calificacion": 2.0, "analisis": "Todo junto."})
+    assert datos["calificacion"] == 2
+    assert datos["analisis"]["ejecucion_indicador"] == "Todo junto."
+    assert [campo[0] for campo in invalidos] == [("analisis", "adecuacion_cognitiva")]
+
+
+def test_revisar_marca_calificaciones_fuera_de_rango():
+    for calificacion in (0, 6, True, "alta", 3.5):
+        _, invalidos, _ = esquemas.revisar("indicador_actividad", _indicador_actividad(calificacion))
+        assert [campo[0] for campo in invalidos] == [("calificacion",)], calificacion
+
+
+def test_revisar_acepta_el_rechazo_del_filtro():
+    rechazo = {"es_valido": False, "mensaje_error": "Contenido no pedagógico"}
+    assert esquemas.revisar("indicador_objetivo", dict(rechazo)) == (rechazo, [], False)
+
+
+def test_revisar_informe_normaliza_la_ruta_de_accion():
+    datos = {"analisis_final": {"sintesis_ejecutiva": "S.", "diagnostico_coherencia": "D.",
+                                "ruta_de_accion": ["Trabajo por proyectos"]}}
+    datos, invalidos, cambiado = esquemas.revisar("informe", datos)
+    assert invalidos == [] and cambiado
+    assert datos["analisis_final"]["ruta_de_accion"] == [{"estrategia": "Trabajo por proyectos"}]
+
+
+def test_mensajes_reparacion_pide_solo_los_campos_invalidos():
+    _, invalidos, _ = esquemas.revisar("feedback", {})
+    mensajes = esquemas.mensajes_reparacion([{"role": "user", "content": "x"}], "", invalidos)
+    assert [m["role"] for m in mensajes] == ["user", "assistant", "user"]
+    assert mensajes[1]["content"] == "{}"
+    assert "comentario_general" in mensajes[2]["content"]
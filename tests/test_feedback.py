@@ -0,0 +1,20 @@
+from types import SimpleNamespace
+from src import feedback
+
+EVALUACIONES = [{"indicador": "Claridad", "calificacion": 2}, {"indicador": "Pertinencia", "calificacion": 5}]
+
+
+def _respuesta(contenido):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=contenido))])
+
+
+def test_un_json_cortado_degrada_al_comentario_de_respaldo():
+    res = feedback.procesar_respuesta_comentario(_respuesta('{"comentario_general": "El objetivo'), "k", "objetivo",
+                                                 EVALUACIONES)
+    assert res["degradado"] is True
+    assert "Claridad (2/5)" in res["comentario_general"]
+
+
+def test_sin_calificaciones_no_hay_respaldo_posible():
+    res = feedback.procesar_respuesta_comentario(_respuesta("{}"), "k", "objetivo")
+    assert res["comentario_general"].startswith("Error procesando JSON")
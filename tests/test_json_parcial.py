@@ -0,0 +1,72 @@
+from src import json_parcial
+from src.json_parcial import LectorJSON
+
+
+def test_publica_cada_campo_en_cuanto_se_completa():
+    lector = LectorJSON()
+    assert lector.alimentar('```json\n{"calificacion": 4, "anal') == ["calificacion"]
+    assert lector.campos == {"calificacion": 4}
+    assert not lector.completo
+    assert lector.alimentar('isis": {"a": "b"}}\n```') == ["analisis"]
+    assert lector.completo
+    assert lector.campos == {"calificacion": 4, "analisis": {"a": "b"}}
+
+
+def test_las_comas_y_llaves_dentro_de_cadenas_no_cierran_campos():
+    lector = LectorJSON()
+    lector.alimentar('{"texto": "uno, {dos} \\"tres\\"", "n": [1, 2]}')
+    assert lector.campos == {"texto": 'uno, {dos} "tres"', "n": [1, 2]}
+
+
+def test_al_texto_recibe_las_cadenas_sin_escapes_ni_secuencias_cortadas():
+    trozos = []
+    lector = LectorJSON(lambda ruta, texto: trozos.append((ruta, texto)))
+    for fragmento in ['{"a": {"b": "hola\\', 'nmun', 'do\\u00', 'e1"}}']:
+        lector.alimentar(fragmento)
+    assert "".join(t for _, t in trozos) == "hola\nmundoá"
+    assert {ruta for ruta, _ in trozos} == {("a", "b")}
+
+
+def test_no_parte_un_par_sustituto():
+    trozos = []
+    lector = LectorJSON(lambda ruta, texto: trozos.append(texto))
+    lector.alimentar('{"a": "x\\ud83d')
+    lector.alimentar('\\ude00"}')
+    assert "".join(trozos) == "x😀"
+    assert all(not ("\ud800" <= t[-1] <= "\udbff") for t in trozos)
+
+
+def test_rescatar_cierra_cadenas_y_corchetes_abiertos():
+    assert json_parcial.rescatar('{"calificacion": 3, "analisis": {"a": "cort') == {
+        "calificacion": 3, "analisis": {"a": "cort"}}
+    assert json_parcial.rescatar('{"lista": [1, 2,') == {"lista": [1, 2]}
+
+
+def test_rescatar_sin_json():
+    assert json_parcial.rescatar("lo siento, no puedo") == {}
+
+
+def test_rescatar_un_escape_cortado_lo_descarta():
+    assert json_parcial.rescatar('{"a": "fin\\') == {"a": "fin"}
+
+
+def test_escucha_reenvia_solo_las_rutas_pedidas_y_corta_al_cerrar():
+    eventos = []
+    al_fragmento = json_parcial.escucha(eventos.append, [("analisis",)])
+    acumulado = ""
+    for fragmento in ['{"calificacion": 5, "analisis": {"x": "ab', 'c"}}', " basura"]:
+        acumulado += fragmento
+        terminado = al_fragmento(acumulado)
+    assert terminado
+    assert "".join(e["texto"] for e in eventos) == "abc"
+    assert {e["campo"] for e in eventos} == {"analisis.x"}
+
+
+def test_escucha_avisa_del_reinicio_cuando_la_llamada_se_reintenta():
+    eventos = []
+    al_fragmento = json_parcial.escucha(eventos.append, [("a",)])
+    al_fragmento('{"a": "primer')
+    al_fragmento('{"a": "otro"}')
+    assert {"reinicio": True} in eventos
+    despues = eventos[eventos.index({"reinicio": True}) + 1:]
+    assert "".join(e["texto"] for e in despues) == "otro"
@@ -0,0 +1,67 @@
+import uuid
+import pytest
+from src import limitador
+
+
+@pytest.fixture
+def bucket():
+    # Un bucket propio por prueba: la tabla es compartida
+    return f"prueba_{uuid.uuid4().hex}"
+
+
+def test_descuenta_peticiones_hasta_agotar_el_cupo(bucket):
+    assert limitador.intentar(10, bucket, rpm=2, tpm=1000) == 0
+    assert limitador.intentar(10, bucket, rpm=2, tpm=1000) == 0
+    espera = limitador.intentar(10, bucket, rpm=2, tpm=1000)
+    # Falta casi una petición entera: a 2 por minuto son ~30 s, acotados por ciclo
+    assert espera == limitador.ESPERA_MAXIMA_POR_CICLO
+
+
+def test_espera_por_tokens_proporcional_a_lo_que_falta(bucket):
+    assert limitador.intentar(5900, bucket, rpm=100, tpm=6000) == 0
+    espera = limitador.intentar(200, bucket, rpm=100, tpm=6000)
+    # Faltan ~100 tokens a 6000/min: ~1 s
+    assert 0.9 < espera < 1.1
+
+
+def test_una_peticion_mayor_que_el_tpm_no_se_bloquea_para_siempre(bucket):
+    assert limitador.intentar(10_000, bucket, rpm=10, tpm=1000) == 0
+
+
+def test_el_intento_fallido_no_consume_cupo(bucket):
+    assert limitador.intentar(900, bucket, rpm=10, tpm=1000) == 0
+    assert limitador.intentar(500, bucket, rpm=10, tpm=1000) > 0
+    assert limitador.intentar(50, bucket, rpm=10, tpm=1000) == 0
+
+
+def test_vaciar_deja_esperando_a_todos(bucket):
+    limitador.vaciar(bucket, rpm=10, tpm=1000)
+    assert limitador.margen(bucket, rpm=10, tpm=1000) < 0.01
+    assert limitador.intentar(1, bucket, rpm=10, tpm=1000) > 0
+
+
+def test_ajustar_devuelve_lo_reservado_de_mas(bucket):
+    assert limitador.intentar(900, bucket, rpm=10, tpm=1000) == 0
+    assert limitador.intentar(800, bucket, rpm=10, tpm=1000) > 0
+    # La API gastó 100 de los 900 tokens reservados
+    limitador.ajustar(900, 100, bucket, rpm=10, tpm=1000)
+    assert limitador.intentar(800, bucket, rpm=10, tpm=1000) == 0
+
+
+def test_ajustar_sin_usage_no_toca_el_bucket(bucket):
+    limitador.intentar(400, bucket, rpm=10, tpm=1000)
+    antes = limitador.margen(bucket, rpm=10, tpm=1000)
+    limitador.ajustar(400, None, bucket, rpm=10, tpm=1000)
+    assert limitador.margen(bucket, rpm=10, tpm=1000) == pytest.approx(antes, abs=0.01)
+
+
+def test_tokens_usados_de_dict_y_objeto():
+    class Uso:
+        total_tokens = 42
+
+    class Respuesta:
+        usage = Uso()
+
+    assert limitador.tokens_usados({"usage": {"total_tokens": 7}}) == 7
+    assert limitador.tokens_usados(Respuesta()) == 42
+    assert limitador.tokens_usados({}) is None
@@ -0,0 +1,119 @@
+import time
+import uuid
+import openai
+import pytest
+from src import claves, llm_gateway
+
+MENSAJES = [{"role": "user", "content": "Evalúa el indicador de prueba."}]
+
+
+@pytest.fixture
+def circuito():
+    """Un circuito propio por prueba: la tabla es compartida"""
+    return f"prueba_{uuid.uuid4().hex}"
+
+
+@pytest.fixture
+def proveedor(mock_groq, monkeypatch):
+    """Todas las llamadas del gateway salen hacia el mock, con esperas cortas"""
+    credencial = claves.Credencial(f"prueba_{uuid.uuid4().hex}", "clave-prueba", mock_groq.url)
+    monkeypatch.setattr(claves, "POOL", [credencial])
+    monkeypatch.setattr(llm_gateway.config, "LLM_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(llm_gateway.config, "LLM_BACKOFF_MAXIMO", 0.05)
+    # Un 429 vacía el cupo de la clave: que se rellene en centésimas, no en segundos
+    monkeypatch.setattr(llm_gateway.config, "LIMITE_RPM", 6000)
+    monkeypatch.setattr(llm_gateway.config, "LIMITE_TPM", 10_000_000)
+    llm_gateway._db().execute("DELETE FROM circuitos WHERE nombre = 'groq'")
+    yield mock_groq
+    llm_gateway._db().execute("DELETE FROM circuitos WHERE nombre = 'groq'")
+
+
+def test_reintenta_los_500_hasta_obtener_respuesta(proveedor):
+    proveedor.guion(["500", "500"])
+    comp = llm_gateway.llamar(MENSAJES, reintentos=3)
+    assert comp is not None and comp["choices"][0]["message"]["content"]
+    assert proveedor.estado.contadores["errores_500"] == 2
+    assert proveedor.estado.contadores["llamadas"] == 3
+
+
+def test_un_429_espera_lo_que_pide_retry_after(proveedor):
+    proveedor.estado.config["retry_after"] = 0.4
+    proveedor.guion(["429"])
+    inicio = time.monotonic()
+    assert llm_gateway.llamar(MENSAJES, reintentos=3) is not None
+    assert time.monotonic() - inicio >= 0.4
+    assert proveedor.estado.contadores["errores_429"] == 1
+
+
+def test_un_error_no_transitorio_no_se_reintenta(proveedor, monkeypatch):
+    intentos = []
+    crear = openai.ChatCompletion.create
+
+    def contar(**parametros):
+        intentos.append(1)
+        return crear(**parametros)
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", contar)
+    monkeypatch.setattr(claves, "POOL", [claves.Credencial(claves.POOL[0].nombre, "clave-prueba",
+                                                           proveedor.url + "/no-existe")])
+    assert llm_gateway.llamar(MENSAJES, reintentos=3) is None
+    assert len(intentos) == 1
+
+
+def test_el_circuito_abierto_falla_sin_llamar(proveedor, monkeypatch):
+    monkeypatch.setattr(llm_gateway.config, "CIRCUITO_UMBRAL_FALLOS", 2)
+    proveedor.guion(["500", "500"])
+    assert llm_gateway.llamar(MENSAJES, reintentos=2) is None
+    assert llm_gateway.estado_circuito()["abierto"]
+
+    assert llm_gateway.llamar(MENSAJES, reintentos=2) is None
+    assert proveedor.estado.contadores["llamadas"] == 2
+
+
+def test_medio_abierto_deja_pasar_una_sola_prueba(circuito, monkeypatch):
+    monkeypatch.setattr(llm_gateway.config, "CIRCUITO_UMBRAL_FALLOS", 2)
+    monkeypatch.setattr(llm_gateway.config, "CIRCUITO_SEGUNDOS_ABIERTO", 0.1)
+    llm_gateway.registrar_fallo(circuito)
+    assert llm_gateway.circuito_permite(circuito)
+    llm_gateway.registrar_fallo(circuito)
+    assert not llm_gateway.circuito_permite(circuito)
+
+    time.sleep(0.15)
+    assert llm_gateway.circuito_permite(circuito)
+    assert not llm_gateway.circuito_permite(circuito)
+    llm_gateway.registrar_exito(circuito)
+    assert llm_gateway.circuito_permite(circuito)
+    assert llm_gateway.estado_circuito(circuito)["fallos_consecutivos"] == 0
+
+
+def test_retry_after_en_segundos_o_como_fecha():
+    class Error(Exception):
+        def __init__(self, cabeceras):
+            self.headers = cabeceras
+
+    assert llm_gateway.segundos_retry_after(Error({"retry-after": "3"})) == 3.0
+    fecha = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 30))
+    assert 25 < llm_gateway.segundos_retry_after(Error({"Retry-After": fecha})) <= 30
+    assert llm_gateway.segundos_retry_after(Error({})) is None
+
+
+def test_la_espera_respeta_retry_after_y_el_techo(monkeypatch):
+    monkeypatch.setattr(llm_gateway.config, "LLM_BACKOFF_BASE", 1.0)
+    monkeypatch.setattr(llm_gateway.config, "LLM_BACKOFF_MAXIMO", 4.0)
+    for intento in range(8):
+        assert 0 <= llm_gateway.calcular_espera(intento) <= 4.0
+        assert 5.0 <= llm_gateway.calcular_espera(intento, retry_after=5.0) <= 6.0
+
+
+def test_en_streaming_no_pide_modo_json_y_corta_al_cerrar_el_json(proveedor):
+    textos = []
+
+    def al_fragmento(texto):
+        textos.append(texto)
+        return texto.rstrip().endswith("}")
+
+    comp = llm_gateway.llamar(MENSAJES, reintentos=1, al_fragmento=al_fragmento)
+    assert comp is not None
+    assert comp["choices"][0]["message"]["content"] == textos[-1]
+    assert '"calificacion"' in textos[-1] and len(textos) > 1
+    assert comp["usage"]["total_tokens"] > 0
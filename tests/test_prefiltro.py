@@ -0,0 +1,49 @@
+from src import prefiltro
+
+MODELOS = {
+    "joven": {
+        "critico": {
+            "nombre": "Crítico",
+            "indicadores": {
+                "Indagacion": {"Definicion": "Indagación sobre problemas de la comunidad",
+                               "Indicadores": ["formula preguntas", "investiga causas"]},
+                "Dialogo": {"Definicion": "Diálogo horizontal entre participantes",
+                            "Indicadores": ["escucha activa", "debate argumentado"]},
+                "Territorio": {"Definicion": "Vínculo con el territorio y sus recursos naturales",
+                               "Indicadores": ["mapea el barrio", "recorre el río"]},
+            },
+        },
+    },
+}
+CAMPOS = ["fortalezas", "mejoras"]
+
+
+def _tareas(*nombres):
+    return [("Crítico", nombre, "definición") for nombre in nombres]
+
+
+def test_las_variantes_de_una_palabra_comparten_raiz():
+    assert prefiltro.terminos("Indagación") == prefiltro.terminos("indagar")
+    assert prefiltro.terminos("la de los y para") == []
+
+
+def test_apagado_no_descarta_nada(monkeypatch):
+    monkeypatch.setattr(prefiltro.config, "PREFILTRO_ACTIVO", False)
+    indice = prefiltro.construir_indice(MODELOS)
+    tareas = _tareas("Indagacion", "Territorio")
+    assert prefiltro.separar(indice, "texto cualquiera", tareas, [0, 1], "objetivo", CAMPOS) == ([0, 1], {})
+
+
+def test_solo_resuelve_en_local_los_indicadores_sin_relacion(monkeypatch):
+    monkeypatch.setattr(prefiltro.config, "PREFILTRO_ACTIVO", True)
+    monkeypatch.setattr(prefiltro.config, "PREFILTRO_UMBRAL", 0.3)
+    indice = prefiltro.construir_indice(MODELOS)
+    tareas = _tareas("Indagacion", "Territorio", "Sin indexar")
+    contenido = "Los jóvenes indagan y formulan preguntas sobre los problemas de su comunidad."
+
+    restantes, locales = prefiltro.separar(indice, contenido, tareas, [0, 1, 2], "objetivo", CAMPOS)
+    assert restantes == [0, 2]
+    local = locales[1]
+    assert local["indicador"] == "Territorio" and local["calificacion"] == 1
+    assert set(local["analisis"]) == set(CAMPOS)
+    assert local["prefiltro"]["puntaje"] < 0.3
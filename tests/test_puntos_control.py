@@ -0,0 +1,66 @@
+import uuid
+from src import evaluators, puntos_control
+
+
+def _apartado():
+    return f"apartado-{uuid.uuid4().hex}"
+
+
+def test_recuperar_solo_rellena_los_huecos():
+    apartado = _apartado()
+    puntos_control.guardar(apartado, "a", {"indicador": "a", "calificacion": 3})
+    puntos_control.guardar(apartado, "b", {"indicador": "b", "calificacion": 1})
+
+    resultados = puntos_control.recuperar(apartado, ["a", "b", "c"], [None, {"indicador": "b"}, None], "objetivo")
+    assert resultados == [{"indicador": "a", "calificacion": 3}, {"indicador": "b"}, None]
+
+
+def test_un_apartado_a_medias_conserva_sus_puntos_de_control():
+    apartado = _apartado()
+    puntos_control.guardar(apartado, "a", {"calificacion": 2})
+
+    puntos_control.cerrar(apartado, {"plazo_agotado": True})
+    assert puntos_control.leer(apartado) == {"a": {"calificacion": 2}}
+    puntos_control.cerrar(apartado, {"feedback_global": {"degradado": True}})
+    assert puntos_control.leer(apartado)
+
+    puntos_control.cerrar(apartado, {"evaluaciones": []})
+    assert puntos_control.leer(apartado) == {}
+
+
+def test_reanudar_solo_evalua_los_indicadores_que_faltan(monkeypatch):
+    monkeypatch.setattr(evaluators.config, "CACHE_ACTIVA", False)
+    monkeypatch.setattr(evaluators.config, "PREFILTRO_ACTIVO", False)
+    monkeypatch.setattr(evaluators.config, "EVALUACION_EN_LOTE", False)
+    apartado = _apartado()
+    tareas = [("Modelo", f"Indicador {i}", "definición") for i in range(4)]
+    evaluados = []
+
+    def interrumpido(contenido, perfil, tarea, cancelacion=None, al_parcial=None):
+        evaluados.append(tarea[1])
+        return None if tarea[1] == "Indicador 2" else {"indicador": tarea[1], "calificacion": 3}
+
+    primera = evaluators.evaluar_tareas("texto", "perfil", tareas, interrumpido, apartado=apartado)
+    assert primera[2] is None
+
+    evaluados.clear()
+    segunda = evaluators.evaluar_tareas("texto", "perfil", tareas, interrumpido, apartado=apartado)
+    assert evaluados == ["Indicador 2"]
+    assert [r and r["indicador"] for r in segunda] == ["Indicador 0", "Indicador 1", None, "Indicador 3"]
+
+
+def test_el_estado_de_una_evaluacion_sigue_a_su_resultado():
+    id_evaluacion = uuid.uuid4().hex
+    apartado = _apartado()
+    puntos_control.registrar(id_evaluacion, apartado, {"contenido": "texto"})
+    puntos_control.guardar(apartado, "a", {"calificacion": 2})
+
+    estado = puntos_control.consultar(id_evaluacion)
+    assert estado["estado"] == "en_curso" and estado["indicadores_guardados"] == 1
+    assert estado["datos"] == {"contenido": "texto"}
+
+    puntos_control.terminar(id_evaluacion, {"cancelado": True})
+    assert puntos_control.consultar(id_evaluacion)["estado"] == "incompleta"
+    puntos_control.terminar(id_evaluacion, {"evaluaciones": []})
+    assert puntos_control.consultar(id_evaluacion)["estado"] == "terminada"
+    assert puntos_control.consultar("no-existe") is None
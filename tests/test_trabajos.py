@@ -0,0 +1,68 @@
+import time
+from src import trabajos
+
+
+def _esperar(id_trabajo):
+    for _ in range(100):
+        trabajo = trabajos.consultar(id_trabajo)
+        if trabajo["estado"] in trabajos.ESTADOS_FINALES:
+            return trabajo
+        time.sleep(0.02)
+    raise AssertionError("el trabajo no terminó")
+
+
+def test_guarda_los_eventos_en_orden_y_sin_trozos_de_texto():
+    def funcion(n, al_evento=None, cancelacion=None):
+        for i in range(n):
+            al_evento({"evento": "indicador", "i": i})
+            al_evento({"evento": "texto", "texto": "..."})
+        return {"total": n}
+
+    trabajo = _esperar(trabajos.encolar("prueba", funcion, n=50))
+    assert trabajo["estado"] == "completado"
+    assert trabajo["resultado"] == {"total": 50}
+    assert [e["i"] for e in trabajo["parcial"]] == list(range(50))
+
+
+def test_un_reintento_empieza_con_los_eventos_vacios(monkeypatch):
+    monkeypatch.setattr(trabajos.config, "TRABAJOS_REINTENTOS", 1)
+    monkeypatch.setattr(trabajos.config, "TRABAJOS_ESPERA_REINTENTO", 0.01)
+    intentos = []
+
+    def funcion(al_evento=None, cancelacion=None):
+        intentos.append(1)
+        al_evento({"evento": "indicador", "intento": len(intentos)})
+        if len(intentos) == 1:
+            raise RuntimeError("fallo transitorio")
+        return {}
+
+    trabajo = _esperar(trabajos.encolar("prueba", funcion))
+    assert trabajo["estado"] == "completado" and trabajo["intentos"] == 2
+    assert trabajo["parcial"] == [{"evento": "indicador", "intento": 2}]
+
+
+def test_reutiliza_el_id_pedido():
+    id_trabajo = trabajos.encolar("prueba", lambda al_evento=None, cancelacion=None: {}, id_trabajo="ev-prueba")
+    assert id_trabajo == "ev-prueba"
+    assert _esperar("ev-prueba")["estado"] == "completado"
+
+
+def test_trabajos_de_un_worker_muerto_pasan_a_fallido(monkeypatch):
+    ahora = time.time()
+    conn = trabajos._db()
+    conn.execute("INSERT INTO trabajos (id, tipo, estado, worker, creado, actualizado) "
+                 "VALUES ('huerfano', 'prueba', 'en_curso', 999999999, ?, ?)", (ahora, ahora))
+    monkeypatch.setattr(trabajos, "_vivo", lambda pid: pid != 999999999)
+    assert trabajos.recuperar_huerfanos() >= 1
+    trabajo = trabajos.consultar("huerfano")
+    assert trabajo["estado"] == "fallido" and trabajo["error"]
+
+
+def test_los_trabajos_terminados_caducan_con_sus_eventos(monkeypatch):
+    id_trabajo = trabajos.encolar("prueba", lambda al_evento=None, cancelacion=None: al_evento({"evento": "x"}) or {})
+    assert _esperar(id_trabajo)["parcial"] == [{"evento": "x"}]
+    monkeypatch.setattr(trabajos.config, "TRABAJOS_RETENCION_SEGUNDOS", -1)
+    trabajos._purgar(trabajos._db())
+    assert trabajos.consultar(id_trabajo) is None
+    assert trabajos._db().execute("SELECT COUNT(*) FROM trabajo_eventos WHERE id_trabajo = ?",
+                                  (id_trabajo,)).fetchone()[0] == 0